@@ -8,13 +8,12 @@ import socketpool
 import time
 import wifi
 from secrets import secrets
+import solar
 
 lat = secrets['lat']
 long = secrets['long']
 
 # URLs to fetch from
-SUNSET_URL = "http://api.sunrise-sunset.org/json?lat=%f&lng=%f&formatted=0"\
-    % (lat, long)
 LIGHTS_ON_URL = "http://192.168.1.54/control?cmd=GPIO,12,1"
 LIGHTS_OFF_URL = "http://192.168.1.54/control?cmd=GPIO,12,0"
 
@@ -37,16 +36,10 @@ seconds = rtc.RTC().datetime.tm_sec
 time.sleep(60-seconds)
 
 def get_sunset_time():
-    """Get time of today's sunset. return (H, M, S)"""
-    response = requests.get(SUNSET_URL)
-    data = response.json()
-    utc_sunset_str = data['results']['sunset']
-    date_str, time_str = utc_sunset_str.split('T')
-    utc_hr_str, m_str, s_str, *rest = time_str.split(':')
-    H = int(utc_hr_str) - 5
-    M = int(m_str)
-    S = int(s_str.split('+')[0])
-    return (H, M, S)
+    """Get (local) time of today's sunset, computed offline. return (H, M, S)"""
+    now = rtc.RTC().datetime
+    seconds = solar.sunset(now.tm_year, now.tm_mon, now.tm_mday, lat, long)
+    return solar.hms(seconds + secrets["tz_offset"] * 3600)
 
 def turn_lights_on():
     """Turn on carriage lights"""
@@ -74,4 +74,7 @@ while True:
             em.value = False
         print("Electro-magnet is on: ", em.value)
 
+    # Polled: a short pulse can be missed, a ragged one counted twice.
+    # CircuitPython has no pin irq; countio.Counter(board.D2, edge=countio.Edge.FALL)
+    # would count the edges in the background (see the MicroPython clock's ticks.py)
     time.sleep(0.001)  # debounce delay
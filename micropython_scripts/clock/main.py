@@ -3,6 +3,13 @@ MicroPython (on Pico) speed regulator for grandfather clock
 Nominal pendulum tick rate is 66 ticks/min.
 
 * includes a webserver to publish current status and error log
+  (size-capped and rotated, /err?gen=1 or sum for older entries)
+* /api/data.json and /api/data.csv publish the last MAXLEN batches
+  with an ETag, answering 304 Not Modified if nothing is new
+* /stats publishes statistics of the swing periods: mean, sd,
+  histogram and Allan deviation (see swingstats.py)
+* /ticks.bin?since=n streams every swing's period from swing n on,
+  2 bytes each, from a log of the last day and a half (see ticklog.py)
 * multiple file OTA updates on power-up
 
 An IR sensor is mounted to detect pendulum movement past BDC.
@@ -18,49 +25,64 @@ When the electro-magnet (positioned with a 1/4 inch gap) is ON,
 the clock runs approximately 8 sec/hour fast.
 
 At power-up, connect to WiFi and check for OTA updates, then set time
-(h:m:s) to UTC. When s reaches TARGET_SECONDS, start main loop.
-In the loop, count the ticks of the pendulum. When the count reaches
-66 ticks, check the time again. If s > TARGET_SECONDS, the
-electro-magnet is turned on, otherwise it remains off.
-
-In normal operation, the clock ticks merrily along, with s staying at
-TARGET_SECONDS, occasionally changing to TARGET_SECONDS + 1
-(every 3 or 4 cycles).
+(h:m:s) to UTC, and take an NTP sample into a microsecond reference
+(ticks_us, kept in step with NTP hourly). Then start main loop.
+In the loop, take the ticks of the pendulum (captured by a pin
+interrupt, with a microsecond timestamp each). The phase error of each
+tick (against ideal ticks lined up with second TARGET_SECONDS of every
+minute) goes to a PI loop that sets the electro-magnet for the next
+swing (see regulator.py). Every 66 ticks, the error and the share of
+swings with the electro-magnet on are published.
+
+In normal operation, the clock ticks merrily along within tens of
+milliseconds of UTC, the electro-magnet on for about one swing in five.
 """
 
 import gc
+import json
 from  machine import Pin
 import network
-from ntptime import settime
 import time
-import urequests
 from secrets import secrets
 import uasyncio as asyncio
 from ota import OTAUpdater
+from webserve import (send_page, send_body, send_not_modified, parse_request,
+                      read_headers, response_header, etag)
+from rotate import append_line, generation
+from ticks import TickCapture
+from regulator import Reference, Regulator, rtc_edge
+import sntp
+from swingstats import SwingStats
+from ticklog import TickLog
 
 # Global values
 gc_text = ''
 datatext = ''
+history = []  # most recent batches as (batch number, 'h:m:s', em duty, error ms)
+MAXLEN = 50  # number of batches kept in history
+batch_count = 0  # incremented with every batch (the data version)
 TARGET_SECONDS = 1
+SYNC_INTERVAL = 3600  # seconds between NTP samples for the reference
 ERRORLOGFILENAME = 'errorlog.txt'
 ssid = secrets['ssid']
 password = secrets['wifi_password']
 
-html = """<!DOCTYPE html>
+html_head = """<!DOCTYPE html>
 <html>
     <head> <title>Clock Regulator</title> </head>
     <body> <h1>Clock Regulator</h1>
         <h3>%s</h3>
-        <pre>%s</pre>
-    </body>
-</html>
-"""
+        <pre>"""
 
 # setup pins for LED, Electro_magnet, Pendulum_sensor
 led = Pin("LED", Pin.OUT, value=0)  # LED
 em = Pin(3, Pin.OUT, value=0)  # Electro_magnet
 sensor = Pin(4, Pin.IN, Pin.PULL_UP)  # Pendulum_sensor
 
+reference = Reference()  # UTC of ticks_us() timestamps
+stats = SwingStats()  # of every swing's period
+ticklog = TickLog()  # every swing's period, on flash
+
 wlan = network.WLAN(network.STA_IF)
 
 def connect():
@@ -86,13 +108,23 @@ def connect():
         print('ip = ' + status[0])
         return True
 
-def sync_to_ntp():
-    """Sync Pico clock to UTC time."""
+async def sync_to_ntp():
+    """Sync Pico clock to UTC time (to the ms, see sntp.py) and take the
+    NTP sample into the reference (the RTC, if there is none yet)."""
     try:
-        settime()
+        sample = await sntp.settime()
+        reference.sync(sample.t, sample.secs, sample.us)
     except OSError as e:
-        with open(ERRORLOGFILENAME, 'a') as file:
-            file.write(f"{timestamp()} OSError while trying to set time: {str(e)}\n")
+        append_line(ERRORLOGFILENAME,
+                    f"{timestamp()} OSError while trying to set time: {str(e)}\n")
+        if not reference.ready:
+            reference.sync(*rtc_edge())
+
+async def discipline():
+    """Keep the reference in step with NTP (run as a task)."""
+    while True:
+        await asyncio.sleep(SYNC_INTERVAL)
+        await sync_to_ntp()
 
 def timestamp():
     Dyear, Dmonth, Dday, Dhour, Dmin, Dsec, *rest = time.localtime()
@@ -106,37 +138,60 @@ def get_curr_time():
     s = current_time[5]  # curr second
     return h, m, s
 
+async def send_api(writer, path, if_none_match):
+    """Send the batch history as /api/data.json or /api/data.csv.
+
+    Either one gets a 304 if the client already has the latest batch.
+    """
+    tag = etag(batch_count)
+    if path not in ('/api/data.json', '/api/data.csv'):
+        writer.write('HTTP/1.0 404 Not Found\r\n\r\n')
+        await writer.drain()
+    elif if_none_match == tag:
+        await send_not_modified(writer, tag)
+    elif path == '/api/data.json':
+        await send_body(writer, json.dumps(history), 'application/json', tag)
+    else:
+        writer.write(response_header('text/csv', tag))
+        writer.write('batch,time,em,err_ms\n')
+        for n, hms, duty, err_ms in history:
+            writer.write(f'{n},{hms},{duty},{err_ms}\n')
+        await writer.drain()
+
 async def serve_client(reader, writer):
     try:
         print("Client connected")
         request_line = await reader.readline()
         print("Request:", request_line)
-        # We are not interested in HTTP request headers, skip them
-        while await reader.readline() != b"\r\n":
-            pass
-
-        if '/err' in request_line.split()[1]:
-            with open(ERRORLOGFILENAME) as file:
-                text = file.read()
-            heading = "ERRORS"
+        # Of the HTTP request headers, only If-None-Match is of interest
+        headers = await read_headers(reader, b'if-none-match')
+        path, params = parse_request(request_line)
+
+        if path.startswith('/api/'):
+            await send_api(writer, path, headers.get(b'if-none-match'))
+        elif path.startswith('/err'):
+            # Stream the file rather than reading it all into memory
+            filename = generation(ERRORLOGFILENAME, params.get('gen', ''))
+            await send_page(writer, html_head % "ERRORS", filename)
+        elif path == '/ticks.bin':
+            since = params.get('since', '0')
+            writer.write(response_header('application/octet-stream'))
+            await ticklog.send(writer, int(since) if since.isdigit() else 0)
+        elif path == '/stats':
+            await send_page(writer, html_head % "SWING STATISTICS", None,
+                            stats.report())
         else:
             text = datatext
             text += gc_text
-            heading = "Append '/err' to URL to see error log"
-
-        response = html % (heading, text)
-        writer.write('HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n')
-        writer.write(response)
-
-        await writer.drain()
+            heading = "Append '/err' to URL to see error log, '/stats' for statistics"
+            await send_page(writer, html_head % heading, None, text)
         await writer.wait_closed()
         print("Client disconnected")
     except Exception as e:
-        with open(ERRORLOGFILENAME, 'a') as file:
-            file.write(f"{timestamp()} serve_client error: {str(e)}\n")
+        append_line(ERRORLOGFILENAME, f"{timestamp()} serve_client error: {str(e)}\n")
 
 async def main():
-    global datatext, gc_text
+    global datatext, gc_text, batch_count
     print('Connecting to Network...')
     connect()
 
@@ -146,39 +201,47 @@ async def main():
     path = "micropython_scripts/clock"
     branch = "main"
     firmware_url = f"https://github.com/dblanding/{repo_name}/{branch}/{path}/"
-    ota_updater = OTAUpdater(firmware_url, "main.py", "ota.py", "errorlog.txt")
+    ota_updater = OTAUpdater(firmware_url, "main.py", "ota.py", "webserve.py",
+                             "rotate.py", "ticks.py", "regulator.py",
+                             "swingstats.py", "ticklog.py", "sntp.py",
+                             "errorlog.txt")
     ota_updater.download_and_install_update_if_available()
 
     # Sync time to UTC
     print('setting time to UTC...')
-    sync_to_ntp()
-    time.sleep(1)
-
-    _, _, s = get_curr_time()
+    await sync_to_ntp()
+    asyncio.create_task(discipline())
 
     print('Setting up webserver...')
     asyncio.create_task(asyncio.start_server(serve_client, "0.0.0.0", 80))
 
-    # Wait until s == TARGET_SECONDS
-    while s != TARGET_SECONDS:
-        h, m, s = get_curr_time()
-        time.sleep(1)
-
-    s_prev = s
+    # Count ticks from here on
+    ticks = TickCapture(sensor)
+    regulator = Regulator(reference, TARGET_SECONDS)
+    s_prev = None  # s at the end of the previous batch
     count = 0  # Accumulated number of elapsed 'ticks'
-    snsr_high = False  # status previous time through loop
+    on_count = 0  # swings of the batch with the electro-magnet on
+    t_batch = None  # ticks_us of the tick that began the batch
+    t_prev = None  # ticks_us of the previous tick
 
     while True:
-        # Turn led 'on' when sensor.value goes low, 'off' when high
-        if not sensor.value() and snsr_high:  # leading edge
-            snsr_high = False
-            led.on()
-            count += 1
-        elif sensor.value() and not snsr_high:  # trailing edge
-            snsr_high = True
-            led.off()
+        t = await ticks.next()
+        led.toggle()
+        count += 1
 
         try:
+            # Electro-magnet on or off for the next swing
+            on = regulator.on  # (during the swing just ended)
+            em.value(regulator.update(t))
+            on_count += regulator.on
+
+            # Period of the swing just ended, to the statistics and the log
+            if t_prev is not None:
+                period = time.ticks_diff(t, t_prev)
+                stats.add(period, on)
+                ticklog.append(period, on, reference.secs, reference.us)
+            t_prev = t
+
             # Once every 66 ticks
             if count == 66:
                 h, m, s = get_curr_time()
@@ -186,32 +249,45 @@ async def main():
                 # reset counter
                 count = 0
 
+                # Duration of the batch (from tick to tick, to the us)
+                if t_batch is None:
+                    batch_text = ''
+                else:
+                    batch_text = f", 66 ticks in {time.ticks_diff(t, t_batch) / 1000000:.4f} s"
+                t_batch = t
+
                 # Report error if value of seconds "Jumps" 
-                if abs(s - s_prev) > 1:
+                # (batches don't end on a set second: compare mod 60)
+                if s_prev is not None and abs((s - s_prev + 30) % 60 - 30) > 1:
                     errortext = f"{timestamp()} Sec jumped from {s_prev} to {s}\n"
-                    with open(ERRORLOGFILENAME, 'a') as file:
-                        file.write(errortext)
+                    append_line(ERRORLOGFILENAME, errortext)
                 
-                # Decide if the electro-magnet should be energized
-                if s > TARGET_SECONDS:
-                    em.on()
-                    datatext = f"{h}:{m}:{s} electro-magnet ON\n"
-                else:
-                    em.off()
-                    datatext = f"{h}:{m}:{s} electro-magnet OFF\n"
+                # Phase error of the latest tick, electro-magnet duty
+                err_ms = round(regulator.err_us / 1000, 1)
+                duty = round(on_count / 66, 2)
+                on_count = 0
+                datatext = (f"{h}:{m}:{s} error {err_ms} ms, "
+                            f"electro-magnet duty {duty}{batch_text}\n")
+
+                # Keep a short history for the /api endpoints
+                batch_count += 1
+                history.append((batch_count, f"{h}:{m:02}:{s:02}", duty, err_ms))
+                if len(history) > MAXLEN:
+                    history.pop(0)
 
                 s_prev = s
                 
                 # collect garbage hourly
                 if m == 0:
                     gc_text = 'free: ' + str(gc.mem_free()) + '\n'
+                    gc_text += (f'ticks: {ticks.head} captured, {ticks.rejected} '
+                                f'rejected, {ticks.lost} lost, {regulator.slips} slips\n')
+                    gc_text += (f'reference: {reference.ppm:.2f} ppm, last step '
+                                f'{reference.step_us} us, {reference.syncs} syncs\n')
                     gc.collect()
 
         except Exception as e:
-            with open(ERRORLOGFILENAME, 'a') as file:
-                file.write(f"{timestamp()} main loop error: {str(e)}\n")
-
-        await asyncio.sleep(0.005)  # debounce delay
+            append_line(ERRORLOGFILENAME, f"{timestamp()} main loop error: {str(e)}\n")
 
 try:
     asyncio.run(main())
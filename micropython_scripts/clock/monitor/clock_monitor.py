@@ -1,22 +1,69 @@
 import datetime
 import requests
+import struct
 import time
 
-url = "http://192.168.1.62"
+url = "http://192.168.1.62/api/data.csv"
 filename = "clock_data.txt"
+ticks_url = "http://192.168.1.62/ticks.bin"
+ticks_filename = "ticks.bin"  # blocks as sent, see ../ticklog.py
+TICK_HEADER_FMT = '<2sHHIIII'  # magic, count, size, seq, first swing, secs, us
+next_swing = 0  # number of the first swing not yet saved
 count = 1
+etag = None  # ETag of the last response, sent back as If-None-Match
+last_batch = 0  # number of the last batch saved to file
 
 def get_data():
-    response = requests.get(url)
-    lines = response.text.split('\n')
-    data = [line for line in lines
-            if len(line) and line[0].isnumeric()]
+    """Save batches not yet seen. Return False if nothing has changed."""
+    global etag, last_batch
+    headers = {'If-None-Match': etag} if etag else {}
+    response = requests.get(url, headers=headers)
+    if response.status_code == 304:
+        return False
+    new_etag = response.headers.get('ETag', '')
+    # The boot id (first part of the ETag) changes when the clock restarts
+    # and starts counting batches from 1 again
+    if etag and new_etag.split('-')[0] != etag.split('-')[0]:
+        last_batch = 0
+    etag = new_etag
+
+    rows = response.text.split('\n')[1:]  # skip the csv header line
     with open(filename, 'a') as f:
         f.write("-------\n")
-        for line in data:
-            f.write(line + '\n')
+        for row in rows:
+            if not row:
+                continue
+            batch, hms, em, err_ms = row.split(',')
+            if int(batch) <= last_batch:
+                continue
+            last_batch = int(batch)
+            f.write(f"{hms} (UTC) error {err_ms} ms, EM duty {em}\n")
+    return True
+
+def get_ticks():
+    """Append the blocks holding swings not yet saved to ticks_filename.
+
+    A block that was still being filled comes again next time, longer:
+    of the blocks with the same sequence number, the last one is whole.
+    """
+    global next_swing
+    response = requests.get(ticks_url, params={'since': next_swing})
+    data = response.content
+    size = struct.calcsize(TICK_HEADER_FMT)
+    pos = 0
+    while pos + size <= len(data):
+        magic, count, nbytes, seq, first, secs, us = struct.unpack_from(
+            TICK_HEADER_FMT, data, pos)
+        if magic != b'TK':
+            break
+        pos += size + nbytes
+        next_swing = max(next_swing, first + count)
+    with open(ticks_filename, 'ab') as f:
+        f.write(data[:pos])
+    return pos
 
 get_data()
+get_ticks()
 
 while count:
     if not count % 5:
@@ -26,11 +73,13 @@ while count:
         count = 0
         start = time.time()
         print(f"Saving a batch")
-        get_data()
+        changed = get_data()
+        nbytes = get_ticks()
         end = time.time()
         delta = end - start
-        print(f"get_data() took {delta:.2f} seconds")
+        print(f"get_data() took {delta:.2f} seconds (changed: {changed}, "
+              f"{nbytes} bytes of ticks)")
+
 
-        
     count += 1
     time.sleep(60)
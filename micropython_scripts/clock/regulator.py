@@ -0,0 +1,205 @@
+"""
+Phase-locked regulation of the pendulum against UTC.
+
+The old regulator read whole seconds from the RTC after every 66 ticks
+and ran the electro-magnet for the next batch if s > TARGET_SECONDS:
+bang-bang, with a sawtooth of about a second. Here every tick is timed
+(ticks_us, see ticks.py) against a microsecond reference, and a PI loop
+sets the magnet's duty, applied swing by swing.
+
+Reference: ticks_us() runs from the crystal, so its rate is off by some
+ppm and it wraps every 18 minutes. Reference keeps an anchor (a ticks_us
+value and the UTC it stands for) moved up to each tick it converts, and
+is disciplined by NTP samples (see sntp.py). The first LOCK_SYNCS
+samples step the anchor to the measured UTC and trim the ppm rate by
+part of the error found, to lock on quickly. After that the few ms of
+network noise in a sample are more than the reference drifts in an hour
+(with its rate trimmed), so a phase-locked loop takes PHASE_GAIN of
+each error into the anchor and FREQ_GAIN of it (per second since the
+last sample) into the rate: the noise is averaged over several samples
+instead of being stepped into the reference (and so into the clock)
+every hour.
+
+Phase error: 66 ticks a minute is exactly 11 ticks every 10 s, so the
+ideal ticks fall on a fixed grid of UTC times, 10/11 s apart, lined up
+with second TARGET_SECONDS of each minute. The error of a tick is its
+UTC (from the reference) minus its grid time; positive means the clock
+is behind. The first tick is counted as the nearest one on the grid;
+after that, a jump in the error of close to a whole number of ticks
+(within SLIP_MARGIN_US) is taken as missed (or extra) ticks and the
+count is corrected, not the clock. Any other error, however big, is a
+real phase error and is left to the loop.
+
+Control: with the magnet on, the clock gains about 10 s/h over running
+with it off (-2 s/h to +8 s/h), so duty d (the fraction of swings with
+the magnet on) changes the rate by GAIN * d. A PI law on the phase error
+(gains for a critically damped loop with TIME_CONSTANT) gives d, and a
+sigma-delta modulator turns d into on/off for each swing, so the average
+duty is exact. The integral term learns the duty that holds the rate
+(about 0.2, depending on temperature).
+
+    reference = Reference()
+    sample = await sntp.measure()
+    reference.sync(sample.t, sample.secs, sample.us)
+    regulator = Regulator(reference, TARGET_SECONDS)
+    while True:
+        t = await ticks.next()
+        em.value(regulator.update(t))
+"""
+
+import time
+
+MAX_STEP_US = 1000000  # a bigger NTP correction resets the rate, too
+FLL_GAIN = 0.5  # share of a measured rate error taken per NTP sample ...
+LOCK_SYNCS = 2  # ... for this many samples, then:
+PHASE_GAIN = 0.25  # share of the phase error taken per sample, and
+FREQ_GAIN = PHASE_GAIN ** 2 / 4  # of the rate error (critically damped)
+MAX_PPM = 500  # limit of the rate correction
+
+TICK_US = 10000000 / 11  # ideal time between ticks (66/min)
+SLIP_MARGIN_US = 100000  # of a whole tick, for a jump to count as a slip
+GAIN = 10 / 3600  # rate change (s/s) with the magnet on for every swing
+DUTY = 0.2  # starting duty: -2 s/h off, +8 s/h on -> 0 s/h
+TIME_CONSTANT = 300  # s, of the phase loop
+KP = 2 / (GAIN * TIME_CONSTANT)  # duty per s of phase error
+KI = 1 / (GAIN * TIME_CONSTANT ** 2)  # duty per s of error, per s
+
+
+def rtc_edge():
+    """Fallback for an NTP sample: (ticks_us, RTC seconds, 0) at the start
+    of an RTC second, found by polling (blocks up to a second)."""
+    t = time.time()
+    while time.time() == t:
+        time.sleep_ms(1)
+    return time.ticks_us(), time.time(), 0
+
+
+class Reference:
+    """UTC (to the microsecond) of ticks_us() values, disciplined by NTP.
+
+    at(t) must be called at least every few minutes (ticks_diff() only
+    spans about 9), which the regulator does with every tick.
+    """
+
+    def __init__(self):
+        self.ticks = None  # anchor: a ticks_us() value ...
+        self.secs = 0  # ... and the UTC it stands for (seconds ...
+        self.us = 0  # ... and microseconds)
+        self.ppm = 0.0  # rate of ticks_us() vs UTC (+ runs fast)
+        self.residue = 0.0  # fraction of a us carried between anchors
+        self.last_sync = None  # UTC seconds of the last NTP sample
+        self.syncs = 0
+        self.step_us = 0  # phase error found by the last sample
+        self.acquired = 0  # samples taken since the reference was (re)set
+
+    @property
+    def ready(self):
+        return self.ticks is not None
+
+    def at(self, t):
+        """UTC (seconds, microseconds) at ticks_us() value t; moves the
+        anchor up to t (t should not be older than the anchor)."""
+        elapsed = time.ticks_diff(t, self.ticks)
+        exact = elapsed - elapsed * self.ppm / 1000000 + self.residue
+        whole = int(exact)
+        self.residue = exact - whole
+        self.us += whole
+        self.secs += self.us // 1000000
+        self.us %= 1000000
+        self.ticks = t
+        return self.secs, self.us
+
+    def sync(self, t, secs, us):
+        """Take an NTP sample: UTC secs + us was the time at ticks_us t."""
+        if self.ticks is None:
+            self.ticks, self.secs, self.us = t, secs, us
+            self.last_sync = secs
+            self.syncs += 1
+            self.acquired = 1
+            return
+        now_secs, now_us = self.at(t)
+        step = (secs - now_secs) * 1000000 + us - now_us
+        interval = secs - self.last_sync
+        if abs(step) > MAX_STEP_US:
+            self.ppm = 0.0  # (the time was set, not the rate found)
+            self.acquired = 0
+        if self.acquired < LOCK_SYNCS:
+            if self.acquired and interval > 0:
+                # UTC ran ahead of us by step over interval: ticks run slow
+                self._trim(FLL_GAIN * step / interval)
+            self.secs, self.us, self.residue = secs, us, 0.0
+            self.acquired += 1
+        else:
+            if interval > 0:
+                self._trim(FREQ_GAIN * step / interval)
+            self.us += int(PHASE_GAIN * step)
+            self.secs += self.us // 1000000
+            self.us %= 1000000
+        self.last_sync = secs
+        self.syncs += 1
+        self.step_us = step
+
+    def _trim(self, ppm):
+        self.ppm = max(-MAX_PPM, min(MAX_PPM, self.ppm - ppm))
+
+
+class Regulator:
+    """Magnet on or off for each swing, from the phase error of its tick."""
+
+    def __init__(self, reference, target_seconds=0):
+        self.reference = reference
+        self.target = target_seconds  # grid lined up with this second
+        self.cycle = None  # UTC seconds of the grid's current 10 s cycle
+        self.n = 0  # tick on the grid within the cycle
+        self.t_prev = None
+        self.err_us = 0  # phase error of the latest tick (+ clock behind)
+        self.integral = DUTY
+        self.duty = DUTY
+        self.sigma = 0.0  # sigma-delta accumulator
+        self.on = False
+        self.slips = 0  # missed or extra ticks corrected
+
+    def _start(self, secs, us):
+        # Nearest grid tick, by the position within the 10 s cycle
+        into = (secs - self.target) % 10 * 1000000 + us
+        self.cycle = secs - (secs - self.target) % 10
+        self.n = int(into / TICK_US + 0.5)
+
+    def _error(self, secs, us):
+        if self.n >= 11:
+            self.cycle += 10 * (self.n // 11)
+            self.n %= 11
+        grid_us = self.n * 10000000 // 11
+        return (secs - self.cycle) * 1000000 + us - grid_us
+
+    def update(self, t):
+        """Take the tick at ticks_us t; return True for magnet on."""
+        secs, us = self.reference.at(t)
+        if self.cycle is None:
+            self._start(secs, us)
+            self.t_prev = t
+        else:
+            self.n += 1
+        err = self._error(secs, us)
+        jump = err - self.err_us
+        skip = int(jump / TICK_US + (0.5 if jump > 0 else -0.5))
+        if skip and abs(jump - skip * TICK_US) < SLIP_MARGIN_US:
+            self.n += skip
+            self.slips += 1
+            err = self._error(secs, us)
+        self.err_us = err
+
+        dt = time.ticks_diff(t, self.t_prev) / 1000000
+        self.t_prev = t
+        e = err / 1000000
+        duty = self.integral + KP * e
+        # Integrate only while that doesn't push the duty further out of range
+        if 0 < duty < 1 or (duty >= 1 and e < 0) or (duty <= 0 and e > 0):
+            self.integral += KI * e * dt
+        self.duty = max(0.0, min(1.0, self.integral + KP * e))
+
+        self.sigma += self.duty
+        self.on = self.sigma >= 1
+        if self.on:
+            self.sigma -= 1
+        return self.on
@@ -0,0 +1,174 @@
+"""
+Running statistics of the pendulum's swing periods, kept on the Pico.
+
+Fed one period (us, tick to tick) per swing, with whether the magnet was
+on for it, SwingStats keeps, in a fixed amount of memory:
+
+* count, mean and standard deviation (Welford's method, which doesn't
+  lose precision in single-precision floats the way sum and sum of
+  squares do), for all swings and for magnet off / on separately: the
+  mean period with the magnet off is the pendulum's own rate, and how it
+  moves with the seasons shows its temperature sensitivity
+* a histogram of the period's deviation from nominal
+* the overlapping Allan deviation at tau = 1, 2, 4 ... swings, up to
+  more than a day: how steady the rate is over each averaging time
+
+Allan deviation: for averaging time tau = m swings, it compares the time
+taken by consecutive runs of m swings, sigma^2 = <(S2 - S1)^2> / 2tau^2.
+Keeping every period for a day of taus would take 100k floats. Instead
+the periods are summed into blocks that double in length from one level
+to the next (a decimating cascade), and each tau only keeps the last
+2 * OVERLAP block sums of its level, each block 1/OVERLAP of tau. Runs of
+m swings starting every m/OVERLAP swings are compared (overlapping), in
+O(log n) memory.
+
+    stats = SwingStats()
+    stats.add(period_us, magnet_on)
+    text = stats.report()
+"""
+
+import math
+from array import array
+
+TICK_US = 10000000 / 11  # nominal period (66 ticks/min)
+LEVELS = 18  # taus of 2^0 .. 2^17 swings (0.9 s .. 1.4 days)
+OVERLAP = 4  # runs compared per tau (starting every tau / OVERLAP)
+HIST_BIN_US = 250  # width of a histogram bin
+HIST_BINS = 40  # bins, centred on nominal (+ one below, one above)
+
+
+class Welford:
+    """Count, mean and variance of a stream of values."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def sd(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class Tau:
+    """Overlapping Allan variance for one averaging time (m swings)."""
+
+    def __init__(self, m, block):
+        self.m = m
+        self.block = block  # swings per block sum fed in
+        self.blocks = m // block  # blocks per run of m swings
+        self.ring = array('f', [0.0] * (2 * self.blocks))
+        self.pos = 0
+        self.filled = 0
+        self.n = 0  # runs compared
+        self.mean_sq = 0.0  # mean of (S2 - S1)^2, us^2
+
+    def add(self, block_sum):
+        ring = self.ring
+        ring[self.pos] = block_sum
+        self.pos = (self.pos + 1) % len(ring)
+        if self.filled < len(ring):
+            self.filled += 1
+            if self.filled < len(ring):
+                return
+        # Newest run (S2) less the run before it (S1)
+        diff = 0.0
+        for i in range(self.blocks):
+            diff += ring[(self.pos - 1 - i) % len(ring)]
+            diff -= ring[(self.pos - 1 - self.blocks - i) % len(ring)]
+        self.n += 1
+        self.mean_sq += (diff * diff - self.mean_sq) / self.n
+
+    def adev(self, period_us):
+        """Allan deviation (fractional), given the mean period."""
+        if not self.n:
+            return None
+        tau = self.m * period_us
+        return math.sqrt(self.mean_sq / 2) / tau
+
+
+class SwingStats:
+    """Statistics of swing periods, in O(log n) memory."""
+
+    def __init__(self, levels=LEVELS):
+        self.all = Welford()
+        self.off = Welford()
+        self.on = Welford()
+        self.hist = array('L', [0] * (HIST_BINS + 2))  # [0]: below, [-1]: above
+        self.taus = []
+        # Blocks of 1 swing feed the shortest taus; beyond m = OVERLAP,
+        # tau m takes blocks of m / OVERLAP swings
+        for k in range(levels):
+            m = 1 << k
+            self.taus.append(Tau(m, max(1, m // OVERLAP)))
+        self.partial = []  # per block length 2^j: [sum, blocks in it]
+        for j in range(levels):
+            self.partial.append([0.0, 0])
+
+    def add(self, period_us, magnet_on=False):
+        """Take the period of one swing (us)."""
+        # Deviations from nominal: small numbers keep their precision
+        dev = period_us - TICK_US
+        self.all.add(dev)
+        (self.on if magnet_on else self.off).add(dev)
+        i = int(math.floor(dev / HIST_BIN_US)) + HIST_BINS // 2 + 1
+        self.hist[max(0, min(len(self.hist) - 1, i))] += 1
+        self._cascade(0, dev)
+
+    def _cascade(self, j, block_sum):
+        # A block of 2^j swings is complete: feed the taus using that
+        # length, and pair it up into a block of 2^(j+1)
+        while True:
+            for tau in self.taus:
+                if tau.block == 1 << j:
+                    tau.add(block_sum)
+            if j + 1 >= len(self.partial):
+                return
+            partial = self.partial[j + 1]
+            partial[0] += block_sum
+            partial[1] += 1
+            if partial[1] < 2:
+                return
+            block_sum = partial[0]
+            partial[0], partial[1] = 0.0, 0
+            j += 1
+
+    def report(self):
+        """The statistics, as lines of text."""
+        lines = []
+        for name, w in (('all swings', self.all), ('magnet off', self.off),
+                        ('magnet on', self.on)):
+            lines.append(f"{name}: {w.n}, mean period {TICK_US + w.mean:.1f} us, "
+                         f"sd {w.sd:.1f} us\n")
+
+        lines.append(f"\nperiod - {TICK_US:.0f} us, bins of {HIST_BIN_US} us:\n")
+        used = [i for i, n in enumerate(self.hist) if n]
+        if used:
+            top = max(self.hist)
+            for i in range(used[0], used[-1] + 1):
+                low = (i - HIST_BINS // 2 - 1) * HIST_BIN_US
+                if i == 0:
+                    label = f"< {low + HIST_BIN_US}"
+                elif i == len(self.hist) - 1:
+                    label = f">= {low}"
+                else:
+                    label = f"{low}"
+                n = self.hist[i]
+                lines.append(f"{label:>9} {n:8} {'#' * (40 * n // top)}\n")
+
+        lines.append("\nAllan deviation (overlapping):\n"
+                     "    tau (s)       adev    s/day   runs\n")
+        period = TICK_US + self.all.mean
+        for tau in self.taus:
+            adev = tau.adev(period)
+            if adev is None:
+                break
+            lines.append(f"{tau.m * period / 1000000:11.1f} {adev:10.2e} "
+                         f"{adev * 86400:8.3f} {tau.n:6}\n")
+        return ''.join(lines)
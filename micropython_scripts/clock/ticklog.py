@@ -0,0 +1,191 @@
+"""
+Every swing of the pendulum, logged compactly in a fixed-size file.
+
+Each swing's period (us, tick to tick) is stored as its deviation from
+nominal (909091 us), zigzag-encoded so small negative numbers stay
+small, with the magnet's state for the swing as the lowest bit, in a
+varint: 7 bits per byte, the high bit set on all bytes but the last.
+Deviations within +/- 4 ms (all of them, in normal running) take 2
+bytes, against 9 for a line of text like '909595,0'.
+
+The file is a ring of BLOCKS blocks of BLOCK_SIZE bytes, preallocated
+(zeros) like ring.py in the temperature project, so it never grows.
+Each block starts with a header, which makes it readable on its own:
+
+    magic b'TK', count of swings, size of the varints (bytes),
+    block sequence number, number of its first swing (counted across
+    restarts), UTC (seconds, us) of the tick ending its first swing
+    (0 if unknown)
+
+The block being filled is kept in RAM and written over its slot every
+FLUSH_SWINGS swings (and before a download); a restart starts a new
+block, so the tick times in one block are always contiguous. At 2 bytes
+a swing a block holds about half an hour and the default ring (256 KB)
+about a day and a half.
+
+send() streams the blocks holding swings from number 'since' on, oldest
+first, for /ticks.bin?since=; decode() turns them back into swings.
+"""
+
+import struct
+
+TICKLOGFILENAME = 'ticks.bin'
+NOMINAL_US = 909091  # 66 ticks/min
+BLOCK_SIZE = 4096
+BLOCKS = 64
+FLUSH_SWINGS = 330  # about 5 minutes
+MAGIC = b'TK'
+HEADER_FMT = '<2sHHIIII'
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+CHUNK_SIZE = 512
+
+
+def encode(period_us, magnet_on, buf, pos):
+    """Write the varint of one swing into buf at pos, return the new pos."""
+    dev = period_us - NOMINAL_US
+    value = (dev << 1 if dev >= 0 else (-dev << 1) - 1) << 1 | (1 if magnet_on else 0)
+    while value > 0x7F:
+        buf[pos] = value & 0x7F | 0x80
+        value >>= 7
+        pos += 1
+    buf[pos] = value
+    return pos + 1
+
+
+def decode(data):
+    """Swings in blocks as sent by send(): list of
+    (swing number, period us, magnet on, block's UTC secs, us)."""
+    swings = []
+    pos = 0
+    while pos + HEADER_SIZE <= len(data):
+        magic, count, size, seq, first, secs, us = struct.unpack_from(
+            HEADER_FMT, data, pos)
+        pos += HEADER_SIZE
+        if magic != MAGIC:
+            break
+        end = pos + size
+        n = first
+        while pos < end:
+            value = shift = 0
+            while True:
+                byte = data[pos]
+                pos += 1
+                value |= (byte & 0x7F) << shift
+                shift += 7
+                if not byte & 0x80:
+                    break
+            zz = value >> 1
+            dev = zz >> 1 if not zz & 1 else -((zz + 1) >> 1)
+            swings.append((n, NOMINAL_US + dev, bool(value & 1), secs, us))
+            n += 1
+    return swings
+
+
+class TickLog:
+    """Ring of blocks of varint-packed swing periods in filename."""
+
+    def __init__(self, filename=TICKLOGFILENAME, blocks=BLOCKS,
+                 block_size=BLOCK_SIZE):
+        self.filename = filename
+        self.blocks = blocks
+        self.block_size = block_size
+        self.buf = bytearray(block_size)  # the block being filled
+        self.mv = memoryview(self.buf)
+        self._hdr = bytearray(HEADER_SIZE)
+        self._chunk = bytearray(CHUNK_SIZE)  # for send()
+        self.file = self._open()
+        # Carry on from the newest block in the file
+        self.seq = 0
+        self.swing = 0  # number of the next swing
+        for seq, slot, first, count in self._headers():
+            if seq >= self.seq:
+                self.seq = seq + 1
+                self.swing = first + count
+        self._new_block(0, 0)
+
+    def _open(self):
+        """Open the ring file, creating (preallocating) it if needed."""
+        size = self.blocks * self.block_size
+        try:
+            f = open(self.filename, 'r+b')
+            if f.seek(0, 2) == size:
+                return f
+            f.close()  # (size changed: start over)
+        except OSError:
+            pass
+        zeros = bytes(CHUNK_SIZE)
+        with open(self.filename, 'wb') as f:
+            for _ in range(size // CHUNK_SIZE):
+                f.write(zeros)
+        return open(self.filename, 'r+b')
+
+    def _headers(self):
+        """(seq, slot, first swing, count) of the blocks in the file."""
+        found = []
+        for slot in range(self.blocks):
+            self.file.seek(slot * self.block_size)
+            self.file.readinto(self._hdr)
+            magic, count, size, seq, first, secs, us = struct.unpack(
+                HEADER_FMT, self._hdr)
+            if magic == MAGIC:
+                found.append((seq, slot, first, count))
+        return found
+
+    def _new_block(self, secs, us):
+        self.slot = self.seq % self.blocks
+        self.first = self.swing
+        self.count = 0
+        self.pos = HEADER_SIZE
+        self.secs = secs
+        self.us = us
+        self.dirty = False
+
+    def append(self, period_us, magnet_on=False, secs=0, us=0):
+        """Log one swing; secs, us: UTC of the tick that ended it."""
+        if not self.count:
+            self.secs, self.us = secs, us
+        if self.pos + 5 > self.block_size:  # (a varint takes up to 5)
+            self.flush()
+            self.seq += 1
+            self._new_block(secs, us)
+        self.pos = encode(period_us, magnet_on, self.buf, self.pos)
+        self.count += 1
+        self.swing += 1
+        self.dirty = True
+        if not self.count % FLUSH_SWINGS:
+            self.flush()
+
+    def flush(self):
+        """Write the block being filled over its slot."""
+        if not self.dirty:
+            return
+        struct.pack_into(HEADER_FMT, self.buf, 0, MAGIC, self.count,
+                         self.pos - HEADER_SIZE, self.seq, self.first,
+                         self.secs, self.us)
+        self.file.seek(self.slot * self.block_size)
+        self.file.write(self.mv[:self.pos])
+        self.file.flush()
+        self.dirty = False
+
+    async def send(self, writer, since=0):
+        """Stream the blocks with swings numbered since or later."""
+        self.flush()
+        for seq, slot, first, count in sorted(self._headers()):
+            if first + count <= since:
+                continue
+            self.file.seek(slot * self.block_size)
+            self.file.readinto(self._hdr)
+            remaining = HEADER_SIZE + struct.unpack(HEADER_FMT, self._hdr)[2]
+            offset = slot * self.block_size
+            chunk = memoryview(self._chunk)
+            while remaining:
+                # (append() may flush, moving the file position, while
+                # this waits on the client: seek before every read)
+                self.file.seek(offset)
+                n = self.file.readinto(chunk[:min(remaining, CHUNK_SIZE)])
+                if not n:
+                    break
+                writer.write(chunk[:n])
+                await writer.drain()
+                offset += n
+                remaining -= n
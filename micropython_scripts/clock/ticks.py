@@ -0,0 +1,85 @@
+"""
+Pendulum ticks captured by a pin interrupt, timestamped in microseconds.
+
+Polling the sensor every few ms (between other tasks) can miss a short
+pulse, or count a ragged one twice, and only says that a tick happened,
+not when. Here the falling edge of the sensor fires an irq whose handler
+stores time.ticks_us() in a ring buffer (an array allocated up front, so
+the handler allocates nothing and can be a hard irq) and sets a flag.
+The consumer task sleeps on the flag and takes the timestamps in order:
+
+    ticks = TickCapture(sensor)
+    while True:
+        t = await ticks.next()
+        ...
+
+Edges closer together than min_interval_us after the last accepted one
+are taken for sensor chatter and dropped. If the consumer falls more than
+size ticks behind, the oldest are lost (and counted).
+"""
+
+import time
+from array import array
+from machine import Pin
+import micropython
+import uasyncio as asyncio
+
+SIZE = 64  # timestamps kept (about a minute of ticks)
+MIN_INTERVAL_US = 200000  # ticks are ~909000 us apart at 66/min
+
+micropython.alloc_emergency_exception_buf(100)
+
+
+class TickCapture:
+    """Ring of ticks_us() timestamps, filled by the sensor pin's irq."""
+
+    def __init__(self, pin, size=SIZE, min_interval_us=MIN_INTERVAL_US):
+        self.buf = array('L', [0] * size)
+        self.size = size
+        self.min_interval_us = min_interval_us
+        self.head = 0  # ticks captured (written by the irq only)
+        self.tail = 0  # ticks taken by the consumer
+        self.last = time.ticks_us()  # time of the last accepted edge
+        self.rejected = 0  # edges dropped as chatter
+        self.lost = 0  # ticks overwritten before they were taken
+        self.flag = asyncio.ThreadSafeFlag()
+        try:
+            pin.irq(self._irq, Pin.IRQ_FALLING, hard=True)
+        except TypeError:
+            pin.irq(self._irq, Pin.IRQ_FALLING)  # (port without hard irqs)
+
+    def _irq(self, pin):
+        # No allocation in here: small ints and a preallocated array only
+        t = time.ticks_us()
+        if time.ticks_diff(t, self.last) < self.min_interval_us:
+            self.rejected += 1
+            return
+        self.last = t
+        self.buf[self.head % self.size] = t
+        self.head += 1
+        self.flag.set()
+
+    def pending(self):
+        """Number of ticks captured but not yet taken."""
+        behind = self.head - self.tail
+        if behind > self.size:
+            self.lost += behind - self.size
+            self.tail += behind - self.size
+            behind = self.size
+        return behind
+
+    def take(self):
+        """Timestamp (ticks_us) of the oldest pending tick."""
+        t = self.buf[self.tail % self.size]
+        self.tail += 1
+        return t
+
+    async def next(self):
+        """Wait for the next tick, return its timestamp (ticks_us)."""
+        while not self.pending():
+            await self.flag.wait()
+        return self.take()
+
+    def clear(self):
+        """Forget the ticks captured so far."""
+        self.tail = self.head
@@ -0,0 +1,214 @@
+"""
+Small HTTP/1.1 client for uasyncio.
+
+urequests blocks: while a relay (or web service) is slow or unreachable,
+the whole event loop stops, web server included. Here a request is a
+coroutine on asyncio.open_connection(), so other tasks keep running
+while it waits, and every step (connect, headers, body) has a timeout.
+
+Connections are kept open for reuse (keep-alive), one per host and
+port, so switching the same relay again skips the TCP handshake. The
+body can be read whole or streamed in chunks:
+
+    client = Client()
+    response = await client.get('http://192.168.1.54/control?cmd=GPIO,12,1')
+    print(response.status, await response.text())
+
+    response = await client.get(url)
+    while True:
+        chunk = await response.read_chunk(512)
+        if not chunk:
+            break
+        ...
+"""
+
+import json
+import uasyncio as asyncio
+
+TIMEOUT = 5  # seconds allowed for each step of a request
+
+
+def split_url(url):
+    """Return (host, port, path, ssl) of an http(s) url."""
+    scheme, _, rest = url.partition('://')
+    host, slash, path = rest.partition('/')
+    ssl = scheme == 'https'
+    port = 443 if ssl else 80
+    if ':' in host:
+        host, port = host.split(':')
+        port = int(port)
+    return host, port, slash + path, ssl
+
+
+class Response:
+    """Status and headers of a response; the body is read on demand."""
+
+    def __init__(self, client, key, reader, writer):
+        self.client = client
+        self.key = key  # (host, port) of the connection
+        self.reader = reader
+        self.writer = writer
+        self.status = 0
+        self.reason = ''
+        self.headers = {}  # lowercase name -> value
+        self.mode = 'length'  # body: 'length', 'chunked' or 'close'
+        self.remaining = 0  # bytes left in the body (or chunk)
+        self.done = False  # all of the body has been read
+
+    async def _readline(self):
+        line = await asyncio.wait_for(self.reader.readline(), self.client.timeout)
+        if not line:
+            raise OSError('connection closed')
+        return line
+
+    async def _read_head(self):
+        status_line = (await self._readline()).decode()
+        _, status, self.reason = (status_line.strip().split(' ', 2) + [''])[:3]
+        self.status = int(status)
+        while True:
+            line = await self._readline()
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode().partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            self.mode = 'chunked'
+        elif 'content-length' in self.headers:
+            self.mode = 'length'
+            self.remaining = int(self.headers['content-length'])
+        else:
+            # Body runs to the end of the connection
+            self.mode = 'close'
+            self.headers['connection'] = 'close'
+
+    async def _read(self, n):
+        data = await asyncio.wait_for(self.reader.read(n), self.client.timeout)
+        if not data and self.mode != 'close':
+            raise OSError('connection closed')
+        return data
+
+    async def read_chunk(self, size=512):
+        """Return the next piece (up to size bytes) of the body, b'' at the end."""
+        if self.done:
+            return b''
+        try:
+            return await self._read_chunk(size)
+        except Exception:
+            await self.close()  # the connection is in an unknown state
+            raise
+
+    async def _read_chunk(self, size):
+        if self.mode == 'chunked' and not self.remaining:
+            self.remaining = int((await self._readline()).split(b';')[0], 16)
+            if not self.remaining:
+                await self._readline()  # (no trailers expected)
+        if self.mode == 'close':
+            data = await self._read(size)
+        elif self.remaining:
+            data = await self._read(min(self.remaining, size))
+            self.remaining -= len(data)
+            if self.mode == 'chunked' and not self.remaining:
+                await self._readline()  # end of the chunk
+                return data
+        else:
+            data = b''
+        if not data:
+            self.done = True
+            await self.client._release(self)
+        return data
+
+    async def read(self):
+        """Return the whole body (bytes)."""
+        body = b''
+        while True:
+            data = await self.read_chunk()
+            if not data:
+                return body
+            body += data
+
+    async def text(self):
+        return (await self.read()).decode()
+
+    async def json(self):
+        return json.loads(await self.read())
+
+    async def close(self):
+        """Drop the connection (if the body hasn't been read)."""
+        if not self.done:
+            self.done = True
+            await self.client._drop(self.key, self.writer)
+
+
+class Client:
+    """HTTP client keeping one open connection per (host, port)."""
+
+    def __init__(self, timeout=TIMEOUT):
+        self.timeout = timeout
+        self.connections = {}  # (host, port) -> (reader, writer), idle
+
+    async def _connect(self, host, port, ssl):
+        key = (host, port)
+        if key in self.connections:
+            return key, self.connections.pop(key), True
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl or None), self.timeout)
+        return key, (reader, writer), False
+
+    async def _release(self, response):
+        """Keep the connection of a fully read response, unless closing."""
+        if response.headers.get('connection', '').lower() == 'close':
+            await self._drop(response.key, response.writer)
+        elif response.key in self.connections:
+            await self._drop(None, response.writer)  # already have one
+        else:
+            self.connections[response.key] = (response.reader, response.writer)
+
+    async def _drop(self, key, writer):
+        if key is not None and self.connections.get(key, (None, None))[1] is writer:
+            del self.connections[key]
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+    async def request(self, method, url, body=None, headers=None):
+        """Send a request, return its Response once the headers are in.
+
+        Read (or close) the response before the next request to the
+        same host, so the connection can be reused.
+        """
+        host, port, path, ssl = split_url(url)
+        if isinstance(body, str):
+            body = body.encode()
+        head = f'{method} {path} HTTP/1.1\r\nHost: {host}\r\n'
+        if body:
+            head += f'Content-Length: {len(body)}\r\n'
+        for name, value in (headers or {}).items():
+            head += f'{name}: {value}\r\n'
+        head += '\r\n'
+
+        # A kept-alive connection may have been closed by the server
+        # meanwhile: if so, try again once on a new one
+        for attempt in (0, 1):
+            key, (reader, writer), reused = await self._connect(host, port, ssl)
+            response = Response(self, key, reader, writer)
+            try:
+                writer.write(head.encode())
+                if body:
+                    writer.write(body)
+                await asyncio.wait_for(writer.drain(), self.timeout)
+                await response._read_head()
+                return response
+            except Exception:
+                await self._drop(None, writer)
+                if not reused or attempt:
+                    raise
+
+    async def get(self, url, headers=None):
+        return await self.request('GET', url, headers=headers)
+
+    async def close(self):
+        """Close all the kept-alive connections."""
+        for key in list(self.connections):
+            await self._drop(key, self.connections[key][1])
@@ -1,5 +1,8 @@
 """
 control carriage lights: On at sunset / Off at 'bedtime'
+Sunset is computed on the Pico (solar.py), so it doesn't need the network
+Sunset times for the coming weeks are kept on flash (sunsets.py)
+Timed jobs run from a scheduler (see sched.py), not a once-a-second loop
 Make daily log data available via webserver
 Power failure tolerant
 """
@@ -8,14 +11,25 @@ import gc
 import micropython
 from  machine import Pin, RTC
 import network
-from ntptime import settime
 import time
-import urequests
 from secrets import secrets
 import uasyncio as asyncio
+from webserve import RenderCache
+from journal import Journal
+import solar
+from sunsets import SunsetCache
+from sched import Scheduler
+from ahttp import Client
+from relays import load_groups, DEFAULT_GROUPS
+import sntp
 
 # Global values
 DATAFILENAME = 'data.txt'
+FLUSH_INTERVAL = 300  # seconds between journal flushes
+page_cache = RenderCache()  # the data page, until the next record()
+SUNSETFILENAME = 'sunsets.bin'
+WIFI_CHECK_INTERVAL = 30  # seconds between checks of the connection
+HEARTBEAT_INTERVAL = 5  # seconds between flashes of the LED
 ssid = secrets['ssid']
 password = secrets['wifi_password']
 lat = secrets['lat']
@@ -32,37 +46,38 @@ if DST_pin.value():
 else:
     tz_offset = TZ_OFFSET + 1
 
-# URLs to fetch from
-SUNSET_URL = "http://api.sunrise-sunset.org/json?lat=%f&lng=%f&formatted=0"\
-    % (lat, long)
-LIGHTS_ON_URL = "http://192.168.1.54/control?cmd=GPIO,12,1"
-LIGHTS_OFF_URL = "http://192.168.1.54/control?cmd=GPIO,12,0"
+# Relays (ESPEasy Sonoffs) by group, switched a group at a time
+groups = load_groups(secrets.get('relays', DEFAULT_GROUPS))
+LIGHTS_GROUP = secrets.get('lights_group', 'carriage')
+
+# Sunset (UTC) by date, for the coming weeks
+sunsets = SunsetCache(SUNSETFILENAME, lat, long)
 
 # Set up onboard led
 onboard = Pin("LED", Pin.OUT, value=0)
 
-html = """<!DOCTYPE html>
+html_head = """<!DOCTYPE html>
 <html>
     <head> <title>Lights Controller</title> </head>
     <body> <h1>Carriage Lights Controller</h1>
-        <pre>%s</pre>
-    </body>
-</html>
-"""
+        <pre>"""
 
 def record(line):
-    """Combined print and append to data file."""
+    """Combined print and append to data file (through the journal)."""
     print(line)
-    line += '\n'
-    with open(DATAFILENAME, 'a') as file:
-        file.write(line)
+    journal.write(line + '\n')
 
-def sync_rtc_to_ntp():
-    """Sync RTC to (utc) time from ntp server."""
+# Lines for the data file, buffered and written in crc-framed batches
+journal = Journal(DATAFILENAME)
+
+async def sync_rtc_to_ntp():
+    """Sync RTC to (utc) time from ntp server, to the ms (see sntp.py)."""
     try:
-        settime()
+        sample = await sntp.settime()
+        print(f"NTP delay {sample.delay_us // 1000} ms, jitter "
+              f"{sample.jitter_us // 1000} ms ({sample.count} samples)")
     except OSError as e:
-        err_string = 'OSError' + e + 'while trying to set rtc'
+        err_string = 'OSError ' + str(e) + ' while trying to set rtc'
         record(err_string)
     print('setting rtc to UTC...')
 
@@ -80,32 +95,21 @@ def utc_hour_to_local_hour(utc_h):
 
 def get_sunset_time():
     """Get (UTC) time of today's sunset. return (H, M, S)"""
-    try:
-        response = urequests.get(SUNSET_URL)
-        data = response.json()
-        utc_sunset_str = data['results']['sunset']
-        date_str, time_str = utc_sunset_str.split('T')
-        utc_hr_str, m_str, s_str, *rest = time_str.split(':')
-        H = int(utc_hr_str)
-        M = int(m_str)
-        S = int(s_str.split('+')[0])
-        return (H, M, S)
-    except Exception as e:
-        record(repr(e))
+    y, mo, d = time.gmtime()[:3]
+    return solar.hms(sunsets.get(y, mo, d))
+
+# Requests to the relay don't hold up the event loop (see ahttp.py)
+http = Client()
 
-def lights_on():
-    ok = False
-    r = urequests.get(LIGHTS_ON_URL)
-    record(r.text)
-    ok = True
-    return ok
+async def lights_on():
+    report = await groups[LIGHTS_GROUP].switch(http, True)
+    record(report.summary())
+    return report.ok
 
-def lights_off():
-    ok = False
-    r = urequests.get(LIGHTS_OFF_URL)
-    record(r.text)
-    ok = True
-    return ok
+async def lights_off():
+    report = await groups[LIGHTS_GROUP].switch(http, False)
+    record(report.summary())
+    return report.ok
 
 wlan = network.WLAN(network.STA_IF)
 
@@ -140,18 +144,107 @@ async def serve_client(reader, writer):
     while await reader.readline() != b"\r\n":
         pass
 
-    with open(DATAFILENAME) as file:
-        data = file.read()
-
-    response = html % data
-    writer.write('HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n')
-    writer.write(response)
-
-    await writer.drain()
+    # Rendered once per change of the data file (large files are streamed)
+    journal.flush()
+    await page_cache.send_page(writer, '/', journal.version, html_head, DATAFILENAME)
     await writer.wait_closed()
     print("Client disconnected")
 
+def tz_seconds():
+    return tz_offset * 3600
+
+def local_hms():
+    """Return (h, m, s) of the local time."""
+    return time.localtime(time.time() + tz_seconds())[3:6]
+
+async def check_wifi():
+    """Check the DST jumper, re-connect WiFi if needed."""
+    global tz_offset
+    offset = TZ_OFFSET if DST_pin.value() else TZ_OFFSET + 1
+    if offset != tz_offset:
+        tz_offset = offset
+        sched.resync()
+
+    if not wlan.isconnected():
+        lh, m, s = local_hms()
+        record(f"{lh:02}:{m:02}:{s:02} WiFi not connected")
+        wlan.disconnect()
+        record("Attempting to re-connect")
+        success = connect()
+        record(f"Re-connected: {success}")
+        # After successful reconnection, sync rtc to ntp
+        if success:
+            await sync_rtc_to_ntp()
+            time.sleep(1)
+            sched.resync()
+
+def hourly():
+    """Print UTC time on the hour."""
+    h, m, s = time.gmtime()[3:6]
+    lh = utc_hour_to_local_hour(h)
+    record("%d:%02d:%02d (UTC); %d:%02d:%02d (Local)" % (h, m, s, lh, m, s))
+
+    print('free:', str(gc.mem_free()))
+    print('info (gc):', str(gc.mem_alloc()))
+    print('info:', str(micropython.mem_info()))
+    gc.collect()
+
+def purge():
+    """Start a new data file (at 11:59 AM UTC)."""
+    y, mo, d = time.gmtime()[:3]
+    journal.reset('Date: %d/%d/%d\n' % (mo, d, y)
+                  + 'Sunset yesterday @ %d:%02d:%02d (UTC)\n' % (H, M, S))
+
+def schedule_sunset():
+    """Get the time of today's sunset, set the lights to come on then."""
+    global H, M, S, lights_on_job
+    H, M, S = get_sunset_time()
+    now = time.time()
+    sunset = now - now % 86400 + H * 3600 + M * 60 + S
+    if sunset < now - 3600:
+        sunset += 86400  # (the sunset after midnight UTC)
+    if lights_on_job:
+        sched.cancel(lights_on_job)
+    lights_on_job = sched.at(sunset, turn_lights_on)
+    return H, M, S
+
+def get_sunset():
+    """At 18:00 local, get time of today's sunset."""
+    lh, m, s = local_hms()
+    record(f"At {lh:02}:{m:02}:{s:02}, getting time of today's sunset")
+    H, M, S = schedule_sunset()
+    LH = utc_hour_to_local_hour(H)
+    record("Sunset today at %d:%02d:%02d local time" % (LH, M, S))
+
+async def turn_lights_on():
+    """At sunset, turn lights on."""
+    lh, m, s = local_hms()
+    record(f"Turning lights on at {lh:02}:{m:02}:{s:02}")
+    try:
+        await lights_on()
+    except Exception as e:
+        record(repr(e))
+
+async def turn_lights_off():
+    """At 9:01 PM local time, turn lights off."""
+    lh, m, s = local_hms()
+    record(f"Turning lights off at {lh:02}:{m:02}:{s:02}")
+    try:
+        await lights_off()
+    except Exception as e:
+        record(repr(e))
+
+async def flash_led():
+    onboard.on()
+    await asyncio.sleep(0.1)
+    onboard.off()
+
+# Jobs (above) run at their times by one task, see sched.py
+sched = Scheduler(on_error=record)
+lights_on_job = None
+
 async def main():
+    global tz_offset
     print('Connecting to Network...')
     connect()
 
@@ -161,96 +254,31 @@ async def main():
     print("Initial (rtc) ", local_time)
 
     # Sync RTC to ntp time server (utc)
-    sync_rtc_to_ntp()
+    await sync_rtc_to_ntp()
     time.sleep(1)
 
     gm_time = rtc.datetime()
     print('Reset to (UTC)', gm_time)
     record("power-up @ (%d, %d, %d, %d, %d, %d, %d, %d) (UTC)" % gm_time)
 
+    # Check for daylight savings time (set w/ jumper)
+    tz_offset = TZ_OFFSET if DST_pin.value() else TZ_OFFSET + 1
+
     print('Setting up webserver...')
     asyncio.create_task(asyncio.start_server(serve_client, "0.0.0.0", 80))
+    asyncio.create_task(journal.run(FLUSH_INTERVAL))
+    asyncio.create_task(sunsets.run())
 
     # Get sunset time
-    H, M, S = get_sunset_time()
-
-    while True:
-
-        # Check for daylight savings time (set w/ jumper)
-        if DST_pin.value():
-            tz_offset = TZ_OFFSET
-        else:
-            tz_offset = TZ_OFFSET + 1
-        
-        current_time = rtc.datetime()
-        y = current_time[0]  # curr year
-        mo = current_time[1] # current month
-        d = current_time[2]  # current day
-        h = current_time[4]  # curr hour (UTC)
-        lh = utc_hour_to_local_hour(h) # (local)
-        m = current_time[5]  # curr minute
-        s = current_time[6]  # curr second
-
-        timestamp = f"{lh:02}:{m:02}:{s:02}"
-
-        # Test WiFi connection twice per minute
-        if s in (15, 45):
-            if not wlan.isconnected():
-                record(f"{timestamp} WiFi not connected")
-                wlan.disconnect()
-                record("Attempting to re-connect")
-                success = connect()
-                record(f"Re-connected: {success}")
-                # After successful reconnection, sync rtc to ntp
-                if success:
-                    sync_rtc_to_ntp()
-                    time.sleep(1)
-            
-        # Print UTC time on the hour
-        if not s and not m % 60:
-            record("%d:%02d:%02d (UTC); %d:%02d:%02d (Local)" % (h, m, s, lh, m, s))
-
-            print('free:', str(gc.mem_free()))
-            print('info (gc):', str(gc.mem_alloc()))
-            print('info:', str(micropython.mem_info()))
-            gc.collect()
-
-        # At 11:59 AM (UTC) purge data file
-        if h == 11 and m == 59 and s == 0:
-            with open(DATAFILENAME, 'w') as file:
-                file.write('Date: %d/%d/%d\n' % (mo, d, y))
-                file.write('Sunset yesterday @ %d:%02d:%02d (UTC)\n' % (H, M, S))
-
-        # At 22:0:0 (UTC), get time of today's sunset
-        if lh == 18 and m == 0 and s == 0:
-            record(f"At {timestamp}, getting time of today's sunset")
-            try:
-                H, M, S = get_sunset_time()
-                LH = utc_hour_to_local_hour(H)
-                record("Sunset today at %d:%02d:%02d local time" % (LH, M, S))
-            except Exception as e:
-                record('Error: %s at %d:%02d:%02d' % (e, h, m, s))
-        
-        # At sunset, turn lights on
-        if h == H and m == M  and s in (0, 1):
-            record(f"Turning lights on at {timestamp}")
-            try:
-                lights_on()
-            except Exception as e:
-                record(repr(e))
-
-        # At 9:01 PM local time, turn lights off
-        if lh == 21 and m == 1 and s in (0, 1):
-            record(f"Turning lights off at {timestamp}")
-            try:
-                lights_off()
-            except Exception as e:
-                record(repr(e))
-
-        onboard.on()
-        await asyncio.sleep(0.1)
-        onboard.off()
-        await asyncio.sleep(0.9)
+    schedule_sunset()
+
+    sched.every(WIFI_CHECK_INTERVAL, check_wifi)
+    sched.cron(hourly, minute=0)
+    sched.cron(purge, hour=11, minute=59)
+    sched.cron(get_sunset, hour=18, minute=0, offset=tz_seconds)
+    sched.cron(turn_lights_off, hour=21, minute=1, offset=tz_seconds)
+    sched.every(HEARTBEAT_INTERVAL, flash_led)
+    await sched.run()
 
 try:
     asyncio.run(main())
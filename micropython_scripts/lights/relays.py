@@ -0,0 +1,142 @@
+"""
+Groups of ESPEasy relays (Sonoffs), all switched at once.
+
+Each relay is switched by an http GET of /control?cmd=... on its own
+IP address. Sent one after another (and blocking), a dozen of them take
+seconds and the lights come on visibly staggered. Here the requests of
+a group all go out together (asyncio.gather over ahttp requests), so
+the group takes as long as its slowest relay, not the sum of them all.
+
+ESPEasy answers a GPIO command with JSON, e.g. {"log": "GPIO 12 Set to
+1", "plugin": 1, "pin": 12, "mode": "output", "state": 1}; the switch
+worked if its state is the level asked for (other commands answer 'OK').
+A relay that fails (no answer, or any other answer) is retried, on its
+own, up to RETRIES more times. Switching returns each relay's result
+and latency, and how long the whole group took:
+
+    groups = load_groups(secrets.get('relays', DEFAULT_GROUPS))
+    report = await groups['carriage'].switch(http, True)
+    record(report.summary())
+"""
+
+import json
+import time
+import uasyncio as asyncio
+
+RETRIES = 2  # more tries for a relay that failed
+RETRY_DELAY = 1  # seconds before trying a relay again
+ON_CMD = 'GPIO,12,1'  # Sonoff relay on GPIO 12
+OFF_CMD = 'GPIO,12,0'
+
+# group name -> relays, each an IP address or (address, on cmd, off cmd)
+DEFAULT_GROUPS = {'carriage': ['192.168.1.54']}
+
+
+class Relay:
+    """One relay: its address and the ESPEasy commands to switch it."""
+
+    def __init__(self, host, on_cmd=ON_CMD, off_cmd=OFF_CMD):
+        self.host = host
+        self.on_cmd = on_cmd
+        self.off_cmd = off_cmd
+
+    def url(self, on):
+        return f'http://{self.host}/control?cmd={self.on_cmd if on else self.off_cmd}'
+
+    def answered(self, on, text):
+        """True if text is the relay's answer to a command that worked."""
+        try:
+            reply = json.loads(text)
+        except ValueError:
+            return text == 'OK'
+        if 'state' not in reply:
+            return True
+        # The level is the command's last argument, e.g. GPIO,12,1
+        cmd = self.on_cmd if on else self.off_cmd
+        return str(reply['state']) == cmd.rsplit(',', 1)[-1]
+
+    async def switch(self, client, on, retries=RETRIES):
+        """Switch the relay, return its Result."""
+        result = Result(self.host)
+        start = time.ticks_ms()
+        while True:
+            result.tries += 1
+            try:
+                response = await client.get(self.url(on))
+                result.text = (await response.text()).strip()
+                result.ok = (response.status == 200
+                             and self.answered(on, result.text))
+            except Exception as e:
+                result.text = repr(e)
+            if result.ok or result.tries > retries:
+                break
+            await asyncio.sleep(RETRY_DELAY)
+        result.ms = time.ticks_diff(time.ticks_ms(), start)
+        return result
+
+
+class Result:
+    """How switching one relay went."""
+
+    def __init__(self, host):
+        self.host = host
+        self.ok = False
+        self.text = ''  # the relay's answer (or the error)
+        self.tries = 0
+        self.ms = 0  # from the first try to the final answer
+
+
+class Report:
+    """Results of switching a group."""
+
+    def __init__(self, name, on, results, ms):
+        self.name = name
+        self.on = on
+        self.results = results
+        self.ms = ms  # time for the whole group
+
+    @property
+    def ok(self):
+        return all([r.ok for r in self.results])
+
+    def summary(self):
+        """One line: group, state, count ok, time, then each relay."""
+        n_ok = sum([1 for r in self.results if r.ok])
+        line = (f"{self.name} {'on' if self.on else 'off'}: "
+                f"{n_ok}/{len(self.results)} ok in {self.ms} ms")
+        for r in self.results:
+            line += f"; {r.host} {r.ms} ms"
+            if r.tries > 1:
+                line += f" x{r.tries}"
+            if not r.ok:
+                line += f" {r.text}"
+        return line
+
+
+class Group:
+    """Relays switched together."""
+
+    def __init__(self, name, relays):
+        self.name = name
+        self.relays = relays
+
+    async def switch(self, client, on, retries=RETRIES):
+        """Switch all the relays at once, return a Report."""
+        start = time.ticks_ms()
+        results = await asyncio.gather(
+            *[relay.switch(client, on, retries) for relay in self.relays])
+        return Report(self.name, on, results, time.ticks_diff(time.ticks_ms(), start))
+
+
+def load_groups(config):
+    """Return {name: Group} from {name: [address or (address, on, off)]}."""
+    groups = {}
+    for name, entries in config.items():
+        relays = []
+        for entry in entries:
+            if isinstance(entry, str):
+                relays.append(Relay(entry))
+            else:
+                relays.append(Relay(*entry))
+        groups[name] = Group(name, relays)
+    return groups
@@ -0,0 +1,106 @@
+"""
+Sunrise and sunset from latitude, longitude and date, computed on the Pico.
+
+Follows the NOAA solar calculator (the formulas of its spreadsheet, after
+Meeus), good to about a minute between +/- 72 deg latitude, so no web
+service (and no network) is needed to know when the sun goes down.
+
+Floats on the Pico are single precision (about 7 digits), not enough to
+hold a Julian date like 2460000.5 to better than a quarter of a day. So
+dates are kept as an integer count of days since 2000-01-01, computed
+with integer maths only, and just the fraction of a day (and the angles
+derived from it) are floats.
+
+Times are in seconds after midnight UTC of the given date. In the
+Americas, sunset falls after midnight UTC, so it can be more than 86400;
+hms() wraps it back into the day. Where the sun stays up (or down) all
+day, the hour angle is clamped: sunset at solar midnight (or noon).
+"""
+
+import math
+
+ZENITH = 90.833  # deg, sun's center at sunset (refraction + disc radius)
+J2000 = 10957  # days from 1970-01-01 to 2000-01-01
+
+
+def days_from_civil(y, m, d):
+    """Days since 1970-01-01 of date y-m-d (integer maths only)."""
+    if m <= 2:
+        y -= 1
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m - 3 if m > 2 else m + 9) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def civil_from_days(days):
+    """Date (y, m, d) of a count of days since 1970-01-01."""
+    days += 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    d = doy - (153 * mp + 2) // 5 + 1
+    m = mp + 3 if mp < 10 else mp - 9
+    return yoe + era * 400 + (m <= 2), m, d
+
+
+def _sun(n, minutes):
+    """Declination (rad) and equation of time (min) of the sun.
+
+    n is the day (days since 2000-01-01), minutes the time (UTC) on it.
+    """
+    # Julian centuries since J2000.0 (2000-01-01 12:00)
+    jc = (n - 0.5 + minutes / 1440) / 36525
+    l0 = (280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360
+    m = math.radians((357.52911 + jc * (35999.05029 - 0.0001537 * jc)) % 360)
+    e = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    c = (math.sin(m) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+         + math.sin(2 * m) * (0.019993 - 0.000101 * jc)
+         + math.sin(3 * m) * 0.000289)
+    omega = math.radians(125.04 - 1934.136 * jc)
+    lam = math.radians(l0 + c - 0.00569 - 0.00478 * math.sin(omega))
+    eps = math.radians(23 + (26 + (21.448 - jc * (46.815 + jc * (
+        0.00059 - jc * 0.001813))) / 60) / 60 + 0.00256 * math.cos(omega))
+    decl = math.asin(math.sin(eps) * math.sin(lam))
+    y = math.tan(eps / 2) ** 2
+    l0 = math.radians(l0)
+    eot = 4 * math.degrees(y * math.sin(2 * l0)
+                           - 2 * e * math.sin(m)
+                           + 4 * e * y * math.sin(m) * math.cos(2 * l0)
+                           - 0.5 * y * y * math.sin(4 * l0)
+                           - 1.25 * e * e * math.sin(2 * m))
+    return decl, eot
+
+
+def _event(n, lat, lon, sign):
+    """Seconds (UTC) of sunrise (sign -1) or sunset (+1) on day n."""
+    phi = math.radians(lat)
+    minutes = 720 - 4 * lon  # first guess: solar noon
+    # Twice: at noon, then again at the time found (the sun moves a bit)
+    for _ in range(2):
+        decl, eot = _sun(n, minutes)
+        cos_ha = (math.cos(math.radians(ZENITH)) / (math.cos(phi) * math.cos(decl))
+                  - math.tan(phi) * math.tan(decl))
+        ha = math.degrees(math.acos(max(-1, min(1, cos_ha))))
+        minutes = 720 - 4 * lon - eot + sign * 4 * ha
+    return int(minutes * 60 + 0.5)
+
+
+def sunset(y, m, d, lat, lon):
+    """Seconds after midnight UTC of the sunset on y-m-d (lon: + east)."""
+    return _event(days_from_civil(y, m, d) - J2000, lat, lon, 1)
+
+
+def sunrise(y, m, d, lat, lon):
+    """Seconds after midnight UTC of the sunrise on y-m-d (lon: + east)."""
+    return _event(days_from_civil(y, m, d) - J2000, lat, lon, -1)
+
+
+def hms(seconds):
+    """Return (H, M, S) of seconds after midnight, wrapped into one day."""
+    seconds %= 86400
+    return seconds // 3600, seconds // 60 % 60, seconds % 60
+
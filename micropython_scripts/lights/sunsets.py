@@ -0,0 +1,77 @@
+"""
+Sunset times for the coming weeks, kept on flash.
+
+The file holds one record (day, sunset) per day, day counted since
+1970-01-01 and sunset in seconds after midnight UTC (see solar.py). At
+power-up, today's sunset is one small file read away, before the clock
+has even been set from NTP on a slow network. A background task keeps
+the file filled for the next DAYS days, one computation at a time, so
+the event loop is never held up for long.
+"""
+
+import struct
+import time
+import uasyncio as asyncio
+import solar
+
+RECORD_FMT = '<Ii'
+RECORD_SIZE = struct.calcsize(RECORD_FMT)
+DAYS = 21  # days ahead kept in the file
+REFRESH_INTERVAL = 6 * 3600  # seconds between refreshes
+
+
+class SunsetCache:
+    """Sunset (seconds after midnight UTC) by date, for DAYS days ahead."""
+
+    def __init__(self, filename, lat, lon, days=DAYS):
+        self.filename = filename
+        self.lat = lat
+        self.lon = lon
+        self.days = days
+        self.sunsets = {}  # day -> seconds
+        self.load()
+
+    def load(self):
+        self.sunsets = {}
+        rec = bytearray(RECORD_SIZE)
+        try:
+            with open(self.filename, 'rb') as f:
+                while f.readinto(rec) == RECORD_SIZE:
+                    day, seconds = struct.unpack(RECORD_FMT, rec)
+                    self.sunsets[day] = seconds
+        except OSError:
+            pass  # no file yet
+
+    def save(self):
+        rec = bytearray(RECORD_SIZE)
+        with open(self.filename, 'wb') as f:
+            for day in sorted(self.sunsets):
+                struct.pack_into(RECORD_FMT, rec, 0, day, self.sunsets[day])
+                f.write(rec)
+
+    def get(self, y, m, d):
+        """Sunset on y-m-d, computed (and kept) if it isn't in the file."""
+        day = solar.days_from_civil(y, m, d)
+        if day not in self.sunsets:
+            self.sunsets[day] = solar.sunset(y, m, d, self.lat, self.lon)
+        return self.sunsets[day]
+
+    async def refresh(self, today):
+        """Drop days before today, fill in today .. today + days - 1."""
+        for day in [day for day in self.sunsets if day < today]:
+            del self.sunsets[day]
+        added = False
+        for day in range(today, today + self.days):
+            if day not in self.sunsets:
+                y, m, d = solar.civil_from_days(day)
+                self.sunsets[day] = solar.sunset(y, m, d, self.lat, self.lon)
+                added = True
+                await asyncio.sleep(0)  # let other tasks run
+        if added:
+            self.save()
+
+    async def run(self, interval=REFRESH_INTERVAL):
+        """Keep the file filled ahead (run as a task, once the RTC is set)."""
+        while True:
+            await self.refresh(solar.days_from_civil(*time.gmtime()[:3]))
+            await asyncio.sleep(interval)
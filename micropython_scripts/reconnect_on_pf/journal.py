@@ -0,0 +1,157 @@
+"""
+Write-behind journal for an append-only text file (e.g. data.txt).
+
+Lines collect in a preallocated RAM buffer and reach flash as one append
+when the buffer fills, when the flush timer runs, or on demand (before
+the file is served or read). That is one flash write per batch instead
+of one open / append / close per line.
+
+Each flushed batch is a frame: a record (end offset, length, crc32)
+is appended to a sidecar file (e.g. data.txt.crc) after the batch is
+written. At power-up, anything past the last frame whose crc checks out
+is cut off, so a power cut loses at most the unflushed tail and never
+leaves a torn line behind.
+"""
+
+import os
+import struct
+from binascii import crc32
+import uasyncio as asyncio
+
+FRAME_FMT = '<III'
+FRAME_SIZE = struct.calcsize(FRAME_FMT)
+BUFFER_SIZE = 512
+
+
+def file_size(filename):
+    try:
+        return os.stat(filename)[6]
+    except OSError:
+        return 0
+
+
+class Journal:
+    """Buffered, crc-framed appends to filename."""
+
+    def __init__(self, filename, size=BUFFER_SIZE):
+        self.filename = filename
+        self.crcfilename = filename + '.crc'
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.n = 0  # bytes waiting in buf
+        self.version = 0  # incremented with every write (or reset)
+        self._frame = bytearray(FRAME_SIZE)
+        self.recover()
+
+    def _read_frame(self, f, i):
+        f.seek(i * FRAME_SIZE)
+        f.readinto(self._frame)
+        return struct.unpack(FRAME_FMT, self._frame)
+
+    def _check(self, end, length, crc):
+        """True if the frame ending at 'end' is intact in the data file."""
+        if end > file_size(self.filename):
+            return False
+        with open(self.filename, 'rb') as f:
+            f.seek(end - length)
+            value = 0
+            while length:
+                n = f.readinto(self.mv[:min(length, len(self.buf))])
+                if not n:
+                    return False
+                value = crc32(self.mv[:n], value)
+                length -= n
+        return value == crc
+
+    def recover(self):
+        """Cut the file back to the end of its last intact frame."""
+        nframes = file_size(self.crcfilename) // FRAME_SIZE
+        if not nframes:
+            # First use (or no frames yet): adopt the file as it is
+            self._restart()
+            return
+        good = 0
+        with open(self.crcfilename, 'rb') as f:
+            while nframes:
+                end, length, crc = self._read_frame(f, nframes - 1)
+                if self._check(end, length, crc):
+                    good = end
+                    break
+                nframes -= 1
+        if not nframes:
+            # No frame matches: the file was replaced, adopt it as it is
+            self._restart()
+            return
+        if good != file_size(self.filename) or \
+                nframes * FRAME_SIZE != file_size(self.crcfilename):
+            print(f'{self.filename}: keeping {good} bytes, {nframes} frames')
+            self._truncate(self.filename, good)
+            self._truncate(self.crcfilename, nframes * FRAME_SIZE)
+
+    def _truncate(self, filename, size):
+        """Keep the first size bytes of filename (copy, then rename)."""
+        tmpname = filename + '.tmp'
+        with open(filename, 'rb') as src, open(tmpname, 'wb') as dst:
+            while size:
+                n = src.readinto(self.mv[:min(size, len(self.buf))])
+                if not n:
+                    break
+                dst.write(self.mv[:n])
+                size -= n
+        os.rename(tmpname, filename)
+
+    def _restart(self):
+        """Start a new frame log, with one frame covering the whole file."""
+        end = file_size(self.filename)
+        crc = 0
+        if end:
+            with open(self.filename, 'rb') as f:
+                while True:
+                    n = f.readinto(self.buf)
+                    if not n:
+                        break
+                    crc = crc32(self.mv[:n], crc)
+        with open(self.crcfilename, 'wb') as f:
+            if end:
+                struct.pack_into(FRAME_FMT, self._frame, 0, end, end, crc)
+                f.write(self._frame)
+
+    def write(self, text):
+        """Queue text (a line, ending with newline) to be appended."""
+        data = text.encode()
+        if self.n + len(data) > len(self.buf):
+            self.flush()
+        if len(data) > len(self.buf):
+            self._append(data)
+        else:
+            self.buf[self.n:self.n + len(data)] = data
+            self.n += len(data)
+        self.version += 1
+
+    def _append(self, data):
+        end = file_size(self.filename) + len(data)
+        with open(self.filename, 'ab') as f:
+            f.write(data)
+        struct.pack_into(FRAME_FMT, self._frame, 0, end, len(data), crc32(data))
+        with open(self.crcfilename, 'ab') as f:
+            f.write(self._frame)
+
+    def flush(self):
+        """Append everything in the buffer to the file as one frame."""
+        if self.n:
+            self._append(self.mv[:self.n])
+            self.n = 0
+
+    def reset(self, text=''):
+        """Replace the whole file with text (e.g. a new day's header)."""
+        self.n = 0
+        with open(self.filename, 'w') as f:
+            f.write(text)
+        self._restart()
+        self.version += 1
+
+    async def run(self, interval):
+        """Flush every interval seconds (run as a task)."""
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
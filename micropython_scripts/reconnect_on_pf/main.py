@@ -2,18 +2,27 @@ import gc
 import micropython
 from  machine import Pin, RTC
 import network
-from ntptime import settime
 import time
 import _thread
 from secrets import secrets
 import uasyncio as asyncio
 from ota import OTAUpdater
+from webserve import send_page, parse_request, RenderCache
+from journal import Journal
+from rotate import append_line, generation
+from sched import Scheduler
+import sntp
 
 # Global values
 gc_text = ''
 DATAFILENAME = 'data.txt'
 LOGFILENAME = 'log.txt'
 ERRORLOGFILENAME = 'errorlog.txt'
+FLUSH_INTERVAL = 300  # seconds between journal flushes
+LOG_MAX_BYTES = 16384  # rotate log.txt at this size
+page_cache = RenderCache()  # the data page, until the next record()
+WIFI_CHECK_INTERVAL = 30  # seconds between checks of the connection
+HEARTBEAT_INTERVAL = 5  # seconds between flashes of the LED
 ssid = secrets['ssid']
 password = secrets['wifi_password']
 TZ_OFFSET = secrets['tz_offset']
@@ -31,23 +40,21 @@ else:
 # Set up onboard led
 onboard = Pin("LED", Pin.OUT, value=0)
 
-html = """<!DOCTYPE html>
+html_head = """<!DOCTYPE html>
 <html>
     <head> <title>Re-Connect on Power Failure</title> </head>
     <body> <h1>Re-Connect</h1>
         <h3>%s</h3>
-        <pre>%s</pre>
-    </body>
-</html>
-"""
+        <pre>"""
 
-def sync_rtc_to_ntp():
-    """Sync RTC to (utc) time from ntp server."""
+async def sync_rtc_to_ntp():
+    """Sync RTC to (utc) time from ntp server, to the ms (see sntp.py)."""
     try:
-        settime()
+        sample = await sntp.settime()
+        print(f"NTP delay {sample.delay_us // 1000} ms, jitter "
+              f"{sample.jitter_us // 1000} ms ({sample.count} samples)")
     except OSError as e:
-        with open(ERRORLOGFILENAME, 'a') as file:
-            file.write(f"OSError while trying to set time: {str(e)}\n")
+        append_line(ERRORLOGFILENAME, f"OSError while trying to set time: {str(e)}\n")
     print('setting rtc to UTC...')
 
 def local_hour_to_utc_hour(loc_h):
@@ -63,11 +70,12 @@ def utc_hour_to_local_hour(utc_h):
     return loc_h
 
 def record(line):
-    """Combined print and append to data file."""
+    """Combined print and append to data file (through the journal)."""
     print(line)
-    line += '\n'
-    with open(DATAFILENAME, 'a') as file:
-        file.write(line)
+    journal.write(line + '\n')
+
+# Lines for the data file, buffered and written in crc-framed batches
+journal = Journal(DATAFILENAME)
 
 wlan = network.WLAN(network.STA_IF)
 
@@ -103,34 +111,105 @@ async def serve_client(reader, writer):
         while await reader.readline() != b"\r\n":
             pass
 
-        if '/log' in request_line.split()[1]:
-            with open(LOGFILENAME) as file:
-                data = file.read()
+        # /log and /err show the current generation of the (rotated)
+        # file, ?gen=1, 2, ... an older one, ?gen=sum the oldest summarized
+        path, params = parse_request(request_line)
+        gen = params.get('gen', '')
+        if '/log' in path:
+            filename = generation(LOGFILENAME, gen)
             heading = "Occurences"
-        elif '/err' in request_line.split()[1]:
-            with open(ERRORLOGFILENAME) as file:
-                data = file.read()
+        elif '/err' in path:
+            filename = generation(ERRORLOGFILENAME, gen)
             heading = "ERRORS"
         else:
-            with open(DATAFILENAME) as file:
-                data = file.read()
+            filename = DATAFILENAME
+            journal.flush()
             heading = "Append '/log' or '/err' to URL to see log file or error log"
 
-        data += gc_text
-
-        response = html % (heading, data)
-        writer.write('HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n')
-        writer.write(response)
-
-        await writer.drain()
+        if filename == DATAFILENAME:
+            # Rendered once per change of the data file
+            await page_cache.send_page(writer, '/', journal.version,
+                                       html_head % heading, filename, gc_text)
+        else:
+            # Stream the file rather than reading it all into memory
+            await send_page(writer, html_head % heading, filename, gc_text)
         await writer.wait_closed()
         print("Client disconnected")
     except Exception as e:
-        with open(ERRORLOGFILENAME, 'a') as file:
-            file.write(f"serve_client error: {str(e)}\n")
+        append_line(ERRORLOGFILENAME, f"serve_client error: {str(e)}\n")
+
+def local_now():
+    """Return (y, mo, d, h, m, s) of the local time."""
+    return time.localtime(time.time() + tz_seconds())[:6]
+
+def tz_seconds():
+    return tz_offset * 3600
+
+def log_error(text):
+    append_line(ERRORLOGFILENAME, text + "\n")
+
+async def check_wifi():
+    """Check the DST jumper, test the WiFi connection (twice per minute)."""
+    global tz_offset
+    offset = TZ_OFFSET if DST_pin.value() else TZ_OFFSET + 1
+    if offset != tz_offset:
+        tz_offset = offset
+        sched.resync()
+
+    if not wlan.isconnected():
+        y, mo, d, lh, m, s = local_now()
+        record(f"{lh:02}:{m:02}:{s:02} WiFi not connected")
+        wlan.disconnect()
+        record("Attempting to re-connect")
+        success = connect()
+        record(f"Re-connected: {success}")
+        # After successful reconnection, sync rtc to ntp
+        if success:
+            await sync_rtc_to_ntp()
+            time.sleep(1)
+            sched.resync()
+
+def datapoint():
+    """Print time on 30 min intervals."""
+    global gc_text
+    y, mo, d, lh, m, s = local_now()
+    record(f"datapoint @ {lh:02}:{m:02}:{s:02}")
+
+    gc_text = f"free: {str(gc.mem_free())}\n"
+    gc.collect()
+
+def daily_log():
+    """Once daily (during the wee hours), log yesterday's events."""
+    y, mo, d, lh, m, s = local_now()
+
+    # Read lines from previous day
+    journal.flush()
+    with open(DATAFILENAME) as f:
+        lines = f.readlines()
+
+    # first line is yesterday's date
+    yesterdate = lines[0].split()[-1].strip()
+
+    # cull all lines containing '@'
+    lines = [line
+             for line in lines
+             if '@' not in line]
+
+    # Log lines from previous day (rotating the log if full)
+    append_line(LOGFILENAME, ''.join(lines), LOG_MAX_BYTES)
+
+    # Start a new data file for today
+    journal.reset('Date: %d/%d/%d\n' % (mo, d, y))
+
+async def flash_led():
+    onboard.on()
+    await asyncio.sleep(0.1)
+    onboard.off()
+
+# Jobs (above) run at their times by one task, see sched.py
+sched = Scheduler(on_error=log_error)
 
 async def main():
-    global gc_text, tz_offset
     print('Connecting to Network...')
     connect()
 
@@ -139,7 +218,8 @@ async def main():
     path = "micropython_scripts/reconnect_on_pf"
     branch = "main"
     firmware_url = f"https://github.com/dblanding/{repo_name}/{branch}/{path}/"
-    ota_updater = OTAUpdater(firmware_url, "main.py")
+    ota_updater = OTAUpdater(firmware_url, "main.py", "ota.py", "webserve.py",
+                             "journal.py", "rotate.py", "sched.py", "sntp.py")
     ota_updater.download_and_install_update_if_available()
 
     # Pico Real Time Clock
@@ -148,7 +228,7 @@ async def main():
     print("Initial (rtc) ", local_time)
 
     # Sync RTC to ntp time server (utc)
-    sync_rtc_to_ntp()
+    await sync_rtc_to_ntp()
     time.sleep(1)
 
     gm_time = rtc.datetime()
@@ -157,83 +237,13 @@ async def main():
 
     print('Setting up webserver...')
     asyncio.create_task(asyncio.start_server(serve_client, "0.0.0.0", 80))
-    while True:
+    asyncio.create_task(journal.run(FLUSH_INTERVAL))
 
-        # Check for daylight savings time (set w/ jumper)
-        if DST_pin.value():
-            tz_offset = TZ_OFFSET
-        else:
-            tz_offset = TZ_OFFSET + 1
-
-        try:
-            current_time = rtc.datetime()
-            y = current_time[0]  # curr year
-            mo = current_time[1] # current month
-            d = current_time[2]  # current day
-            h = current_time[4]  # curr hour (UTC)
-            lh = utc_hour_to_local_hour(h) # (local)
-            m = current_time[5]  # curr minute
-            s = current_time[6]  # curr second
-            
-            timestamp = f"{lh:02}:{m:02}:{s:02}"
-
-            # Test WiFi connection twice per minute
-            if s in (15, 45):
-                if not wlan.isconnected():
-                    record(f"{timestamp} WiFi not connected")
-                    wlan.disconnect()
-                    record("Attempting to re-connect")
-                    success = connect()
-                    record(f"Re-connected: {success}")
-                    # After successful reconnection, sync rtc to ntp
-                    if success:
-                        sync_rtc_to_ntp()
-                        time.sleep(1)
-            
-            # Print time on 30 min intervals
-            if s in (1,) and not m % 30:
-                try:
-                    record(f"datapoint @ {timestamp}")
-                    
-                    gc_text = f"free: {str(gc.mem_free())}\n"
-                    gc.collect()
-                except Exception as e:
-                    with open(ERRORLOGFILENAME, 'a') as file:
-                        file.write(f"error printing: {repr(e)}\n")
-
-            # Once daily (during the wee hours)
-            if lh == 2 and m == 10 and s == 1:
-                
-                # Read lines from previous day
-                with open(DATAFILENAME) as f:
-                    lines = f.readlines()
-
-                # first line is yesterday's date
-                yesterdate = lines[0].split()[-1].strip()
-
-                # cull all lines containing '@'
-                lines = [line
-                         for line in lines
-                         if '@' not in line]
-                
-                # Log lines from previous day
-                with open(LOGFILENAME, 'a') as f:
-                    for line in lines:
-                        f.write(line)
-                
-                # Start a new data file for today
-                with open(DATAFILENAME, 'w') as file:
-                    file.write('Date: %d/%d/%d\n' % (mo, d, y))
-
-        except Exception as e:
-            with open(ERRORLOGFILENAME, 'a') as file:
-                file.write(f"main loop error: {str(e)}\n")
-
-        # Flash LED
-        onboard.on()
-        await asyncio.sleep(0.1)
-        onboard.off()
-        await asyncio.sleep(0.9)
+    sched.every(WIFI_CHECK_INTERVAL, check_wifi)
+    sched.cron(datapoint, minute=(0, 30), second=1)
+    sched.cron(daily_log, hour=2, minute=10, second=1, offset=tz_seconds)
+    sched.every(HEARTBEAT_INTERVAL, flash_led)
+    await sched.run()
 
 try:
     asyncio.run(main())
@@ -1,4 +1,3 @@
-import network
 import urequests
 import os
 import json
@@ -6,22 +5,20 @@ import machine
 from time import sleep
 
 class OTAUpdater:
-    """ This class handles OTA updates. It connects to the Wi-Fi,
-        checks for updates, downloads and installs them.
-        Note: Allow 5 minutes for cached values to clear."""
+    """ This class handles OTA updates. It checks for updates (using version number),
+        then downloads and installs multiple filenames, separated by commas."""
 
-    def __init__(self, repo_url, filename):
-        self.filename = filename
-        self.repo_url = repo_url
-        if "www.github.com" in self.repo_url :
+    def __init__(self, repo_url, *filenames):
+        
+        if "www.github.com" in repo_url :
             print(f"Updating {repo_url} to raw.githubusercontent")
-            self.repo_url = self.repo_url.replace("www.github","raw.githubusercontent")
-        elif "github.com" in self.repo_url:
+            self.repo_url = repo_url.replace("www.github","raw.githubusercontent")
+        elif "github.com" in repo_url:
             print(f"Updating {repo_url} to raw.githubusercontent'")
-            self.repo_url = self.repo_url.replace("github","raw.githubusercontent")            
+            self.repo_url = repo_url.replace("github","raw.githubusercontent")            
         self.version_url = self.repo_url + 'version.json'
         print(f"version url is: {self.version_url}")
-        self.firmware_url = self.repo_url + filename
+        self.filename_list = [filename for filename in filenames]
 
         # get the current version (stored in version.json)
         if 'version.json' in os.listdir():    
@@ -35,56 +32,28 @@ class OTAUpdater:
             with open('version.json', 'w') as f:
                 json.dump({'version': self.current_version}, f)
 
-    def fetch_latest_code(self):
-        """ Fetch the latest code from the repo, returns False if not found."""
+    def fetch_new_code(self, filename):
+        """ Fetch the code from the repo, returns False if not found."""
     
         # Fetch the latest code from the repo.
+        self.firmware_url = self.repo_url + filename
         response = urequests.get(self.firmware_url)
         if response.status_code == 200:
-            print(f'Fetched latest firmware code, status: {response.status_code}, -  {response.text}')
+            print(f'Fetched file {filename}, status: {response.status_code}')
     
-            # Save the fetched code to memory
-            self.latest_code = response.text
+            # Save the fetched code to file (with prepended '_')
+            new_code = response.text
+            with open(f'_{filename}', 'w') as f:
+                f.write(new_code)
+            print(f'Saved as _{filename}')
             return True
         
         elif response.status_code == 404:
             print(f'Firmware not found - {self.firmware_url}.')
             return False
 
-    def update_no_reset(self):
-        """ Update the code without resetting the device."""
-
-        # Save the fetched code and update the version file to latest version.
-        with open('latest_code.py', 'w') as f:
-            f.write(self.latest_code)
-        
-        # update the version in memory
-        self.current_version = self.latest_version
-
-        # save the current version
-        with open('version.json', 'w') as f:
-            json.dump({'version': self.current_version}, f)
-        
-        # free up some memory
-        self.latest_code = None
-
-        # Overwrite the old code.
-        # os.rename('latest_code.py', self.filename)
-
-    def update_and_reset(self):
-        """ Update the code and reset the device."""
-
-        print(f"Updating device... (Renaming latest_code.py to {self.filename})", end="")
-
-        # Overwrite the old code.
-        os.rename('latest_code.py', self.filename)  
-
-        # Restart the device to run the new code.
-        print('Restarting device...')
-        machine.reset()  # Reset the device to run the new code.
-        
     def check_for_updates(self):
-        """ Check if updates are available. (Note: values are cached for 5 min.)"""
+        """ Check if updates are available. (Note: GitHub caches values for 5 min.)"""
         
         print(f'Checking for latest version... on {self.version_url}')
         response = urequests.get(self.version_url)
@@ -108,8 +77,25 @@ class OTAUpdater:
     def download_and_install_update_if_available(self):
         """ Check for updates, download and install them."""
         if self.check_for_updates():
-            if self.fetch_latest_code():
-                self.update_no_reset() 
-                self.update_and_reset() 
+
+            # Fetch new code
+            for filename in self.filename_list:
+                self.fetch_new_code(filename)
+
+            # Overwrite current code with new
+            for filename in self.filename_list:
+                newfile = f"_{filename}"
+                os.rename(newfile, filename)
+                print(f'Renamed _{filename} to {filename}, overwriting existing file')
+
+            # save the current version
+            with open('version.json', 'w') as f:
+                json.dump({'version': self.latest_version}, f)
+            print('Update version from {self.current_version} to {self.latest_version}')
+
+            # Restart the device to run the new code.
+            print('Restarting device...')
+            sleep(0.3)
+            machine.reset() 
         else:
             print('No new updates available.')
@@ -0,0 +1,121 @@
+"""
+Size-capped rotation of log files (log.txt, errorlog.txt).
+
+When a file grows past max_bytes it becomes generation 1 (name.1), the
+older generations move up one (name.2, ...), and the one falling off the
+end is compacted into a short summary appended to name.sum: its first
+and last lines, its line count, and a count of its most common kinds of
+line (digits blanked out, so 'sensor T1 read error @ 03:10' and
+'... @ 04:20' are the same kind). The summary is capped too, so storage
+stays bounded whatever the uptime, even through an error storm.
+"""
+
+import os
+
+MAX_BYTES = 8192
+GENERATIONS = 3
+MAX_KINDS = 16  # distinct kinds of line counted while compacting
+TOP_KINDS = 5  # kinds listed in the summary
+
+try:
+    import logging
+except ImportError:  # (only needed for RotatingFileHandler)
+    logging = None
+
+
+def file_size(filename):
+    try:
+        return os.stat(filename)[6]
+    except OSError:
+        return 0
+
+
+def generation(filename, gen):
+    """Name of generation gen ('' or 0: current, 1..N, or 'sum')."""
+    if not gen or gen == '0':
+        return filename
+    return f'{filename}.{gen}'
+
+
+def kind(line):
+    """The line with digits blanked out, cut to 48 characters."""
+    return ''.join(['#' if c.isdigit() else c for c in line[:48]]).strip()
+
+
+def compact(filename, sumfilename, max_bytes):
+    """Append a summary of filename to sumfilename."""
+    count = 0
+    first = last = ''
+    kinds = {}
+    with open(filename) as f:
+        for line in f:
+            if not count:
+                first = line.strip()
+            last = line
+            count += 1
+            k = kind(line)
+            if k in kinds:
+                kinds[k] += 1
+            elif len(kinds) < MAX_KINDS:
+                kinds[k] = 1
+    top = sorted(kinds.items(), key=lambda item: -item[1])[:TOP_KINDS]
+    if file_size(sumfilename) > max_bytes:
+        trim(sumfilename, max_bytes // 2)
+    with open(sumfilename, 'a') as f:
+        f.write(f'{count} lines: {first} ... {last.strip()}\n')
+        for k, n in top:
+            f.write(f'  {n:6} x {k}\n')
+
+
+def trim(filename, keep):
+    """Keep only the last 'keep' bytes of filename (from a line start)."""
+    tmpname = filename + '.tmp'
+    with open(filename, 'rb') as src, open(tmpname, 'wb') as dst:
+        src.seek(file_size(filename) - keep)
+        src.readline()  # skip the partial line
+        while True:
+            chunk = src.read(512)
+            if not chunk:
+                break
+            dst.write(chunk)
+    os.rename(tmpname, filename)
+
+
+def rotate(filename, max_bytes=MAX_BYTES, generations=GENERATIONS):
+    """Rotate filename if it is over max_bytes. Return True if rotated."""
+    if file_size(filename) < max_bytes:
+        return False
+    oldest = generation(filename, generations)
+    if file_size(oldest):
+        compact(oldest, generation(filename, 'sum'), max_bytes)
+        os.remove(oldest)
+    for gen in range(generations - 1, 0, -1):
+        try:
+            os.rename(generation(filename, gen), generation(filename, gen + 1))
+        except OSError:
+            pass  # no such generation yet
+    os.rename(filename, generation(filename, 1))
+    return True
+
+
+def append_line(filename, line, max_bytes=MAX_BYTES, generations=GENERATIONS):
+    """Append line (ending with newline) to filename, rotating it if need be."""
+    with open(filename, 'a') as file:
+        file.write(line)
+    return rotate(filename, max_bytes, generations)
+
+
+if logging:
+    class RotatingFileHandler(logging.Handler):
+        """Logging handler that appends to a size-capped, rotated file."""
+
+        def __init__(self, filename, max_bytes=MAX_BYTES, generations=GENERATIONS):
+            super().__init__()
+            self.filename = filename
+            self.max_bytes = max_bytes
+            self.generations = generations
+
+        def emit(self, record):
+            if record.levelno >= self.level:
+                append_line(self.filename, self.format(record) + '\n',
+                            self.max_bytes, self.generations)
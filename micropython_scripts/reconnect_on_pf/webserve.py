@@ -0,0 +1,178 @@
+"""
+Helpers for the asyncio webservers: stream pages to the client.
+
+A data file is sent in fixed-size chunks through one reusable buffer,
+so serving it takes the same (small) amount of memory no matter how
+large the file has grown.
+
+Machine-readable (json / csv) responses carry an ETag made from a write
+counter, so a client that sends it back in If-None-Match gets a bodiless
+304 Not Modified until something new has been written.
+
+Small pages can be kept rendered (as one bytes object) in a RenderCache,
+keyed on the page and a version counter, so repeated hits on an
+unchanged page cost no file reads and no string building.
+"""
+
+import os
+import random
+
+CHUNK_SIZE = 512
+BOOT_ID = random.getrandbits(16)  # keeps ETags from one boot to the next apart
+RESPONSE_HEADER = 'HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n'
+PAGE_TAIL = """</pre>
+    </body>
+</html>
+"""
+
+_buf = bytearray(CHUNK_SIZE)
+_mv = memoryview(_buf)
+
+
+def parse_request(request_line):
+    """Return (path, {name: value}) from b'GET /path?name=value HTTP/1.1'."""
+    target = request_line.decode().split()[1]
+    path, _, query = target.partition('?')
+    params = {}
+    for item in query.split('&'):
+        name, _, value = item.partition('=')
+        if name:
+            params[name] = value
+    return path, params
+
+
+async def read_headers(reader, *names):
+    """Read the request headers, return {name: value} for the wanted names.
+
+    names are lowercase bytes, e.g. b'if-none-match'.
+    """
+    found = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name in names:
+            found[name] = value.strip().decode()
+    return found
+
+
+def etag(version):
+    """Return an ETag (quoted string) for a write counter value."""
+    return f'"{BOOT_ID:x}-{version}"'
+
+
+def response_header(content_type, tag=None, length=None, status='200 OK'):
+    header = f'HTTP/1.0 {status}\r\nContent-type: {content_type}\r\n'
+    if tag:
+        header += f'ETag: {tag}\r\n'
+    if length is not None:
+        header += f'Content-Length: {length}\r\n'
+    return header + '\r\n'
+
+
+async def send_not_modified(writer, tag):
+    writer.write(f'HTTP/1.0 304 Not Modified\r\nETag: {tag}\r\n\r\n')
+    await writer.drain()
+
+
+async def send_body(writer, body, content_type, tag=None):
+    """Send a complete (small) response body with its Content-Length."""
+    writer.write(response_header(content_type, tag, len(body)))
+    writer.write(body)
+    await writer.drain()
+
+
+async def send_file(writer, filename, start=0, end=None):
+    """Stream bytes start..end (default: to EOF) of filename to writer."""
+    try:
+        f = open(filename, 'rb')
+    except OSError:
+        return  # not written yet (e.g. just rotated): send nothing
+    with f:
+        f.seek(start)
+        remaining = -1 if end is None else end - start
+        while remaining:
+            if 0 < remaining < CHUNK_SIZE:
+                n = f.readinto(_mv[:remaining])
+            else:
+                n = f.readinto(_buf)
+            if not n:
+                break
+            writer.write(_mv[:n])
+            await writer.drain()
+            if remaining > 0:
+                remaining -= n
+
+
+async def send_page(writer, head, filename=None, text='', start=0, end=None,
+                    status='200 OK'):
+    """Send an html page: head, then the file contents, then text."""
+    writer.write(RESPONSE_HEADER if status == '200 OK'
+                 else response_header('text/html', status=status))
+    writer.write(head)
+    if filename:
+        await send_file(writer, filename, start, end)
+    writer.write(text)
+    writer.write(PAGE_TAIL)
+    await writer.drain()
+
+
+def file_size(filename):
+    try:
+        return os.stat(filename)[6]
+    except OSError:
+        return 0
+
+
+class RenderCache:
+    """Rendered pages (bytes) keyed on (endpoint, version).
+
+    Pages larger than max_bytes are streamed by send_page() instead.
+    """
+
+    def __init__(self, max_bytes=4096):
+        self.max_bytes = max_bytes
+        self.pages = {}  # endpoint -> (version, body)
+
+    def get(self, endpoint, version):
+        entry = self.pages.get(endpoint)
+        if entry and entry[0] == version:
+            return entry[1]
+        return None
+
+    def put(self, endpoint, version, body):
+        self.pages.pop(endpoint, None)
+        if len(body) > self.max_bytes:
+            return
+        # Keep the total under max_bytes: drop other pages if need be
+        while self.pages and \
+                sum([len(b) for _, b in self.pages.values()]) + len(body) > self.max_bytes:
+            self.pages.pop(next(iter(self.pages)))
+        self.pages[endpoint] = (version, body)
+
+    def render(self, head, filename=None, text=''):
+        """Return the whole page as bytes, or None if it would be too big."""
+        size = file_size(filename) if filename else 0
+        if len(head) + size + len(text) + len(PAGE_TAIL) > self.max_bytes:
+            return None
+        body = bytearray(head.encode())
+        if filename and size:
+            with open(filename, 'rb') as f:
+                body += f.read()
+        body += text.encode()
+        body += PAGE_TAIL.encode()
+        return bytes(body)
+
+    async def send_page(self, writer, endpoint, version, head, filename=None, text=''):
+        """Send a page from the cache, rendering (and keeping) it if need be."""
+        body = self.get(endpoint, version)
+        if body is None:
+            body = self.render(head, filename, text)
+            if body is None:
+                self.pages.pop(endpoint, None)
+                await send_page(writer, head, filename, text)
+                return
+            self.put(endpoint, version, body)
+        await send_body(writer, body, 'text/html')
@@ -0,0 +1,226 @@
+"""
+Track the RTC's drift against NTP, and correct for it.
+
+The RTC counts whole seconds from the same crystal as ticks_ms(), which
+is off by some ppm (and more so as the room warms or cools). Once an
+hour (say) offset() measures RTC - UTC to well under a ms:
+sntp.measure() gives UTC against ticks_us(), and rtc_edge() finds where
+an RTC second begins against ticks_us(), by polling time.time(): every
+POLL_MS to find it roughly, then every POLL_US (blocking, for a few ms)
+through the next one.
+
+DriftEstimator keeps the last WINDOW of those samples and fits a line
+to them, offset = intercept + ppm * t, with the Theil-Sen estimator:
+the slope is the median of the slopes between every pair of samples,
+the intercept the median of what is left. A bad sample (a slow reply,
+or a poll held up by the web server) moves a median hardly at all,
+where it would pull a least-squares fit, and a window means the fit
+follows the crystal as it warms and cools. Medians are found with
+quickselect in preallocated arrays, so a fit allocates nothing.
+
+The RP2040 RTC's rate can't be trimmed finer than its divider (about 21
+ppm a step), so the correction is made by stepping it: correct_rtc()
+sets it from the fit alone (no NTP needed) once it has drifted by more
+than CORRECT_MS. Steps are tallied (step(), timed with ticks_us() like
+the edges, so their small errors don't add up into a false drift), and
+samples are taken back to the RTC as it would be if it had never been
+set, so the fit carries on across them.
+
+Samples are kept in float32 (7 digits), so with every sample t0 moves up
+to the oldest one kept and the steps are folded into the offsets: times
+stay within the window's span and offsets within its drift, however long
+it runs.
+
+    estimator = DriftEstimator()
+    async with estimator.lock:
+        sample = await sntp.measure()
+        estimator.add(sample.secs, await offset(sample))
+    if estimator.fit():
+        print(estimator.ppm, estimator.predict(time.time()))
+        await correct_rtc(estimator)
+"""
+
+import time
+from array import array
+from machine import RTC
+import uasyncio as asyncio
+
+WINDOW = 48  # samples in the fit (2 days of hourly ones)
+MIN_SAMPLES = 4  # before the fit is used
+MIN_SPAN = 3 * 3600  # s, from the oldest sample to the newest, likewise
+CORRECT_MS = 50  # predicted RTC - UTC for correct_rtc() to step the RTC
+POLL_MS = 1  # of time.time(), to find the RTC's edge roughly ...
+POLL_US = 100  # ... and then exactly
+GUARD_MS = 5  # waited out (blocking) before the edge
+
+
+def median(a, n):
+    """Median of a[:n] (the upper one, for an even n); reorders them."""
+    k = n // 2
+    lo, hi = 0, n - 1
+    while lo < hi:
+        pivot = a[(lo + hi) // 2]
+        i, j = lo, hi
+        while i <= j:
+            while a[i] < pivot:
+                i += 1
+            while a[j] > pivot:
+                j -= 1
+            if i <= j:
+                a[i], a[j] = a[j], a[i]
+                i += 1
+                j -= 1
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            break
+    return a[k]
+
+
+async def rtc_edge():
+    """(ticks_us(), RTC seconds) at the start of an RTC second."""
+    while True:
+        t = time.time()
+        while time.time() == t:
+            await asyncio.sleep_ms(POLL_MS)
+        start = time.ticks_ms()
+        await asyncio.sleep_ms(1000 - GUARD_MS)
+        # (Give up if the edge went by while other tasks ran)
+        t = time.time()
+        while (time.time() == t
+               and time.ticks_diff(time.ticks_ms(), start) < 1000 + GUARD_MS):
+            time.sleep_us(POLL_US)
+        if time.time() != t:
+            return time.ticks_us(), time.time()
+
+
+async def offset(sample):
+    """RTC - UTC (ms, + RTC fast), against an sntp Sample."""
+    t, secs = await rtc_edge()
+    us = sample.us + time.ticks_diff(t, sample.t)
+    return (secs - sample.secs) * 1000 - us / 1000
+
+
+class DriftEstimator:
+    """Theil-Sen fit of RTC - UTC over the last window samples."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.times = array('f', [0.0] * window)  # s, from t0
+        self.offsets = array('f', [0.0] * window)  # ms, less stepped_ms
+        self._slopes = array('f', [0.0] * (window * (window - 1) // 2))
+        self._rest = array('f', [0.0] * window)
+        self.lock = asyncio.Lock()  # held while measuring or stepping the RTC
+        self.reset()
+
+    def reset(self):
+        """Start over (the RTC was set, rather than drifted)."""
+        self.t0 = None  # UTC seconds of the oldest sample
+        self.n = 0  # samples in the window
+        self.pos = 0  # where the next one goes
+        self.stepped_ms = 0  # steps made to the RTC since t0 last moved
+        self.ppm = None  # fitted rate (+ RTC fast), None until fit()
+        self.intercept = 0.0  # ms, fitted offset at t0
+        self.scatter = 0.0  # ms, median distance of the samples from the fit
+        self.span = 0.0  # s, from the oldest sample to the newest
+
+    def add(self, secs, offset_ms):
+        """Take a sample: RTC - UTC was offset_ms at UTC secs."""
+        if self.t0 is None:
+            self.t0 = secs
+        elif self.n:
+            self._rebase()
+        self.times[self.pos] = secs - self.t0
+        self.offsets[self.pos] = offset_ms - self.stepped_ms
+        self.pos = (self.pos + 1) % self.window
+        self.n = min(self.n + 1, self.window)
+
+    def _rebase(self):
+        # Move t0 to the oldest sample kept (the one about to be replaced,
+        # if the window is full, else the first) and fold stepped_ms into
+        # the offsets, keeping the fit's line where it was
+        times, offsets, n = self.times, self.offsets, self.n
+        oldest = times[(self.pos + 1) % self.window if n == self.window else 0]
+        shift = int(oldest)
+        for i in range(n):
+            times[i] -= shift
+            offsets[i] += self.stepped_ms
+        self.t0 += shift
+        if self.ppm is not None:
+            self.intercept += self.ppm / 1000 * shift
+        self.intercept += self.stepped_ms
+        self.stepped_ms = 0
+
+    def step(self, ms):
+        """The RTC was stepped by ms (+ forward)."""
+        self.stepped_ms += ms
+
+    def fit(self):
+        """Fit the samples; True if there are enough for it to be used."""
+        times, offsets, n = self.times, self.offsets, self.n
+        if n < 2:
+            return False
+        slopes = self._slopes
+        m = 0
+        self.span = 0.0
+        for i in range(n):
+            for j in range(i + 1, n):
+                dt = times[j] - times[i]
+                if dt:
+                    slopes[m] = (offsets[j] - offsets[i]) / dt
+                    m += 1
+                    self.span = max(self.span, abs(dt))
+        if not m:
+            return False
+        slope = median(slopes, m)  # ms/s
+        rest = self._rest
+        for i in range(n):
+            rest[i] = offsets[i] - slope * times[i]
+        self.intercept = median(rest, n)
+        for i in range(n):
+            rest[i] = abs(offsets[i] - slope * times[i] - self.intercept)
+        self.scatter = median(rest, n)
+        self.ppm = slope * 1000
+        return self.ready()
+
+    def ready(self):
+        """True if the last fit had enough samples to be used."""
+        return (self.ppm is not None and self.n >= MIN_SAMPLES
+                and self.span >= MIN_SPAN)
+
+    def predict(self, secs):
+        """RTC - UTC (ms) the fit expects at UTC (or RTC) secs."""
+        return (self.intercept + self.ppm / 1000 * (secs - self.t0)
+                + self.stepped_ms)
+
+
+async def correct_rtc(estimator, limit_ms=CORRECT_MS):
+    """Step the RTC by the offset the fit predicts, if that is more than
+    limit_ms. Returns the step made (ms), 0 if none."""
+    if not estimator.ready():
+        return 0
+    async with estimator.lock:
+        return await _step_rtc(estimator, limit_ms)
+
+
+async def _step_rtc(estimator, limit_ms):
+    t, secs = await rtc_edge()
+    predicted = estimator.predict(secs)
+    if abs(predicted) <= limit_ms:
+        return 0
+    # UTC at ticks t was secs less the offset: set the RTC as the next
+    # UTC second begins
+    wait_us = int((predicted % 1000) * 1000)
+    elapsed_ms = time.ticks_diff(time.ticks_us(), t) // 1000
+    await asyncio.sleep_ms(max(0, wait_us // 1000 - GUARD_MS - elapsed_ms))
+    time.sleep_us(max(0, wait_us - time.ticks_diff(time.ticks_us(), t)))
+    new_secs = secs + round((wait_us - predicted * 1000) / 1000000)
+    y, mo, d, h, m, s, wd, _ = time.gmtime(new_secs)
+    t_set = time.ticks_us()
+    RTC().datetime((y, mo, d, wd, h, m, s, 0))
+    # The RTC read secs + the time since the edge; now it reads new_secs
+    step = (new_secs - secs) * 1000 - time.ticks_diff(t_set, t) / 1000
+    estimator.step(step)
+    return step
@@ -1,6 +1,12 @@
 """
 Measure drift of onboard RTC by checking
 NTP time periodically.
+
+Every hour, RTC - UTC is measured to the ms (sntp.py) and logged, and a
+robust line fitted to the last two days of it gives the drift in ppm
+(see drift.py). Every CORRECT_INTERVAL the RTC is stepped back onto UTC
+by what the fit predicts, with no NTP query, so the logged offsets
+show how well the fit alone would keep an app's time.
 """
 
 import gc
@@ -8,19 +14,24 @@ import logging
 import micropython
 from  machine import Pin, RTC
 import network
-from ntptime import settime
 import time
 import _thread
 from secrets import secrets
 import uasyncio as asyncio
 import socket
+from webserve import RenderCache
+from journal import Journal
+from rotate import RotatingFileHandler
+from sched import Scheduler
+import sntp
+from drift import DriftEstimator, offset, correct_rtc
 
 onboard = Pin("LED", Pin.OUT, value=0)
 
 # Set up logging
 logger = logging.getLogger('mylogger')
 logger.setLevel(logging.INFO)
-fh = logging.FileHandler('errorlog.txt')
+fh = RotatingFileHandler('errorlog.txt')  # size-capped, see rotate.py
 logger.addHandler(fh)
 
 # Global values
@@ -28,20 +39,22 @@ gc_text = ''
 DST = True  # daylight time in effect
 DATAFILENAME = 'data.txt'
 LOGFILENAME = 'log.txt'
+FLUSH_INTERVAL = 300  # seconds between journal flushes
+HEARTBEAT_INTERVAL = 5  # seconds between flashes of the LED
+CORRECT_INTERVAL = 600  # seconds between corrections of the RTC from the fit
+MAX_OFFSET_MS = 2000  # RTC - UTC beyond which the RTC is set from NTP
+page_cache = RenderCache()  # the data page, until the next record()
 ssid = secrets['ssid']
 password = secrets['wifi_password']
 tz_offset = secrets['tz_offset']
 if DST:
     tz_offset += 1
 
-html = """<!DOCTYPE html>
+html_head = """<!DOCTYPE html>
 <html>
     <head> <title>RTC Drift</title> </head>
     <body> <h1>RTC Drift</h1>
-        <pre>%s</pre>
-    </body>
-</html>
-"""
+        <pre>"""
 
 def local_hour_to_utc_hour(loc_h):
     utc_h = loc_h - tz_offset
@@ -50,11 +63,12 @@ def local_hour_to_utc_hour(loc_h):
     return utc_h
 
 def record(line):
-    """Combined print and append to data file."""
+    """Combined print and append to data file (through the journal)."""
     print(line)
-    line += '\n'
-    with open(DATAFILENAME, 'a') as file:
-        file.write(line)
+    journal.write(line + '\n')
+
+# Lines for the data file, buffered and written in crc-framed batches
+journal = Journal(DATAFILENAME)
 
 wlan = network.WLAN(network.STA_IF)
 
@@ -87,23 +101,76 @@ async def serve_client(reader, writer):
         while await reader.readline() != b"\r\n":
             pass
 
-        with open(DATAFILENAME) as file:
-            data = file.read()
-
-        data += gc_text
-
-        response = html % (data)
-        writer.write('HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n')
-        writer.write(response)
-
-        await writer.drain()
+        # Rendered once per change of the data file (large files are streamed)
+        journal.flush()
+        await page_cache.send_page(writer, '/', journal.version,
+                                   html_head, DATAFILENAME, gc_text)
         await writer.wait_closed()
         print("Client disconnected")
     except Exception as e:
         logger.error("serve_client error: " + str(e))
 
-async def main():
+# RTC - UTC samples, and the drift fitted to them
+estimator = DriftEstimator()
+
+async def hourly():
+    """Print time every hour, with RTC - UTC and the drift."""
     global gc_text
+    h, m = time.gmtime()[3:5]
+    lh = h + tz_offset  # local hour
+    if lh < 0:
+        lh += 24
+    async with estimator.lock:
+        try:
+            sample = await sntp.measure()
+            rtc_ms = await offset(sample)
+        except OSError as e:
+            record(f"{lh:02}:{m:02} NTP error: {e}")
+        else:
+            line = f"{lh:02}:{m:02} RTC - UTC {rtc_ms:+.1f} ms"
+            if abs(rtc_ms) > MAX_OFFSET_MS:
+                # Not drift (the RTC was never set): set it, and start over
+                await sntp.set_rtc(sample)
+                estimator.reset()
+                sched.resync()
+                line += ", RTC set"
+            else:
+                estimator.add(sample.secs, rtc_ms)
+                if estimator.fit():
+                    line += (f", drift {estimator.ppm:+.2f} ppm (scatter "
+                             f"{estimator.scatter:.1f} ms, {estimator.n} samples)")
+            record(line)
+
+    gc_text = 'free: ' + str(gc.mem_free()) + '\n'
+    gc.collect()
+
+async def correct():
+    """Step the RTC onto UTC by the drift fitted so far."""
+    step = await correct_rtc(estimator)
+    if step:
+        print(f"RTC stepped {step:+.1f} ms")
+        sched.resync()
+
+def daily():
+    """At 4:59 AM (UTC), start a new data file, with the drift."""
+    y, mo, d = time.gmtime()[:3]
+
+    # Start a new data file for today
+    journal.reset('Date: %d/%d/%d\n' % (mo, d, y))
+
+    if estimator.ready():
+        record('Drift = %+.2f ppm, %+.2f seconds per week'
+               % (estimator.ppm, estimator.ppm * 604800 / 1e6))
+
+async def flash_led():
+    onboard.on()
+    await asyncio.sleep(0.1)
+    onboard.off()
+
+# Jobs (above) run at their times by one task, see sched.py
+sched = Scheduler(on_error=logger.error)
+
+async def main():
     print('Connecting to Network...')
     connect_to_network()
 
@@ -115,7 +182,7 @@ async def main():
     # Set RTC to (utc) time from ntp server
     # while rtc.datetime()[0] == 2021:
     try:
-        settime()
+        await sntp.settime()
     except OSError as e:
         print('OSError', e, 'while trying to set rtc')
     print('setting rtc to UTC...')
@@ -127,51 +194,13 @@ async def main():
 
     print('Setting up webserver...')
     asyncio.create_task(asyncio.start_server(serve_client, "0.0.0.0", 80))
-    while True:
-        try:
-            current_time = rtc.datetime()
-            y = current_time[0]  # curr year
-            mo = current_time[1] # current month
-            d = current_time[2]  # current day
-            dow = current_time[3]  # current day 0f week (Sunday=6)
-            h = current_time[4]  # curr hour (UTC)
-            m = current_time[5]  # curr minute
-            s = current_time[6]  # curr second
-            
-            
-            # Print time every hour
-            if not s and not m % 60:
-                try:
-                    lh = h + tz_offset  # local hour
-                    if lh < 0:
-                        lh += 24
-                    record(f"{lh:02}:{m:02}")
-                    
-                    gc_text = 'free: ' + str(gc.mem_free()) + '\n'
-                    gc.collect()
-                except Exception as e:
-                    record(repr(e))
-            
-            # At 4:59 AM (UTC)
-            if h == 4 and m == 59:
-                
-                # Start a new data file for today
-                with open(DATAFILENAME, 'w') as file:
-                    file.write('Date: %d/%d/%d\n' % (mo, d, y))
-                
-                if dow == 0:  # Monday
-                    settime()
-                    drift = s - rtc.datetime()[6]
-                    record('Drift = %s seconds per week' % drift)
-
-        except Exception as e:
-            logger.error("main loop error: " + str(e))
-
-        # Flash LED
-        onboard.on()
-        await asyncio.sleep(0.1)
-        onboard.off()
-        await asyncio.sleep(0.9)
+    asyncio.create_task(journal.run(FLUSH_INTERVAL))
+
+    sched.cron(hourly, minute=0)
+    sched.cron(daily, hour=4, minute=59)
+    sched.every(CORRECT_INTERVAL, correct)
+    sched.every(HEARTBEAT_INTERVAL, flash_led)
+    await sched.run()
 
 try:
     asyncio.run(main())
@@ -0,0 +1,232 @@
+"""
+NTP to the millisecond, for uasyncio.
+
+ntptime.settime() blocks for up to a second, trusts a single packet,
+drops the fraction of the second and ignores the time the packet took
+to arrive, so the RTC can be off by hundreds of ms after every sync.
+
+Here each query timestamps its request and the reply with ticks_us(),
+and uses the server's receive and transmit timestamps, so the round
+trip delay (less the server's own time) is known. Taking the path to be
+symmetric, the UTC at the middle of the exchange is the middle of the
+server's two timestamps. measure() sends a few queries, INTERVAL_MS
+apart (a burst, as ntpd does at start-up), and keeps the one with the
+least delay: queueing on the way only ever adds delay, and it is where
+an asymmetric path distorts the result, so the quickest exchange is the
+most accurate one (NTP's clock filter). The socket is non-blocking and
+polled, so the web server keeps running while a query is out.
+
+SoftClock counts UTC to the ms from ticks_ms(), from those samples. A
+correction of up to STEP_MS is slewed in (MAX_SLEW_PPM), so the time
+never jumps or runs backwards; a bigger one steps it.
+
+    sample = await sntp.settime()  # measure(), set the RTC and sntp.clock
+    print(sample.delay_us, sample.jitter_us, sntp.clock.offset_ms)
+    ms = sntp.clock.now_ms()  # UTC, ms since the epoch
+
+Like ntptime, these raise OSError when no server answers.
+"""
+
+import errno
+import socket
+import struct
+import time
+from machine import RTC
+import uasyncio as asyncio
+
+HOST = 'pool.ntp.org'
+SAMPLES = 4  # queries per measure()
+INTERVAL_MS = 2000  # between them
+TIMEOUT_MS = 1000  # for an answer to a query
+POLL_MS = 1  # for the answer (and so the resolution of its arrival)
+# NTP counts from 1900; time.time() from 1970 (or 2000 on older ports)
+NTP_DELTA = 2208988800 if time.gmtime(0)[0] == 1970 else 3155673600
+STEP_MS = 128  # a bigger offset steps the soft clock, rather than slews it
+MAX_SLEW_PPM = 500  # rate of slewing in a correction (0.5 ms a second)
+REBASE_MS = 86400000  # ticks_diff() only spans a few days
+
+
+def _timestamp(msg, pos):
+    """NTP timestamp at msg[pos:pos + 8] as (seconds since the epoch, us)."""
+    secs, frac = struct.unpack_from('!II', msg, pos)
+    return secs - NTP_DELTA, (frac * 1000000) >> 32
+
+
+class Sample:
+    """One NTP exchange: UTC secs + us was the time at ticks_us() t
+    (ticks_ms() t_ms), the middle of a round trip of delay_us."""
+
+    def __init__(self, t, t_ms, secs, us, delay_us):
+        self.t = t
+        self.t_ms = t_ms
+        self.secs = secs
+        self.us = us
+        self.delay_us = delay_us
+        self.jitter_us = 0  # rms difference of the other samples of a burst
+        self.count = 1  # samples of the burst answered
+
+    def utc_ms(self, t_ms=None):
+        """UTC (ms since the epoch) at ticks_ms() t_ms (default: now)."""
+        if t_ms is None:
+            t_ms = time.ticks_ms()
+        return (self.secs * 1000 + self.us // 1000
+                + time.ticks_diff(t_ms, self.t_ms))
+
+    def offset_us(self, other):
+        """How far other's UTC is ahead of this one's, at the same ticks."""
+        return ((other.secs - self.secs) * 1000000 + other.us - self.us
+                - time.ticks_diff(other.t, self.t))
+
+
+async def query(addr, timeout_ms=TIMEOUT_MS):
+    """One exchange with the server at addr (from getaddrinfo); a Sample."""
+    request = bytearray(48)
+    request[0] = 0x23  # version 4, client
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setblocking(False)
+        t1 = time.ticks_us()
+        # Our transmit timestamp is only a nonce, which the reply must echo
+        struct.pack_into('!II', request, 40, t1, time.ticks_ms())
+        s.sendto(request, addr)
+        while True:
+            try:
+                msg = s.recv(48)
+                break
+            except OSError as e:
+                if e.args[0] != errno.EAGAIN:
+                    raise
+            if time.ticks_diff(time.ticks_us(), t1) > timeout_ms * 1000:
+                raise OSError(errno.ETIMEDOUT)
+            await asyncio.sleep_ms(POLL_MS)
+        t4 = time.ticks_us()
+        t4_ms = time.ticks_ms()
+    finally:
+        s.close()
+    if len(msg) < 48 or msg[24:32] != request[40:48]:
+        raise OSError('bad NTP reply')
+    if not msg[1] or msg[0] & 7 != 4:
+        raise OSError('NTP server not synchronized')
+    secs2, us2 = _timestamp(msg, 32)  # server's receive ...
+    secs3, us3 = _timestamp(msg, 40)  # ... and transmit
+    held = (secs3 - secs2) * 1000000 + us3 - us2
+    trip = time.ticks_diff(t4, t1)
+    # UTC halfway through, at ticks halfway through
+    us2 += held // 2
+    back = trip - trip // 2
+    return Sample(time.ticks_add(t1, trip // 2),
+                  time.ticks_add(t4_ms, -((back + 500) // 1000)),
+                  secs2 + us2 // 1000000, us2 % 1000000, trip - held)
+
+
+async def measure(host=HOST, samples=SAMPLES, interval_ms=INTERVAL_MS):
+    """Query the server samples times; return the Sample with the least
+    delay, its jitter_us the rms difference of the others from it."""
+    addr = socket.getaddrinfo(host, 123)[0][-1]
+    burst = []
+    error = None
+    for i in range(samples):
+        if i:
+            await asyncio.sleep_ms(interval_ms)
+        try:
+            burst.append(await query(addr))
+        except OSError as e:
+            error = e
+    if not burst:
+        raise error
+    best = burst[0]
+    for sample in burst:
+        if sample.delay_us < best.delay_us:
+            best = sample
+    if len(burst) > 1:
+        squares = 0
+        for sample in burst:
+            squares += best.offset_us(sample) ** 2
+        best.jitter_us = int((squares / (len(burst) - 1)) ** 0.5)
+    best.count = len(burst)
+    return best
+
+
+async def set_rtc(sample):
+    """Set the RTC from sample, at the start of a UTC second (the RTC
+    only takes whole seconds)."""
+    await asyncio.sleep_ms(1000 - sample.utc_ms() % 1000)
+    secs = (sample.utc_ms() + 500) // 1000
+    y, mo, d, h, m, s, wd, _ = time.gmtime(secs)
+    RTC().datetime((y, mo, d, wd, h, m, s, 0))
+
+
+class SoftClock:
+    """UTC to the ms, counted by ticks_ms() from NTP samples.
+
+    ppm: the rate of ticks_ms() against UTC (+ runs fast), if known.
+    """
+
+    def __init__(self):
+        self.ticks = None  # anchor: a ticks_ms() value ...
+        self.ms = 0  # ... and the UTC (ms since the epoch) it stands for
+        self.slew_ms = 0  # correction still to slew in, from the anchor on
+        self.ppm = 0.0
+        self.offset_ms = None  # UTC - this clock, at the last sample
+        self.steps = 0
+
+    @property
+    def ready(self):
+        return self.ticks is not None
+
+    def _since(self, elapsed):
+        # (ms counted, ms of the slew applied) elapsed ms after the anchor
+        slew = min(abs(self.slew_ms), max(elapsed, 0) * MAX_SLEW_PPM // 1000000)
+        if self.slew_ms < 0:
+            slew = -slew
+        return elapsed - int(elapsed * self.ppm / 1000000) + slew, slew
+
+    def _rebase(self, t):
+        ms, slew = self._since(time.ticks_diff(t, self.ticks))
+        self.ms += ms
+        self.slew_ms -= slew
+        self.ticks = t
+
+    def now_ms(self, t=None):
+        """UTC (ms since the epoch) at ticks_ms() t (default: now)."""
+        if t is None:
+            t = time.ticks_ms()
+        elapsed = time.ticks_diff(t, self.ticks)
+        if elapsed > REBASE_MS:
+            self._rebase(t)
+            elapsed = 0
+        return self.ms + self._since(elapsed)[0]
+
+    def time(self):
+        """UTC seconds, like time.time()."""
+        return self.now_ms() // 1000
+
+    def adjust(self, sample):
+        """Take an NTP sample: step to it, or slew towards it. Returns
+        the offset found (ms, + clock behind), None when first set."""
+        utc = sample.utc_ms(sample.t_ms)
+        if self.ticks is None:
+            self.ticks, self.ms, self.slew_ms = sample.t_ms, utc, 0
+            self.steps += 1
+            return None
+        self._rebase(sample.t_ms)
+        offset = utc - self.ms
+        if abs(offset) > STEP_MS:
+            self.ms, self.slew_ms = utc, 0
+            self.steps += 1
+        else:
+            self.slew_ms = offset  # (replacing what is left of the last)
+        self.offset_ms = offset
+        return offset
+
+
+clock = SoftClock()
+
+
+async def settime(host=HOST, samples=SAMPLES):
+    """ntptime.settime(), to the ms: measure(), then set the RTC and
+    adjust sntp.clock. Returns the Sample."""
+    sample = await measure(host, samples)
+    clock.adjust(sample)
+    await set_rtc(sample)
+    return sample
@@ -0,0 +1,11 @@
+"""
+Host-side simulator for the Pico W MicroPython projects.
+
+Fakes of machine, network, onewire, ds18x20, ntptime, urequests, rp2,
+uasyncio (and the MicroPython flavours of time and gc) run on a virtual
+clock, so a project's main.py runs on Linux (CPython 3.8+) at many times
+real time. See readme.md.
+"""
+
+from .core import Simulation, SimulationEnd, current
+from .runner import run_project
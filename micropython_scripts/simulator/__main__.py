@@ -0,0 +1,40 @@
+"""
+python3 -m simulator <project folder> [options]
+
+e.g. (from micropython_scripts)  python3 -m simulator temperature --hours 48
+"""
+
+import argparse
+
+from .runner import run_project
+
+parser = argparse.ArgumentParser(
+    prog='python3 -m simulator',
+    description='Run a Pico project (main.py) on Linux against fake hardware.')
+parser.add_argument('project', help='project folder, e.g. temperature')
+parser.add_argument('--hours', type=float, default=24,
+                    help='simulated hours to run (default 24)')
+parser.add_argument('--speed', type=float, default=None,
+                    help='real-time factor (default: as fast as possible)')
+parser.add_argument('--start', default='2023-06-01T12:00',
+                    help='UTC date and time at power-up (YYYY-MM-DDTHH:MM)')
+parser.add_argument('--port', type=int, default=8080,
+                    help='local port standing in for the Pico web server')
+parser.add_argument('--probes', type=int, default=1,
+                    help='number of DS18x20 probes on the 1-wire bus')
+parser.add_argument('--drift-ppm', type=float, default=0.0,
+                    help='RTC rate error in ppm (+ runs fast)')
+parser.add_argument('--pendulum', action='store_true',
+                    help='swing a pendulum past the clock sensor (pin 4, '
+                         'magnet on pin 3) and report the clock error')
+parser.add_argument('--no-trace', action='store_true',
+                    help="don't measure memory use (runs about 5x faster)")
+parser.add_argument('--keep', action='store_true',
+                    help='keep the simulated flash contents')
+parser.add_argument('-v', '--verbose', action='store_true',
+                    help='show the script output (else saved to console.txt)')
+args = parser.parse_args()
+
+run_project(args.project, args.hours, args.speed, args.start, args.port,
+            args.probes, args.drift_ppm, args.keep, args.verbose,
+            pendulum=args.pendulum, trace=not args.no_trace)
@@ -0,0 +1,128 @@
+"""
+The simulated world: one Simulation holds the virtual clock and the
+state of everything outside the Pico (network, 1-wire probes, web
+services), plus the measurements taken while a script runs.
+
+The fake MicroPython modules (simulator.mp.*) all talk to the current
+Simulation, found with current().
+"""
+
+import importlib
+import math
+import random
+import sys
+
+from .vclock import VirtualClock
+
+# MicroPython modules replaced by the fakes in simulator.mp
+FAKE_MODULES = ('time', 'gc', 'micropython', 'machine', 'network', 'rp2',
+                'onewire', 'ds18x20', 'ntptime', 'urequests', 'uasyncio',
+                'secrets', 'socket')
+
+_current = None
+
+
+def current():
+    """Return the running Simulation."""
+    if _current is None:
+        raise RuntimeError('no simulation installed')
+    return _current
+
+
+class SimulationEnd(BaseException):
+    """Raised when virtual time runs out (not caught by 'except Exception')."""
+
+
+def room_temperature(utc):
+    """Default temperature model (deg C): daily swing, warmest at 17:00 UTC."""
+    hours = (utc % 86400) / 3600
+    return 27.0 + 4.0 * math.cos((hours - 17) * math.pi / 12)
+
+
+class Stats:
+    """Measurements collected while a script runs."""
+
+    def __init__(self):
+        self.sleeps = 0  # asyncio sleeps completed
+        self.max_late = 0.0  # worst lateness of an asyncio sleep (s)
+        self.total_late = 0.0
+        self.blocked = 0.0  # virtual seconds spent in blocking time.sleep()
+        self.max_blocked = 0.0  # longest single blocking sleep
+        self.requests = []  # (url, status) of every urequests call
+        self.served = 0  # http responses served
+
+    def sleep_done(self, late):
+        self.sleeps += 1
+        self.total_late += late
+        if late > self.max_late:
+            self.max_late = late
+
+    def blocking_sleep(self, seconds):
+        self.blocked += seconds
+        if seconds > self.max_blocked:
+            self.max_blocked = seconds
+
+
+class Simulation:
+    """Virtual clock plus the world around the Pico.
+
+    start_utc   true UTC (seconds since 1970) at power-up
+    duration    virtual seconds to run before SimulationEnd
+    speed       None to run as fast as possible, else the real-time factor
+    http_port   port on 127.0.0.1 that stands in for the Pico's port 80
+    """
+
+    def __init__(self, start_utc, duration, speed=None, http_port=8080,
+                 probes=1, drift_ppm=0.0):
+        self.clock = VirtualClock(start_utc, drift_ppm)
+        self.duration = duration
+        self.speed = speed
+        self.http_port = http_port
+        self.stats = Stats()
+        self.network_up = True
+        self.temperature = room_temperature  # f(utc) -> deg C
+        self.probe_offsets = [0.25 * i for i in range(probes)]
+        self.roms = [bytearray([0x28, i + 1, 0, 0, 0, 0, 0, 0x10 + i])
+                     for i in range(probes)]
+        self.routes = []  # (url prefix, handler(url) -> (status, text))
+        self.host_latency = {}  # host -> reply delay (s), None: no reply
+        self.queueing = 0.01  # s, mean random extra delay of a UDP packet, each way
+        self.random = random.Random(1)
+        self.server = None  # the script's web server
+        self.pins = {}  # pin id -> machine.Pin
+        self.pendulum = None  # see pendulum.py
+        self.mem_free = 170000  # what gc.mem_free() reports
+        self.secrets = {
+            'ssid': 'sim-ssid',
+            'wifi_password': 'sim-password',
+            'password': 'sim-password',
+            'tz_offset': -5,
+            'lat': 42.5,
+            'long': -71.1,
+        }
+
+    @property
+    def end(self):
+        return self.duration
+
+    def check_end(self):
+        if self.clock.mono >= self.duration:
+            raise SimulationEnd()
+
+    def route(self, prefix, handler):
+        """Answer urequests for URLs starting with prefix."""
+        self.routes.insert(0, (prefix, handler))
+
+    def latency(self, host):
+        """Seconds a simulated host takes to answer (None: it never does)."""
+        return self.host_latency.get(host, 0.05)
+
+    def install(self):
+        """Make this the current simulation and swap in the fake modules."""
+        global _current
+        _current = self
+        # Import all the fakes first, so they can still import the real
+        # (CPython) modules they are built on, then swap them in
+        fakes = {name: importlib.import_module('simulator.mp.' + name)
+                 for name in FAKE_MODULES}
+        sys.modules.update(fakes)
@@ -0,0 +1,6 @@
+"""
+Drop-in fakes of the MicroPython modules used by the Pico scripts.
+
+Simulation.install() puts each of these in sys.modules under its
+MicroPython name (machine, network, uasyncio, ...).
+"""
@@ -0,0 +1,39 @@
+"""
+Fake ds18x20 module.
+
+convert_temp() samples the temperature model for every probe on the
+bus. Like the real sensor, reading a probe before the 750 ms
+conversion has finished returns the power-on value 85.0.
+"""
+
+from ..core import current
+
+CONVERSION_TIME = 0.75
+POWER_ON_VALUE = 85.0
+
+
+class DS18X20:
+
+    def __init__(self, onewire):
+        self.ow = onewire
+        self._done = None  # virtual time the conversion completes
+        self._temps = {}
+
+    def scan(self):
+        return [rom for rom in self.ow.scan() if rom[0] in (0x10, 0x22, 0x28)]
+
+    def convert_temp(self):
+        sim = current()
+        self._done = sim.clock.mono + CONVERSION_TIME
+        base = sim.temperature(sim.clock.utc())
+        self._temps = {bytes(rom): round((base + offset) * 16) / 16
+                       for rom, offset in zip(sim.roms, sim.probe_offsets)}
+
+    def read_temp(self, rom):
+        sim = current()
+        rom = bytes(rom)
+        if rom not in [bytes(r) for r in sim.roms]:
+            raise Exception('CRC error')
+        if self._done is None or sim.clock.mono < self._done:
+            return POWER_ON_VALUE
+        return self._temps[rom]
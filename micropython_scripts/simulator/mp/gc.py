@@ -0,0 +1,28 @@
+"""
+Fake MicroPython gc module: CPython's gc plus mem_free() / mem_alloc().
+
+mem_free() reports Simulation.mem_free less the Python memory currently
+traced (if tracemalloc is running), so growth shows up on the web pages.
+"""
+
+import tracemalloc
+
+from ..core import current
+
+from gc import *  # noqa: F401,F403
+
+HEAP_SIZE = 192 * 1024
+
+
+def mem_alloc():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return HEAP_SIZE - current().mem_free
+
+
+def mem_free():
+    return max(0, HEAP_SIZE - mem_alloc())
+
+
+def threshold(amount=None):
+    return -1
@@ -0,0 +1,196 @@
+"""
+Fake machine module: Pin, RTC, ADC, I2C, Timer and reset().
+
+Input pins read a level the simulation drives with Pin.drive(), which
+also fires the pin's irq handler on a matching edge. Output pins just
+remember their value (and when it last changed).
+"""
+
+import calendar
+import time as _time
+
+from ..core import current
+
+
+class Reset(BaseException):
+    """Raised by machine.reset() (the real one never returns)."""
+
+
+def reset():
+    raise Reset()
+
+
+soft_reset = reset
+
+
+def freq(hz=None):
+    return 125_000_000
+
+
+def unique_id():
+    return b'\xe6\x61\x41\x04\x03\x5a\x2c\x2f'
+
+
+def idle():
+    pass
+
+
+def lightsleep(ms=None):
+    from . import time
+    time.sleep_ms(ms or 0)
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=IN, pull=None, value=None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = value if value is not None else (
+            1 if pull == self.PULL_UP else 0)
+        self._handler = None
+        self._trigger = 0
+        self.changed = 0.0  # virtual time of the last change
+        current().pins[id] = self
+
+    def init(self, mode=IN, pull=None, value=None):
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self._value = value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        v = 1 if v else 0
+        if v != self._value:
+            self._value = v
+            self.changed = current().clock.mono
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(not self._value)
+
+    high = on
+    low = off
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self._handler = handler
+        self._trigger = trigger
+
+    def drive(self, level):
+        """Simulation side: set an input's level, firing its irq on an edge."""
+        level = 1 if level else 0
+        if level == self._value:
+            return
+        self._value = level
+        self.changed = current().clock.mono
+        edge = self.IRQ_RISING if level else self.IRQ_FALLING
+        if self._handler and self._trigger & edge:
+            self._handler(self)
+
+
+class RTC:
+    """The Pico RTC: (year, month, day, weekday, hours, minutes, seconds, subseconds)"""
+
+    def datetime(self, dt=None):
+        clock = current().clock
+        if dt is None:
+            secs = clock.rtc()
+            y, mo, d, h, m, s, wd, *_ = _gmtime(int(secs))
+            return (y, mo, d, wd, h, m, s, 0)
+        y, mo, d, wd, h, m, s, *_ = dt
+        clock.set_rtc(calendar.timegm((y, mo, d, h, m, s)))
+
+
+def _gmtime(secs):
+    t = _time.gmtime(secs)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec,
+            t.tm_wday)
+
+
+class ADC:
+    """ADC(4) is the RP2040's temperature sensor, following the room model."""
+
+    def __init__(self, pin):
+        self.pin = pin
+
+    def read_u16(self):
+        sim = current()
+        if self.pin == 4:
+            volts = 0.706 - (sim.temperature(sim.clock.utc()) - 27) * 0.001721
+        else:
+            volts = 1.65
+        return int(volts / 3.3 * 65535)
+
+
+class I2C:
+    """An I2C bus with nothing on it."""
+
+    def __init__(self, id, scl=None, sda=None, freq=400000):
+        self.id = id
+
+    def scan(self):
+        return []
+
+    def writeto(self, addr, buf, stop=True):
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return bytes(nbytes)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        return bytes(nbytes)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        pass
+
+
+class Timer:
+    """Periodic / one-shot callbacks on the virtual clock (via the event loop)."""
+
+    PERIODIC = 1
+    ONE_SHOT = 0
+
+    def __init__(self, id=-1, mode=PERIODIC, period=-1, freq=None, callback=None):
+        self._handle = None
+        if callback:
+            self.init(mode=mode, period=period, freq=freq, callback=callback)
+
+    def init(self, mode=PERIODIC, period=-1, freq=None, callback=None):
+        import asyncio
+        self.deinit()
+        if freq:
+            period = 1000 / freq
+        self._period = period / 1000
+        self._mode = mode
+        self._callback = callback
+        self._loop = asyncio.get_event_loop()
+        self._handle = self._loop.call_later(self._period, self._fire)
+
+    def _fire(self):
+        if self._mode == self.PERIODIC:
+            self._handle = self._loop.call_later(self._period, self._fire)
+        else:
+            self._handle = None
+        self._callback(self)
+
+    def deinit(self):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
@@ -0,0 +1,27 @@
+"""Fake micropython module."""
+
+from . import gc
+
+
+def const(value):
+    return value
+
+
+def mem_info(verbose=None):
+    print(f'stack: 0 out of 7936\nGC: total: {gc.HEAP_SIZE}, '
+          f'used: {gc.mem_alloc()}, free: {gc.mem_free()}')
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def schedule(func, arg):
+    func(arg)
+
+
+def native(func):
+    return func
+
+
+viper = native
@@ -0,0 +1,60 @@
+"""
+Fake network module: a WLAN interface that connects whenever the
+simulated network is up (Simulation.network_up).
+"""
+
+from ..core import current
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_GOT_IP = 3
+STAT_CONNECT_FAIL = -1
+STAT_NO_AP_FOUND = -2
+STAT_WRONG_PASSWORD = -3
+
+
+class WLAN:
+
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._connected = False
+        self._config = {}
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config.get(args[0])
+        self._config.update(kwargs)
+
+    def connect(self, ssid=None, key=None):
+        self._connected = self._active and current().network_up
+
+    def disconnect(self):
+        self._connected = False
+
+    def isconnected(self):
+        # The link drops when the simulated network goes down
+        if not current().network_up:
+            self._connected = False
+        return self._connected
+
+    def status(self, param=None):
+        if param == 'rssi':
+            return -55
+        if self.isconnected():
+            return STAT_GOT_IP
+        return STAT_NO_AP_FOUND if self._active else STAT_IDLE
+
+    def ifconfig(self, config=None):
+        return ('192.168.1.99', '255.255.255.0', '192.168.1.1', '192.168.1.1')
+
+    def scan(self):
+        return []
@@ -0,0 +1,23 @@
+"""
+Fake ntptime module. settime() sets the RTC to true UTC, truncated to
+whole seconds as the real one is; it raises OSError when the network
+is down.
+"""
+
+from ..core import current
+
+host = 'pool.ntp.org'
+timeout = 1
+NTP_DELTA = 0  # the simulated epoch is 1970, like time.time()
+
+
+def time():
+    sim = current()
+    if not sim.network_up:
+        raise OSError(110)  # ETIMEDOUT
+    return int(sim.clock.utc())
+
+
+def settime():
+    t = time()
+    current().clock.set_rtc(t)
@@ -0,0 +1,22 @@
+"""Fake onewire module: a bus carrying the simulation's DS18x20 probes."""
+
+from ..core import current
+
+
+class OneWireError(Exception):
+    pass
+
+
+class OneWire:
+    SEARCH_ROM = 0xF0
+    MATCH_ROM = 0x55
+    SKIP_ROM = 0xCC
+
+    def __init__(self, pin):
+        self.pin = pin
+
+    def scan(self):
+        return [bytearray(rom) for rom in current().roms]
+
+    def reset(self, required=False):
+        return bool(current().roms)
@@ -0,0 +1,5 @@
+"""Stand-in for the secrets.py kept (untracked) on each Pico."""
+
+from ..core import current
+
+secrets = current().secrets
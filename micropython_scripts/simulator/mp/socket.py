@@ -0,0 +1,108 @@
+"""
+Fake socket module: UDP to port 123 is answered by a simulated NTP server.
+
+The server's answer carries true UTC (the virtual clock's) at the moment
+it is sent, to the microsecond; the query and the answer each take half
+of Simulation.latency(host), plus a random queueing delay (exponential,
+mean Simulation.queueing), so the path is a little asymmetric. A
+blocking recv() waits for the answer as time.sleep() does; a
+non-blocking one raises EAGAIN until it has arrived. Every other socket
+is a real one.
+"""
+
+import errno
+import socket as _socket
+import struct
+
+from ..core import current
+
+# Everything CPython has, so stdlib modules imported later still work
+from socket import *  # noqa: F401,F403
+
+NTP_PORT = 123
+NTP_DELTA = 2208988800  # 1900 -> 1970
+
+
+def __getattr__(name):
+    return getattr(_socket, name)
+
+
+def getaddrinfo(host, port, *args, **kwargs):
+    if port == NTP_PORT:
+        # No DNS for the simulated server
+        return [(AF_INET, SOCK_DGRAM, 0, '', (host, port))]
+    return _socket.getaddrinfo(host, port, *args, **kwargs)
+
+
+def socket(af=AF_INET, type=SOCK_STREAM, proto=0):
+    if type == SOCK_DGRAM:
+        return NtpSocket()
+    return _socket.socket(af, type, proto)
+
+
+def _wait(seconds):
+    from . import time
+    time.sleep(seconds)
+
+
+def _queueing(sim):
+    return sim.random.expovariate(1 / sim.queueing) if sim.queueing else 0.0
+
+
+class NtpSocket:
+    """A UDP socket whose only peer is the simulated NTP server."""
+
+    def __init__(self):
+        self.timeout = None  # (0: non-blocking)
+        self.host = None
+        self.reply = None  # (mono it arrives, bytes), None: no answer coming
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def setblocking(self, flag):
+        self.timeout = None if flag else 0
+
+    def sendto(self, data, addr):
+        sim = current()
+        self.host, port = addr[:2]
+        latency = sim.latency(self.host)
+        self.reply = None
+        if port != NTP_PORT or not sim.network_up or latency is None:
+            return len(data)
+        # Each way: half the latency, plus queueing (random, never negative)
+        up = latency / 2 + _queueing(sim)
+        down = latency / 2 + _queueing(sim)
+        utc = sim.clock.utc() + up + NTP_DELTA
+        secs = int(utc)
+        stamp = struct.pack('!II', secs, int((utc - secs) * (1 << 32)))
+        reply = bytearray(48)
+        reply[0] = 0x24  # version 4, server
+        reply[1] = 2  # stratum
+        reply[24:32] = data[40:48]  # originate: the client's transmit
+        reply[32:40] = stamp  # receive
+        reply[40:48] = stamp  # transmit
+        self.reply = (sim.clock.mono + up + down, bytes(reply))
+        return len(data)
+
+    def recv(self, n):
+        sim = current()
+        if self.timeout == 0:
+            if self.reply is None or sim.clock.mono < self.reply[0]:
+                raise OSError(errno.EAGAIN)
+        elif (self.reply is None or (self.timeout is not None
+                                     and self.reply[0] - sim.clock.mono > self.timeout)):
+            _wait(self.timeout or 1)
+            raise OSError(errno.ETIMEDOUT)
+        else:
+            _wait(self.reply[0] - sim.clock.mono)
+        reply = self.reply[1]
+        self.reply = None
+        return reply[:n]
+
+    def recvfrom(self, n):
+        host = self.host
+        return self.recv(n), (host, NTP_PORT)
+
+    def close(self):
+        pass
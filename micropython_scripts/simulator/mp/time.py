@@ -0,0 +1,85 @@
+"""
+Fake MicroPython time module, running on the virtual clock.
+
+time() / localtime() read the Pico RTC (UTC on a Pico W); ticks_*()
+count from power-up and wrap like the real ones do. A blocking sleep()
+advances the virtual clock (and is counted as time the event loop
+could not run).
+"""
+
+import calendar
+import time as _time
+
+from ..core import current
+
+# Everything CPython has, so stdlib modules imported later still work
+from time import *  # noqa: F401,F403
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+monotonic = _time.monotonic
+perf_counter = _time.perf_counter
+
+
+def time():
+    return int(current().clock.rtc())
+
+
+def time_ns():
+    return int(current().clock.rtc() * 1e9)
+
+
+def localtime(secs=None):
+    """(year, month, mday, hour, minute, second, weekday, yearday)"""
+    if secs is None:
+        secs = time()
+    t = _time.gmtime(int(secs))
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec,
+            t.tm_wday, t.tm_yday)
+
+
+gmtime = localtime
+
+
+def mktime(t):
+    return calendar.timegm(tuple(t[:6]) + (0, 0, 0))
+
+
+def sleep(seconds):
+    sim = current()
+    sim.stats.blocking_sleep(seconds)
+    sim.clock.advance(seconds)
+    sim.check_end()
+
+
+def sleep_ms(ms):
+    sleep(ms / 1000)
+
+
+def sleep_us(us):
+    sleep(us / 1_000_000)
+
+
+def ticks_ms():
+    return int(current().clock.mono * 1000) & TICKS_MAX
+
+
+def ticks_us():
+    return int(current().clock.mono * 1_000_000) & TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & TICKS_MAX
+    if diff >= TICKS_HALFPERIOD:
+        diff -= TICKS_PERIOD
+    return diff
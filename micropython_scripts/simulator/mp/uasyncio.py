@@ -0,0 +1,270 @@
+"""
+Fake uasyncio module: CPython asyncio running on the virtual clock.
+
+The event loop asks its selector to wait until the next timer is due;
+the virtual selector polls the real sockets (so the simulated web server
+can be reached on 127.0.0.1:http_port) and then advances the virtual
+clock by the whole timeout instead of waiting for it. With a speed
+factor set, it also waits timeout / speed of real time.
+
+open_connection() to any host other than localhost is answered in
+process by the simulation's routes (see urequests), after
+Simulation.latency(host) seconds of virtual time.
+"""
+
+import asyncio as _asyncio
+import selectors
+import time as _time
+
+from ..core import current, SimulationEnd
+
+CancelledError = _asyncio.CancelledError
+TimeoutError = _asyncio.TimeoutError
+Event = _asyncio.Event
+Lock = _asyncio.Lock
+gather = _asyncio.gather
+wait_for = _asyncio.wait_for
+current_task = _asyncio.current_task
+Task = _asyncio.Task
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    """A selector whose waiting is done by advancing the virtual clock."""
+
+    loop = None  # the VirtualLoop using it
+
+    def select(self, timeout=None):
+        sim = current()
+        clock = sim.clock
+        if sim.speed:
+            following = clock.next_event()
+            if following is not None:
+                # Wake up for the next pin edge (its irq may wake a task)
+                until = max(0.0, following - clock.mono)
+                timeout = until if timeout is None else min(timeout, until)
+        else:
+            # Run the hardware events due before the next timer, but stop
+            # at one that gives the loop work (an irq waking a task)
+            while clock.events:
+                step = max(0.0, clock.next_event() - clock.mono)
+                if timeout is not None and step > timeout:
+                    break
+                clock.advance(step)
+                if timeout is not None:
+                    timeout -= step
+                if self.loop._ready:
+                    return super().select(0)
+        if timeout is None:
+            # Nothing is scheduled, only real sockets can wake us up
+            return super().select(0.1)
+        if sim.speed:
+            start = _time.monotonic()
+            events = super().select(timeout / sim.speed)
+            if events:
+                clock.advance((_time.monotonic() - start) * sim.speed)
+                return events
+        else:
+            events = super().select(0)
+            if events:
+                return events
+        clock.advance(timeout)
+        return []
+
+
+class VirtualLoop(_asyncio.SelectorEventLoop):
+
+    def __init__(self):
+        super().__init__(VirtualSelector())
+        self._selector.loop = self
+
+    def time(self):
+        return current().clock.mono
+
+
+def new_event_loop():
+    loop = VirtualLoop()
+    _asyncio.set_event_loop(loop)
+    return loop
+
+
+def get_event_loop(runq_len=0, waitq_len=0):
+    return _asyncio.get_event_loop()
+
+
+def create_task(coro):
+    return _asyncio.get_event_loop().create_task(coro)
+
+
+def run(coro):
+    """Run coro until it returns or the simulated duration is up.
+
+    Raises SimulationEnd when time runs out.
+    """
+    sim = current()
+    loop = new_event_loop()
+    task = loop.create_task(coro)
+    task.add_done_callback(lambda t: loop.stop())
+    loop.call_at(sim.duration, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        pending = _asyncio.all_tasks(loop)
+        for t in pending:
+            t.cancel()
+        loop.run_until_complete(_asyncio.gather(*pending, return_exceptions=True))
+        if sim.server:
+            sim.server.close()
+            sim.server = None
+        loop.close()
+    if not task.done() or task.cancelled():
+        raise SimulationEnd()
+    return task.result()
+
+
+async def sleep(t):
+    clock = current().clock
+    target = clock.mono + t
+    await _asyncio.sleep(t)
+    current().stats.sleep_done(clock.mono - target)
+
+
+async def sleep_ms(ms):
+    await sleep(ms / 1000)
+
+
+async def wait_for_ms(aw, timeout):
+    return await wait_for(aw, timeout / 1000)
+
+
+class ThreadSafeFlag:
+    """Flag set from an irq handler (or anywhere) and awaited by one task."""
+
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+class StreamWriter:
+    """Wrap an asyncio StreamWriter to behave like the uasyncio one."""
+
+    def __init__(self, writer):
+        self._w = writer
+
+    def write(self, buf):
+        if isinstance(buf, str):
+            buf = buf.encode()
+        self._w.write(bytes(buf))
+
+    async def drain(self):
+        await self._w.drain()
+
+    async def awrite(self, buf):
+        self.write(buf)
+        await self.drain()
+
+    def close(self):
+        self._w.close()
+
+    async def wait_closed(self):
+        # uasyncio closes the stream here
+        self._w.close()
+        try:
+            await self._w.wait_closed()
+        except ConnectionError:
+            pass
+
+    def get_extra_info(self, name, default=None):
+        return self._w.get_extra_info(name, default)
+
+
+async def start_server(callback, host, port, backlog=5):
+    """Serve on 127.0.0.1:Simulation.http_port in place of host:port."""
+    sim = current()
+
+    async def handler(reader, writer):
+        sim.stats.served += 1
+        await callback(reader, StreamWriter(writer))
+
+    sim.server = await _asyncio.start_server(handler, '127.0.0.1', sim.http_port)
+    print(f'[sim] serving {host}:{port} on http://127.0.0.1:{sim.http_port}')
+    return sim.server
+
+
+class _VirtualHostWriter:
+    """Writer end of a connection to a simulated host.
+
+    Collects each request and feeds the routed response into the reader.
+    """
+
+    def __init__(self, host, port, reader):
+        self.host = host
+        self.port = port
+        self.reader = reader
+        self.buf = b''
+        self.closed = False
+
+    def write(self, buf):
+        if isinstance(buf, str):
+            buf = buf.encode()
+        self.buf += bytes(buf)
+        while b'\r\n\r\n' in self.buf:
+            head, _, self.buf = self.buf.partition(b'\r\n\r\n')
+            self._respond(head)
+
+    def _respond(self, head):
+        sim = current()
+        request_line = head.split(b'\r\n')[0].decode()
+        path = request_line.split()[1]
+        url = f'http://{self.host}{path}'
+        for prefix, handler in sim.routes:
+            if url.startswith(prefix):
+                status, text = handler(url)
+                break
+        else:
+            status, text = 404, 'Not Found'
+        sim.stats.requests.append((url, status))
+        body = text.encode()
+        response = (f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                    f'Content-Length: {len(body)}\r\n'
+                    'Connection: keep-alive\r\n\r\n').encode() + body
+        delay = sim.latency(self.host)
+        if delay is None:
+            return  # the host never answers
+        _asyncio.get_event_loop().call_later(delay, self._deliver, response)
+
+    def _deliver(self, response):
+        if not self.closed:
+            self.reader.feed_data(response)
+
+    async def drain(self):
+        await _asyncio.sleep(0)
+
+    async def awrite(self, buf):
+        self.write(buf)
+
+    def close(self):
+        self.closed = True
+        self.reader.feed_eof()
+
+    async def wait_closed(self):
+        self.close()
+
+
+async def open_connection(host, port, ssl=None):
+    sim = current()
+    if host in ('127.0.0.1', 'localhost'):
+        reader, writer = await _asyncio.open_connection(host, port)
+        return reader, StreamWriter(writer)
+    if not sim.network_up:
+        raise OSError(-2)  # host unreachable
+    reader = _asyncio.StreamReader()
+    return reader, _VirtualHostWriter(host, port, reader)
@@ -0,0 +1,57 @@
+"""
+Fake urequests module. Requests are answered by the handlers registered
+with Simulation.route(prefix, handler); handler(url) returns
+(status code, text). Unknown URLs get a 404, and every request raises
+OSError while the simulated network is down.
+"""
+
+import json as _json
+
+from ..core import current
+
+
+class Response:
+
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+        self.headers = headers or {}
+        self.reason = b'OK' if status_code == 200 else b''
+
+    def json(self):
+        return _json.loads(self.text)
+
+    def close(self):
+        pass
+
+
+def request(method, url, data=None, json=None, headers=None, timeout=None):
+    sim = current()
+    if not sim.network_up:
+        sim.stats.requests.append((url, None))
+        raise OSError(-2)  # host unreachable
+    for prefix, handler in sim.routes:
+        if url.startswith(prefix):
+            status, text = handler(url)
+            break
+    else:
+        status, text = 404, 'Not Found'
+    sim.stats.requests.append((url, status))
+    return Response(status, text)
+
+
+def get(url, **kw):
+    return request('GET', url, **kw)
+
+
+def post(url, **kw):
+    return request('POST', url, **kw)
+
+
+def put(url, **kw):
+    return request('PUT', url, **kw)
+
+
+def head(url, **kw):
+    return request('HEAD', url, **kw)
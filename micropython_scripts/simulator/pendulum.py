@@ -0,0 +1,129 @@
+"""
+A grandfather clock's pendulum, for running the clock project.
+
+The pendulum ticks 66 times a minute (a swing is 10/11 s), passing the
+IR sensor at the bottom of every swing: the sensor pin goes low for
+PULSE seconds, firing the script's irq at the exact virtual time (see
+VirtualClock.at()). Its period is set by:
+
+* slow: the bias it is adjusted to, in s/h (2.0: loses 2 s an hour)
+* boost: the gain with the electro-magnet on, in s/h (8.0: gains 8 s an
+  hour). The magnet pulls as the bob comes down to the bottom, so its
+  state halfway through a swing sets that swing's period
+* beat_us: escapement beat error, tick and tock swings differing by it
+* fm_us: random variation of each swing's period (the escapement's
+  impulse isn't quite the same every time)
+* jitter_us: timing noise of the sensor's edge (not of the pendulum)
+* temp_coeff: change of period per deg C of the room (sim.temperature),
+  from 20 deg C: 6e-6 for a steel rod, about 0.5 s/day per deg C
+
+The clock's error (hands - UTC, + fast) is recorded at every tick,
+counted from the first tick; the runner reports it, hour by hour.
+"""
+
+import math
+import random
+
+TICK = 60 / 66  # s, nominal swing
+PULSE = 0.03  # s, sensor low while the rod passes
+SENSOR_PIN = 4
+MAGNET_PIN = 3
+REFERENCE_TEMP = 20.0  # deg C at which the bias is measured
+
+
+class Pendulum:
+    """Ticks on the sensor pin, sped up by the magnet pin."""
+
+    def __init__(self, sim, slow=2.0, boost=8.0, beat_us=500, fm_us=30,
+                 jitter_us=100, temp_coeff=6e-6, seed=1,
+                 sensor=SENSOR_PIN, magnet=MAGNET_PIN):
+        self.sim = sim
+        self.slow = slow
+        self.boost = boost
+        self.beat_us = beat_us
+        self.fm_us = fm_us
+        self.jitter_us = jitter_us
+        self.temp_coeff = temp_coeff
+        self.random = random.Random(seed)
+        self.sensor = sensor
+        self.magnet = magnet
+        self.n = 0  # swings so far
+        self.first = None  # mono of the first tick
+        self.tick_time = 0.0  # mono of the latest tick
+        self.samples = []  # (mono, error s, magnet on) at every tick
+        self.on = False  # magnet, during the current swing
+        self.on_swings = 0
+        sim.pendulum = self
+        self._schedule(0.5)
+
+    def _pin(self, pin_id):
+        return self.sim.pins.get(pin_id)  # (None until main.py makes it)
+
+    def _schedule(self, tick_time):
+        """Set up the next tick (the rod at the bottom) at tick_time."""
+        clock = self.sim.clock
+        clock.at(tick_time, self._tick)
+        # The sensor sees the rod a little early or late
+        edge = tick_time + self.random.gauss(0, self.jitter_us) / 1e6
+        clock.at(edge, lambda: self._drive(0))
+        clock.at(edge + PULSE, lambda: self._drive(1))
+
+    def _tick(self):
+        clock = self.sim.clock
+        self.tick_time = clock.mono
+        if self.first is None:
+            self.first = self.tick_time
+        else:
+            self.n += 1
+        error = self.n * TICK - (self.tick_time - self.first)
+        self.samples.append((self.tick_time, error, self.on))
+        clock.at(self.tick_time + TICK / 2, self._halfway)
+
+    def _drive(self, level):
+        pin = self._pin(self.sensor)
+        if pin:
+            pin.drive(level)
+
+    def _halfway(self):
+        magnet = self._pin(self.magnet)
+        self.on = bool(magnet and magnet.value())
+        self.on_swings += self.on
+        rate = -self.boost if self.on else self.slow  # s/h lost
+        temp = self.sim.temperature(self.sim.clock.utc())
+        period = TICK * (1 + rate / 3600
+                         + self.temp_coeff * (temp - REFERENCE_TEMP))
+        period += (self.beat_us / 2 if self.n % 2 else -self.beat_us / 2) / 1e6
+        period += self.random.gauss(0, self.fm_us) / 1e6
+        self._schedule(self.tick_time + period)
+
+    def report(self, settle=3600):
+        """Lines of text: the clock's error, overall (after settle
+        seconds) and hour by hour."""
+        lines = [f'pendulum: {self.n} swings, magnet on for '
+                 f'{100 * self.on_swings / max(self.n, 1):.1f}%']
+        settled = [e for t, e, _ in self.samples if t >= settle]
+        if settled:
+            mean = sum(settled) / len(settled)
+            sd = math.sqrt(sum((e - mean) ** 2 for e in settled) / len(settled))
+            lines.append(f'clock error after {settle / 3600:g} h: mean {mean * 1000:+.1f} ms, '
+                         f'sd {sd * 1000:.1f} ms, min {min(settled) * 1000:+.1f} ms, '
+                         f'max {max(settled) * 1000:+.1f} ms')
+        lines.append('  hour    mean ms    min ms    max ms  magnet %')
+        hour = []
+        for i, (t, e, on) in enumerate(self.samples):
+            hour.append((e, on))
+            following = self.samples[i + 1][0] if i + 1 < len(self.samples) else None
+            if following is None or int(following // 3600) != int(t // 3600):
+                errors = [e for e, _ in hour]
+                lines.append(f'{int(t // 3600):6} {sum(errors) / len(errors) * 1000:+10.1f}'
+                             f' {min(errors) * 1000:+9.1f} {max(errors) * 1000:+9.1f}'
+                             f' {100 * sum(on for _, on in hour) / len(hour):9.1f}')
+                hour = []
+        return lines
+
+    def write_csv(self, filename):
+        """Every tick: seconds since power-up, error (s), magnet on."""
+        with open(filename, 'w') as f:
+            f.write('time,error,magnet\n')
+            for t, e, on in self.samples:
+                f.write(f'{t:.6f},{e:.6f},{int(on)}\n')
@@ -0,0 +1,161 @@
+"""
+Run one of the Pico projects (its main.py) under the simulator.
+
+The project folder is copied into a scratch directory (the Pico's flash),
+the fake modules are installed, and main.py is run until the simulated
+duration is up. A report of loop latency, blocking time, memory and
+network use is printed at the end.
+"""
+
+import calendar
+import contextlib
+import io
+import json
+import math
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Import the real stdlib modules the scripts (or their libraries) use
+# before the fakes are installed, so those keep the real 'time' module
+import array  # noqa: F401
+import binascii  # noqa: F401
+import heapq  # noqa: F401
+import logging  # noqa: F401
+import random  # noqa: F401
+import socket  # noqa: F401
+import struct  # noqa: F401
+
+from .core import Simulation, SimulationEnd
+from .pendulum import Pendulum
+
+SKIP = shutil.ignore_patterns('imgs', 'monitor', '__pycache__', '*.ods')
+
+
+def sunset_json(url, utc):
+    """sunrise-sunset.org style answer, from a rough model of sunset (UTC)."""
+    y, mo, d = time.gmtime(utc)[:3]
+    yday = time.gmtime(utc).tm_yday
+    hours = 22.8 + 1.6 * math.sin(2 * math.pi * (yday - 80) / 365)
+    sunset = calendar.timegm((y, mo, d, 0, 0, 0)) + int(hours * 3600)
+    stamp = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(sunset))
+    return 200, json.dumps({'results': {'sunset': stamp}, 'status': 'OK'})
+
+
+def relay_json(url):
+    """ESPEasy's answer to control?cmd=GPIO,<pin>,<level>."""
+    _, pin, level = url.rpartition('cmd=')[2].split(',')
+    return 200, json.dumps({'log': f'GPIO {pin} Set to {level}',
+                            'plugin': 1, 'pin': int(pin), 'mode': 'output',
+                            'state': int(level)})
+
+
+def default_routes(sim):
+    """Answer the web services the scripts use."""
+    sim.route('http://api.sunrise-sunset.org/',
+              lambda url: sunset_json(url, sim.clock.utc()))
+    # ESPEasy relays (Sonoff) on the LAN
+    sim.route('http://192.168.1.', relay_json)
+    # OTA: the same version as on the device, so no update
+    sim.route('https://raw.githubusercontent.com/',
+              lambda url: (200, '{"version": 0}') if url.endswith('version.json')
+              else (404, 'Not Found'))
+
+
+def file_sizes(folder):
+    sizes = {}
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            sizes[name] = os.path.getsize(path)
+    return sizes
+
+
+def report(sim, wall, peak, before, after, out=sys.stdout):
+    stats = sim.stats
+    simulated = sim.clock.mono
+    p = lambda *args: print(*args, file=out)
+    p('--- simulation report ---')
+    p(f'simulated {simulated / 3600:.2f} h in {wall:.1f} s '
+      f'({simulated / max(wall, 1e-9):.0f}x real time)')
+    p(f'asyncio sleeps: {stats.sleeps}, late by max {stats.max_late * 1000:.1f} ms, '
+      f'mean {stats.total_late / max(stats.sleeps, 1) * 1000:.2f} ms')
+    p(f'blocking time.sleep(): {stats.blocked:.1f} s total, '
+      f'longest {stats.max_blocked:.1f} s')
+    if peak is not None:
+        p(f'peak traced memory: {peak / 1024:.1f} KiB')
+    ok = sum(1 for _, status in stats.requests if status == 200)
+    p(f'http requests made: {len(stats.requests)} ({ok} ok), '
+      f'responses served: {stats.served}')
+    p(f'RTC - UTC at end: {sim.clock.rtc() - sim.clock.utc():+.3f} s')
+    if sim.pendulum:
+        for line in sim.pendulum.report():
+            p(line)
+    p('files (bytes):')
+    for name in sorted(after):
+        change = after[name] - before.get(name, 0)
+        p(f'  {name:24} {after[name]:8}  ({change:+})')
+
+
+def run_project(project, hours=24, speed=None, start='2023-06-01T12:00',
+                http_port=8080, probes=1, drift_ppm=0.0, keep=False,
+                verbose=False, setup=None, pendulum=False, trace=True):
+    """Run project/main.py for 'hours' of simulated time, return the Simulation.
+
+    setup(sim), if given, is called before the script starts, to change
+    the simulated world (routes, temperature model, network, ...).
+    pendulum: True (or a dict of Pendulum options) to swing a pendulum
+    past the clock's sensor; setup can also make its own Pendulum(sim).
+    trace: measure peak memory (tracemalloc makes the run ~5x slower).
+    """
+    project = os.path.abspath(project)
+    start_utc = calendar.timegm(time.strptime(start, '%Y-%m-%dT%H:%M'))
+    sim = Simulation(start_utc, hours * 3600, speed, http_port, probes, drift_ppm)
+    default_routes(sim)
+    if pendulum:
+        Pendulum(sim, **(pendulum if isinstance(pendulum, dict) else {}))
+    if setup:
+        setup(sim)
+
+    flash = tempfile.mkdtemp(prefix='sim-' + os.path.basename(project) + '-')
+    shutil.copytree(project, flash, dirs_exist_ok=True, ignore=SKIP)
+    before = file_sizes(flash)
+    cwd = os.getcwd()
+    os.chdir(flash)
+    sys.path.insert(0, flash)
+    console = sys.stdout if verbose else io.StringIO()
+
+    if trace:
+        tracemalloc.start()
+    sim.install()
+    wall = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(console):
+            runpy.run_path('main.py', run_name='__main__')
+    except SimulationEnd:
+        pass
+    finally:
+        wall = time.perf_counter() - wall
+        peak = None
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if not verbose:
+            with open('console.txt', 'w') as f:
+                f.write(console.getvalue())
+        after = file_sizes(flash)
+        os.chdir(cwd)
+        sys.path.remove(flash)
+
+    report(sim, wall, peak, before, after)
+    if keep:
+        if sim.pendulum:
+            sim.pendulum.write_csv(os.path.join(flash, 'pendulum.csv'))
+        print(f'flash contents kept in {flash}')
+    else:
+        shutil.rmtree(flash)
+    return sim
@@ -0,0 +1,66 @@
+"""
+Virtual clock for the simulator.
+
+Everything in a simulation reads time from one VirtualClock:
+
+* mono: seconds since the simulated power-up (drives ticks_ms / ticks_us
+  and the asyncio event loop)
+* utc(): the true UTC time (what an NTP server would answer)
+* rtc(): the Pico's RTC, which starts at 2021-01-01 after power-up,
+  is set by ntptime.settime() / RTC.datetime(), and drifts by drift_ppm
+
+Time only moves when something advances it (a blocking time.sleep(), or
+the event loop sleeping until its next timer), so a simulated day runs
+in seconds of real time.
+
+Hardware events (a pin edge firing an irq) are callbacks scheduled with
+at(): advance() calls each one with mono set to its exact time, even in
+the middle of a blocking sleep, as a real interrupt would be. The event
+loop never sleeps past the next one (see next_event()).
+"""
+
+import calendar
+import heapq
+
+PICO_POWER_UP = calendar.timegm((2021, 1, 1, 0, 0, 0))
+
+
+class VirtualClock:
+
+    def __init__(self, start_utc, drift_ppm=0.0):
+        self.start_utc = start_utc  # true UTC at power-up
+        self.drift_ppm = drift_ppm  # RTC rate error (+ runs fast)
+        self.mono = 0.0
+        self.events = []  # (mono, sequence number, callback)
+        self.seq = 0
+        self.set_rtc(PICO_POWER_UP)
+
+    def at(self, mono, callback):
+        """Call callback() when the clock gets to mono."""
+        self.seq += 1
+        heapq.heappush(self.events, (mono, self.seq, callback))
+
+    def next_event(self):
+        """mono of the next hardware event, None if there is none."""
+        return self.events[0][0] if self.events else None
+
+    def advance(self, seconds):
+        end = self.mono + max(seconds, 0)
+        while self.events and self.events[0][0] <= end:
+            mono, _, callback = heapq.heappop(self.events)
+            self.mono = max(self.mono, mono)
+            callback()
+        self.mono = end
+
+    def utc(self):
+        """True UTC (float seconds since 1970)."""
+        return self.start_utc + self.mono
+
+    def rtc(self):
+        """RTC time (float seconds since 1970)."""
+        elapsed = self.mono - self._rtc_set_mono
+        return self._rtc_base + elapsed * (1 + self.drift_ppm * 1e-6)
+
+    def set_rtc(self, seconds):
+        self._rtc_base = seconds
+        self._rtc_set_mono = self.mono
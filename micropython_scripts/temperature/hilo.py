@@ -0,0 +1,84 @@
+"""
+Running high / low / mean tracker for one day of temperature readings.
+
+Each call to update() folds one reading into the running values, so the
+once-a-day rollup no longer has to read and sort the whole data file.
+The running values are saved to a small state file after every update
+so they survive a power failure.
+"""
+
+import json
+
+STATEFILENAME = 'hilo.json'
+
+
+class HiLo:
+    """Keep track of the low, high and mean of the readings for one day."""
+
+    def __init__(self, filename=STATEFILENAME):
+        self.filename = filename
+        self.date = ''
+        self.clear()
+        self.load()
+
+    def clear(self):
+        """Forget all readings (but not the date)."""
+        self.low = None
+        self.low_time = ''
+        self.high = None
+        self.high_time = ''
+        self.total = 0.0
+        self.count = 0
+
+    def load(self):
+        """Restore running values saved before the last reboot."""
+        try:
+            with open(self.filename) as f:
+                state = json.load(f)
+            self.date = state['date']
+            self.low, self.low_time = state['low']
+            self.high, self.high_time = state['high']
+            self.total = state['total']
+            self.count = state['count']
+        except (OSError, ValueError, KeyError):
+            # No state file yet (or a damaged one), start fresh
+            self.clear()
+
+    def save(self):
+        state = {'date': self.date,
+                 'low': (self.low, self.low_time),
+                 'high': (self.high, self.high_time),
+                 'total': self.total,
+                 'count': self.count}
+        with open(self.filename, 'w') as f:
+            json.dump(state, f)
+
+    def update(self, temp, timestamp):
+        """Fold one reading (taken at timestamp 'HH:MM') into the running values."""
+        if self.low is None or temp < self.low:
+            self.low = temp
+            self.low_time = timestamp
+        if self.high is None or temp > self.high:
+            self.high = temp
+            self.high_time = timestamp
+        self.total += temp
+        self.count += 1
+        self.save()
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def columns(self):
+        """Return 'low F @ time, high F @ time, mean F' for the log file."""
+        if not self.count:
+            return 'no data, no data, no data'
+        return (f'{self.low:.1f} F @ {self.low_time}, '
+                f'{self.high:.1f} F @ {self.high_time}, {self.mean():.1f} F')
+
+    def reset(self, date):
+        """Start tracking a new day."""
+        self.date = date
+        self.clear()
+        self.save()
@@ -0,0 +1,115 @@
+"""
+Sidecar index of byte offsets into the daily log file.
+
+Each line of log.txt starts with its date ('M/D/YYYY, ...'). For every
+line, the index file holds one record (date as YYYYMMDD, byte offset of
+the line), so a date-range query is a binary search in the small index
+followed by one seek into the log, instead of a scan of the whole log.
+"""
+
+import os
+import struct
+
+RECORD_FMT = '<II'
+RECORD_SIZE = struct.calcsize(RECORD_FMT)
+
+
+def date_key(date):
+    """Return int YYYYMMDD for 'M/D/YYYY' or 'YYYY-MM-DD', None if not a date."""
+    try:
+        if '/' in date:
+            mo, d, y = date.split('/')
+        else:
+            y, mo, d = date.split('-')
+        return int(y) * 10000 + int(mo) * 100 + int(d)
+    except ValueError:
+        return None
+
+
+def file_size(filename):
+    try:
+        return os.stat(filename)[6]
+    except OSError:
+        return 0
+
+
+class LogIndex:
+    """Keep an index (date -> offset) alongside an append-only log file."""
+
+    def __init__(self, logfilename, idxfilename):
+        self.logfilename = logfilename
+        self.idxfilename = idxfilename
+        self._rec = bytearray(RECORD_SIZE)
+        if not self.is_current():
+            self.rebuild()
+
+    def __len__(self):
+        return file_size(self.idxfilename) // RECORD_SIZE
+
+    def is_current(self):
+        """True if the last index record points at the last line of the log."""
+        n = len(self)
+        if not n or not file_size(self.logfilename):
+            return n == file_size(self.logfilename) == 0
+        _, offset = self.read(n - 1)
+        with open(self.logfilename, 'rb') as f:
+            f.seek(offset)
+            line = f.readline()
+            return bool(line) and f.read(1) == b''
+
+    def rebuild(self):
+        """Scan the whole log once and write a fresh index."""
+        print('Rebuilding', self.idxfilename)
+        offset = 0
+        if not file_size(self.logfilename):
+            open(self.idxfilename, 'wb').close()
+            return
+        with open(self.logfilename, 'rb') as log, \
+                open(self.idxfilename, 'wb') as idx:
+            for line in log:
+                key = date_key(line.split(b',')[0].decode())
+                if key:
+                    struct.pack_into(RECORD_FMT, self._rec, 0, key, offset)
+                    idx.write(self._rec)
+                offset += len(line)
+
+    def read(self, i):
+        """Return (date key, offset) of the i-th index record."""
+        with open(self.idxfilename, 'rb') as f:
+            f.seek(i * RECORD_SIZE)
+            f.readinto(self._rec)
+        return struct.unpack(RECORD_FMT, self._rec)
+
+    def append(self, line):
+        """Append one line (starting with its date) to the log and index it."""
+        offset = file_size(self.logfilename)
+        with open(self.logfilename, 'a') as f:
+            f.write(line)
+        key = date_key(line.split(',')[0])
+        if key:
+            struct.pack_into(RECORD_FMT, self._rec, 0, key, offset)
+            with open(self.idxfilename, 'ab') as f:
+                f.write(self._rec)
+
+    def _search(self, key):
+        """Return index of the first record with date >= key."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.read(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, first=None, last=None):
+        """Return (start, end) byte offsets of log lines dated first..last.
+
+        first and last are date keys (YYYYMMDD), None for an open end.
+        """
+        n = len(self)
+        i = self._search(first) if first else 0
+        j = self._search(last + 1) if last else n
+        start = self.read(i)[1] if i < n else file_size(self.logfilename)
+        end = self.read(j)[1] if j < n else file_size(self.logfilename)
+        return start, max(start, end)
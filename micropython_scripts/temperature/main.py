@@ -1,25 +1,47 @@
 """
-Measure room temperature (every 10 sec) using Dallas 18B20
+Measure room temperature (every 10 sec) using one or more Dallas 18B20
+probes on a single 1-wire bus (one conversion for all probes)
+Keep history in fixed-size binary tiers: 10 sec samples for 24 hours,
+5 min means for 30 days, hourly min/mean/max for a year (see tiers.py;
+about 190 KB of flash a probe)
 Record and display values every 30 min throughout day (plus curr temp)
-After midnight, record previous day's high and low
+After midnight, record previous day's high, low and mean
 Start a new daily record.
+Serve /log?from=YYYY-MM-DD&to=YYYY-MM-DD and /data?since=HH:MM queries
+and /hist?tier=raw|5m|1h&probe=T1&hours=N from the history tiers
+Serve /api/data.json and /api/data.csv with ETag / 304 Not Modified
+Push each new reading to /events (Server-Sent Events) subscribers
+Rotate errorlog.txt at a size cap (see rotate.py); log.txt, one line a
+day (about 16 KB a year), is kept whole so /log covers every date
+Timed jobs run from a scheduler (see sched.py), not a once-a-second loop
 Auto reconnect to WiFi after power failure
 """
 
 import onewire
 import ds18x20
 import gc
+import json
 import logging
 import micropython
 from  machine import Pin, RTC
 import network
-from ntptime import settime
 import time
 import _thread
 import rp2
 from secrets import secrets
 import uasyncio as asyncio
 import socket
+from binascii import hexlify
+from hilo import HiLo
+from tiers import Tiers
+from journal import Journal
+from logindex import LogIndex, date_key
+from rotate import RotatingFileHandler, generation
+from sched import Scheduler
+import sntp
+from webserve import (send_page, send_body, send_not_modified, parse_request,
+                      read_headers, response_header, etag, RenderCache,
+                      PAGE_TAIL, RESPONSE_HEADER)
 
 rp2.country('US')
 
@@ -28,16 +50,28 @@ gc_text = ''
 DATAFILENAME = 'data.txt'
 LOGFILENAME = 'log.txt'
 ERRORLOGFILENAME = 'errorlog.txt'
+FLUSH_INTERVAL = 300  # seconds between journal flushes
+LOGINDEXFILENAME = 'log.idx'
+ERRORLOG_MAX_BYTES = 8192  # rotate errorlog.txt at this size
+SAMPLE_INTERVAL = 10  # seconds between samples
+WIFI_CHECK_INTERVAL = 15  # seconds between checks of the connection
+HEARTBEAT_INTERVAL = 5  # seconds between flashes of the LED
 ssid = secrets['ssid']
 psk = secrets['wifi_password']
 TZ_OFFSET = secrets['tz_offset']
 tz_offset = TZ_OFFSET
-fahr = 0
+sample_count = 0  # incremented with every set of readings
+sample_time = 0  # time of the latest set of readings
+MAX_SUBSCRIBERS = 4  # open /events connections allowed at once
+SEND_TIMEOUT = 5  # seconds allowed to push one event to a subscriber
+subscribers = []  # writers of the open /events connections
+new_reading = asyncio.Event()  # set by acquire(), for publisher()
+page_cache = RenderCache()  # the data page, until the next record or sample
 
 # Set up logging
 logger = logging.getLogger('mylogger')
 logger.setLevel(logging.INFO)
-fh = logging.FileHandler(ERRORLOGFILENAME)
+fh = RotatingFileHandler(ERRORLOGFILENAME, ERRORLOG_MAX_BYTES)
 logger.addHandler(fh)
 
 # Set up onboard led
@@ -52,20 +86,48 @@ SensorPin = Pin(26, Pin.IN, Pin.PULL_UP)
 sensor = ds18x20.DS18X20(onewire.OneWire(SensorPin))
 roms = sensor.scan()
 
-html = """<!DOCTYPE html>
+# Each probe is its own named series, named in secrets['probes']
+# as {rom (hex): name}, otherwise T1, T2, ... in scan order
+probe_names = secrets.get('probes', {})
+probes = [probe_names.get(hexlify(rom).decode(), f'T{i + 1}')
+          for i, rom in enumerate(roms)]
+fahrs = [None] * len(roms)  # latest reading (F) of each probe (shared slot)
+
+# Running high / low / mean of today's readings (per probe)
+hilos = [HiLo(f'hilo_{name}.json') for name in probes]
+
+# History of samples as (time, centi-degrees C) at several
+# resolutions, each tier of fixed size (per probe)
+series = [Tiers(name) for name in probes]
+
+# Lines for the data file, buffered and written in crc-framed batches
+journal = Journal(DATAFILENAME)
+
+# Byte offsets of each day's line in the log file
+logindex = LogIndex(LOGFILENAME, LOGINDEXFILENAME)
+
+html_head = """<!DOCTYPE html>
 <html>
     <head> <title>Room Temperature</title> </head>
     <body> <h1>Room Temperature</h1>
         <h3>%s</h3>
-        <pre>%s</pre>
-    </body>
-</html>
-"""
-
-def sync_rtc_to_ntp():
-    """Sync RTC to (utc) time from ntp server."""
+        <pre>"""
+
+# Update the 'Current temp' line of a page as readings arrive
+LIVE_SCRIPT = """<script>
+new EventSource('/events').onmessage = function (e) {
+    var t = JSON.parse(e.data).temps, s = 'Current temp:';
+    for (var k in t) s += ' ' + k + ' = ' + (t[k] === null ? '--.-' : t[k].toFixed(1)) + ' F';
+    document.getElementById('now').textContent = s;
+};
+</script>"""
+
+async def sync_rtc_to_ntp():
+    """Sync RTC to (utc) time from ntp server, to the ms (see sntp.py)."""
     try:
-        settime()
+        sample = await sntp.settime()
+        print(f"NTP delay {sample.delay_us // 1000} ms, jitter "
+              f"{sample.jitter_us // 1000} ms ({sample.count} samples)")
     except OSError as e:
         logger.error("Error while trying to set time: " + str(e))
     print('setting rtc to UTC...')
@@ -82,12 +144,105 @@ def utc_hour_to_local_hour(utc_h):
         loc_h += 24
     return loc_h
 
+def fmt_temp(fahr):
+    if fahr is None:
+        return '--.- F'
+    return f'{fahr:.1f} F'
+
 def record(line):
-    """Combined print and append to data file."""
+    """Combined print and append to data file (through the journal)."""
     print(line)
-    line += '\n'
-    with open(DATAFILENAME, 'a') as file:
-        file.write(line)
+    journal.write(line + '\n')
+
+async def acquire():
+    """Sample all probes every SAMPLE_INTERVAL seconds (runs as its own task).
+
+    A conversion started on one cycle is collected on the next, so this
+    task (and the main loop) never waits the 750 ms for it to complete.
+    Readings go into the shared fahrs list and the history tiers.
+    """
+    global sample_count, sample_time
+    t_conv = None  # time the pending conversion was started
+    while True:
+        start = time.ticks_ms()
+        if t_conv is not None:
+            for i, rom in enumerate(roms):
+                try:
+                    temp = sensor.read_temp(rom)
+                    series[i].add(t_conv, int(temp * 100))
+                    temp = round(temp, 1)
+                    fahrs[i] = temp * 9/5 + 32
+                except Exception as e:
+                    logger.error(f"sensor {probes[i]} read error: {e}")
+            sample_count += 1
+            sample_time = t_conv
+            new_reading.set()  # (sent by publisher(), not waited for here)
+
+        # One conversion (broadcast to all probes), collected next cycle
+        try:
+            sensor.convert_temp()
+            t_conv = time.time()
+        except Exception as e:
+            t_conv = None
+            logger.error(f"sensor convert error: {e}")
+
+        elapsed = time.ticks_diff(time.ticks_ms(), start)
+        await asyncio.sleep_ms(max(0, SAMPLE_INTERVAL * 1000 - elapsed))
+
+def latest_json():
+    """The latest readings as JSON, rounded to 0.1 F like the text pages."""
+    temps = {}
+    for name, fahr in zip(probes, fahrs):
+        temps[name] = None if fahr is None else round(fahr, 1)
+    return json.dumps({'time': sample_time, 'temps': temps})
+
+def event_text():
+    """The latest readings as one Server-Sent Events message."""
+    return f'id: {sample_count}\ndata: {latest_json()}\n\n'
+
+async def publisher():
+    """Push each new reading to the /events subscribers (run as a task),
+    so a slow or stalled one never holds up sampling. Readings that come
+    in while a push is under way are sent as one, the latest."""
+    while True:
+        await new_reading.wait()
+        new_reading.clear()
+        await publish()
+
+async def publish():
+    """Push the latest readings to every /events subscriber.
+
+    A subscriber that has gone away (or can't keep up) is dropped.
+    """
+    if not subscribers:
+        return
+    text = event_text()
+    for writer in subscribers[:]:
+        try:
+            writer.write(text)
+            await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+        except Exception:
+            subscribers.remove(writer)
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+async def subscribe(writer):
+    """Start an /events stream (left open, fed by publish())."""
+    if len(subscribers) >= MAX_SUBSCRIBERS:
+        writer.write('HTTP/1.0 503 Service Unavailable\r\n'
+                     'Retry-After: 60\r\n\r\n')
+        await writer.drain()
+        await writer.wait_closed()
+        return
+    writer.write('HTTP/1.0 200 OK\r\n'
+                 'Content-Type: text/event-stream\r\n'
+                 'Cache-Control: no-cache\r\n\r\n')
+    writer.write(f'retry: {SAMPLE_INTERVAL * 1000}\n')
+    writer.write(event_text())
+    await writer.drain()
+    subscribers.append(writer)
 
 wlan = network.WLAN(network.STA_IF)
 
@@ -113,45 +268,233 @@ def connect():
         print('ip = ' + status[0])
         return True
 
+async def send_data_since(writer, since):
+    """Send today's data lines with a time ('... @ HH:MM') at or after since."""
+    since = since.replace('%3A', ':').replace('%3a', ':')
+    hh, colon, mm = since.partition(':')
+    if not (len(since) == 5 and colon and hh.isdigit() and mm.isdigit()
+            and int(hh) < 24 and int(mm) < 60):
+        # (Compared as text with the stored times, so it must be HH:MM)
+        await send_page(writer, html_head % "BAD REQUEST", None,
+                        "since: a time, HH:MM\n", status='400 Bad Request')
+        return
+    journal.flush()
+    writer.write(RESPONSE_HEADER)
+    writer.write(html_head % f"Today since {since}")
+    with open(DATAFILENAME) as file:
+        for line in file:
+            _, at, hhmm = line.rpartition(' @ ')
+            if at and hhmm.strip() >= since:
+                writer.write(line)
+                await writer.drain()
+    writer.write(PAGE_TAIL)
+    await writer.drain()
+
+def centi_to_fahr(centi):
+    return centi * 9 / 500 + 32
+
+async def send_history(writer, params):
+    """Send history from one tier: /hist?tier=raw|5m|1h&probe=T1&hours=24"""
+    name = params.get('probe', probes[0] if probes else '')
+    tier = params.get('tier', '1h')
+    hours = params.get('hours', '24')
+    rings = series[probes.index(name)].rings if name in probes else {}
+    if tier not in rings:
+        # (Not echoing the query back into the page)
+        await send_page(writer, html_head % "NOT FOUND", None,
+                        f"probe: {', '.join(probes)}; tier: raw, 5m or 1h\n",
+                        status='404 Not Found')
+        return
+    if not hours.isdigit():
+        await send_page(writer, html_head % "BAD REQUEST", None,
+                        "hours: a whole number\n", status='400 Bad Request')
+        return
+    ring = rings[tier]
+    since = time.time() - int(hours) * 3600
+    writer.write(RESPONSE_HEADER)
+    writer.write(html_head % f"{name} {tier} history (UTC seconds, F)")
+    for record in ring.records(ring.find(since)):
+        t, *values = record
+        writer.write(f'{t}, ' + ', '.join(
+            [f'{centi_to_fahr(v):.1f}' for v in values]) + '\n')
+        await writer.drain()
+    writer.write(PAGE_TAIL)
+    await writer.drain()
+
+async def send_text_page(writer, path, params):
+    """Send the data file, log (/log) or error log (/err) as an html page.
+
+    /err sends the current generation of the (rotated) error log,
+    ?gen=1, 2, ... an older one and ?gen=sum the summary of the oldest.
+    /log sends the whole daily log (it isn't rotated), or a date range.
+    """
+    start, end = 0, None
+    gen = params.get('gen', '')
+    if path.startswith('/log'):
+        # /log?from=YYYY-MM-DD&to=YYYY-MM-DD (either end optional)
+        filename = LOGFILENAME
+        first = date_key(params.get('from', ''))
+        last = date_key(params.get('to', ''))
+        if first or last:
+            start, end = logindex.range(first, last)
+        heading = "Date"
+        for name in probes:
+            heading += f", {name} Low, {name} High, {name} Mean"
+    elif path.startswith('/err'):
+        filename = generation(ERRORLOGFILENAME, gen)
+        heading = "ERRORS"
+    else:
+        filename = DATAFILENAME
+        journal.flush()
+        heading = "Append '/log' to URL to see log file. "
+        heading += "Append '/err' to URL to see error log"
+
+    # Add current temp (kept up to date from /events)
+    text = '<span id="now">Current temp:'
+    for name, fahr in zip(probes, fahrs):
+        text += f' {name} = {fmt_temp(fahr)}'
+    text += '</span>\n'
+    text += gc_text
+    text += LIVE_SCRIPT
+
+    if filename == DATAFILENAME:
+        # Rendered once per record (or set of readings)
+        await page_cache.send_page(writer, '/', f'{journal.version}.{sample_count}',
+                                   html_head % heading, filename, text)
+    else:
+        # Stream the file rather than reading it all into memory
+        await send_page(writer, html_head % heading, filename, text, start, end)
+
+async def send_api(writer, path, if_none_match):
+    """Send /api/data.json (latest readings) or /api/data.csv (today's records).
+
+    Either one gets a 304 if the client already has the current version.
+    """
+    if path == '/api/data.json':
+        tag = etag(f'{journal.version}.{sample_count}')
+    elif path == '/api/data.csv':
+        tag = etag(journal.version)
+    else:
+        writer.write('HTTP/1.0 404 Not Found\r\n\r\n')
+        await writer.drain()
+        return
+
+    if if_none_match == tag:
+        await send_not_modified(writer, tag)
+    elif path == '/api/data.json':
+        await send_body(writer, latest_json(), 'application/json', tag)
+    else:
+        journal.flush()
+        writer.write(response_header('text/csv', tag))
+        writer.write('time,' + ','.join(probes) + '\n')
+        with open(DATAFILENAME) as file:
+            for line in file:
+                temps, at, hhmm = line.rpartition(' @ ')
+                if at and temps and temps[0] in '-0123456789':
+                    temps = temps.replace(' F', '').replace('--.-', '')
+                    writer.write(hhmm.strip() + ',' + temps.replace(', ', ',') + '\n')
+                    await writer.drain()
+        await writer.drain()
+
 async def serve_client(reader, writer):
     try:
         print("Client connected")
         request_line = await reader.readline()
         print("Request:", request_line)
-        # We are not interested in HTTP request headers, skip them
-        while await reader.readline() != b"\r\n":
-            pass
-
-        if '/log' in request_line.split()[1]:
-            with open(LOGFILENAME) as file:
-                data = file.read()
-            heading = "Date, Low, High"
-        elif '/err' in request_line.split()[1]:
-            with open(ERRORLOGFILENAME) as file:
-                data = file.read()
-            heading = "ERRORS"
+        # Of the HTTP request headers, only If-None-Match is of interest
+        headers = await read_headers(reader, b'if-none-match')
+        path, params = parse_request(request_line)
+
+        if path.startswith('/api/'):
+            await send_api(writer, path, headers.get(b'if-none-match'))
+        elif path == '/events':
+            # Connection stays open, the acquire task writes to it
+            await subscribe(writer)
+            return
+        elif path.startswith('/data') and 'since' in params:
+            # /data?since=HH:MM
+            await send_data_since(writer, params['since'])
+        elif path.startswith('/hist'):
+            await send_history(writer, params)
         else:
-            with open(DATAFILENAME) as file:
-                data = file.read()
-            heading = "Append '/log' to URL to see log file. "
-            heading += "Append '/err' to URL to see error log"
-
-        # Add current temp
-        data += f'Current temp = {fahr:.1f} F \n'
-        data += gc_text
-        
-        response = html % (heading, data)
-        writer.write('HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n')
-        writer.write(response)
+            await send_text_page(writer, path, params)
 
-        await writer.drain()
         await writer.wait_closed()
         print("Client disconnected")
     except Exception as e:
         logger.error("serve_client error: " + str(e))
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+def local_now():
+    """Return (y, mo, d, h, m, s) of the local time."""
+    return time.localtime(time.time() + tz_offset * 3600)[:6]
+
+def tz_seconds():
+    return tz_offset * 3600
+
+async def check_wifi():
+    """Check the DST jumper, restart the WiFi connection if needed."""
+    global tz_offset
+    offset = TZ_OFFSET if DST_pin.value() else TZ_OFFSET + 1
+    if offset != tz_offset:
+        tz_offset = offset
+        sched.resync()
+
+    # After a power outage, the Pico will restart
+    # immediately with default date = 1/1/2021.
+    # The router takes longer to come back online.
+    y, mo, d, lh, m, s = local_now()
+    if y == 2021 or not wlan.isconnected():
+        wlan.disconnect()
+        record(f"Attempting to re-connect Wi-Fi at {lh:02}:{m:02}")
+        success = connect()
+        record(f"Re-connected = {success}")
+        if success:
+            await sync_rtc_to_ntp()
+            sched.resync()
+        time.sleep(10)  # Patience w/ the router
+
+def record_temps():
+    """Print time and temperature (every 30 min)."""
+    global gc_text
+    y, mo, d, lh, m, s = local_now()
+    timestamp = f"{lh:02}:{m:02}"
+    record(', '.join([fmt_temp(fahr) for fahr in fahrs])
+           + f' @ {timestamp}')
+    for hilo, fahr in zip(hilos, fahrs):
+        if fahr is not None:
+            hilo.update(round(fahr, 1), timestamp)
+
+    gc_text = 'free: ' + str(gc.mem_free()) + '\n'
+    gc.collect()
+
+def daily_log():
+    """Once daily (after midnight), log yesterday's highs, lows and means."""
+    y, mo, d, lh, m, s = local_now()
+    logline = hilos[0].date if hilos else ''
+    for hilo in hilos:
+        logline += ', ' + hilo.columns()
+        hilo.reset('%d/%d/%d' % (mo, d, y))
+    logindex.append(logline + '\n')
+
+    # Start a new data file for today
+    journal.reset('Date: %d/%d/%d\n' % (mo, d, y)
+                  + ', '.join(probes) + ' (F) @ Time\n')
+
+async def flash_led():
+    onboard.on()
+    await asyncio.sleep(0.1)
+    onboard.off()
+
+# Jobs (above) run at their times by one task, see sched.py
+sched = Scheduler(on_error=logger.error)
 
 async def main():
-    global gc_text, tz_offset, fahr
+    global tz_offset
     print('Connecting to Network...')
     connect()
 
@@ -161,112 +504,31 @@ async def main():
     print("Initial (rtc) ", local_time)
 
     # Sync RTC to ntp time server (utc)
-    sync_rtc_to_ntp()
+    await sync_rtc_to_ntp()
     time.sleep(1)
 
     gm_time = rtc.datetime()
     # yr, mo, day, dow(0-6 -> mon-sun), hr, min, sec, subsec
     print('Reset to (UTC)', gm_time)
     record("power-up @ (%d, %d, %d, %d, %d, %d, %d, %d) (UTC)" % gm_time)
+    for hilo in hilos:
+        if not hilo.date:
+            hilo.reset('%d/%d/%d' % (gm_time[1], gm_time[2], gm_time[0]))
+
+    # check for daylight savings time
+    tz_offset = TZ_OFFSET if DST_pin.value() else TZ_OFFSET + 1
 
     print('Setting up webserver...')
     asyncio.create_task(asyncio.start_server(serve_client, "0.0.0.0", 80))
-    while True:
-
-        # check for daylight savings time
-        if DST_pin.value():
-            tz_offset = TZ_OFFSET
-        else:
-            tz_offset = TZ_OFFSET + 1
-
-        try:
-            current_time = rtc.datetime()
-            y = current_time[0]  # curr year
-            mo = current_time[1] # current month
-            d = current_time[2]  # current day
-            h = current_time[4]  # curr hour (UTC)
-            lh = utc_hour_to_local_hour(h) # (local)
-            m = current_time[5]  # curr minute
-            s = current_time[6]  # curr second
-            
-            timestamp = f"{lh:02}:{m:02}"
-
-            # After a power outage, the Pico will restart
-            # immediately with default date = 1/1/2021.
-            # The router takes longer to come back online.
-
-            # Restart WiFi connection if needed
-            if  y == 2021 or not wlan.isconnected():
-                wlan.disconnect()
-                record(f"Attempting to re-connect Wi-Fi at {timestamp}")
-                success = connect()
-                record(f"Re-connected = {success}")
-                if success:
-                    sync_rtc_to_ntp()
-                time.sleep(10)  # Patience w/ the router
-
-            # Measure temperature every 10 sec, on the 5's
-            if s % 10 == 5:
-                try:
-                    sensor.convert_temp()
-                    await asyncio.sleep(0.75)
-                    for rom in roms:
-                        temp = round(sensor.read_temp(rom),1)
-                    fahr = temp * 9/5 + 32
-                except Exception as e:
-                    logger.error(f"sensor read error: {e} @ {timestamp}")
-            
-            # Print time and temperature every 30 min
-            elif m % 30 == 0 and s == 0:
-                record(f"{fahr:.1f} F @ {timestamp}")
-                    
-                gc_text = 'free: ' + str(gc.mem_free()) + '\n'
-                gc.collect()
-
-            # Once daily (after midnight)
-            elif lh == 0 and m == 10 and s == 0:
-                
-                # Find high and low values from previous day
-                with open(DATAFILENAME) as f:
-                    lines = f.readlines()
-
-                # first line is yesterday's date
-                yesterdate = lines[0].split()[-1].strip()
-
-                # collect lines starting with temperature value
-                lines = [line for line in lines if line[0].isdigit()]
-
-                # define a key to sort by float() of first word in string
-                def float_first(element):
-                    """return float(temp) for element: 'temp @ time'."""
-                    temp, *rest = element.split()
-                    return float(temp)
-
-                # sort by temperature
-                # must convert string value of temperature to float
-                # so temperatures over 100 will sort higher than 99
-                lines.sort(key=float_first)
-                low = lines[0].strip()
-                high = lines[-1].strip()
-                
-                # Log high and low values from previous day
-                logline = f'{yesterdate}, {low}, {high}\n'
-                with open(LOGFILENAME, 'a') as f:
-                    f.write(logline)
-                
-                # Start a new data file for today
-                with open(DATAFILENAME, 'w') as file:
-                    file.write('Date: %d/%d/%d\n' % (mo, d, y))
-                    file.write('Temp F @ Time\n')
-
-        except Exception as e:
-            logger.error(f"main loop error: {e} @ {timestamp}")
-
-        # Flash LED
-        onboard.on()
-        await asyncio.sleep(0.1)
-        onboard.off()
-        await asyncio.sleep(0.9)
+    asyncio.create_task(acquire())
+    asyncio.create_task(publisher())
+    asyncio.create_task(journal.run(FLUSH_INTERVAL))
+
+    sched.every(WIFI_CHECK_INTERVAL, check_wifi)
+    sched.cron(record_temps, minute=(0, 30))
+    sched.cron(daily_log, hour=0, minute=10, offset=tz_seconds)
+    sched.every(HEARTBEAT_INTERVAL, flash_led)
+    await sched.run()
 
 try:
     asyncio.run(main())
@@ -0,0 +1,151 @@
+"""
+Fixed-size ring store of binary records, kept in a preallocated file.
+
+The file is created once at full size. New records overwrite the oldest
+ones in place, so the file never grows and appending a record allocates
+nothing: the record is packed into a reusable buffer and written at the
+head position. The small header (head, count) is only rewritten (and the
+file flushed) every sync_every appends, so a busy ring costs one flash
+write per record, not two. At power-up, records written after the last
+header are found again by their times (the first field of every record,
+in increasing order), so a power cut loses at most the unflushed ones.
+
+File layout:
+    header: capacity, head, count  (3 x uint32, little-endian)
+    records: capacity x struct.calcsize(fmt) bytes
+"""
+
+import struct
+
+HEADER_FMT = '<III'
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+CHUNK_SIZE = 512
+
+
+class RingStore:
+    """Ring of 'capacity' fixed-size records, each packed with 'fmt'."""
+
+    def __init__(self, filename, capacity, fmt='<Ih', sync_every=1):
+        self.filename = filename
+        self.capacity = capacity
+        self.fmt = fmt
+        self.sync_every = sync_every
+        self.unsynced = 0  # appends since the header was last written
+        self.recsize = struct.calcsize(fmt)
+        self.head = 0  # index of the slot to be written next
+        self.count = 0  # number of valid records
+        self._rec = bytearray(self.recsize)
+        self._hdr = bytearray(HEADER_SIZE)
+        self.file = self._open()
+
+    def _open(self):
+        """Open the ring file, creating (preallocating) it if needed."""
+        try:
+            f = open(self.filename, 'r+b')
+            f.readinto(self._hdr)
+            capacity, head, count = struct.unpack(HEADER_FMT, self._hdr)
+            if capacity == self.capacity and head < capacity and count <= capacity:
+                self.head = head
+                self.count = count
+                self.file = f
+                self._recover()
+                return f
+            # Capacity changed (or header is bad), start over
+            f.close()
+        except OSError:
+            pass
+        f = open(self.filename, 'wb')
+        struct.pack_into(HEADER_FMT, self._hdr, 0, self.capacity, 0, 0)
+        f.write(self._hdr)
+        nbytes = self.capacity * self.recsize
+        zeros = bytes(CHUNK_SIZE)
+        while nbytes >= CHUNK_SIZE:
+            f.write(zeros)
+            nbytes -= CHUNK_SIZE
+        if nbytes:
+            f.write(zeros[:nbytes])
+        f.close()
+        return open(self.filename, 'r+b')
+
+    def _recover(self):
+        """Take in the records appended after the header was last written:
+        those past the head that are newer than the newest one."""
+        last = self.read(-1)[0] if self.count else 0
+        for _ in range(self.sync_every - 1):
+            self.file.seek(HEADER_SIZE + self.head * self.recsize)
+            if self.file.readinto(self._rec) != self.recsize:
+                break
+            t = struct.unpack_from(self.fmt, self._rec)[0]
+            if t <= last:
+                break
+            last = t
+            self._advance()
+
+    def _advance(self):
+        self.head += 1
+        if self.head == self.capacity:
+            self.head = 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def sync(self):
+        """Write the header and flush the file."""
+        struct.pack_into(HEADER_FMT, self._hdr, 0, self.capacity, self.head, self.count)
+        self.file.seek(0)
+        self.file.write(self._hdr)
+        self.file.flush()
+        self.unsynced = 0
+
+    def append(self, *values):
+        """Write one record over the oldest one."""
+        struct.pack_into(self.fmt, self._rec, 0, *values)
+        self.file.seek(HEADER_SIZE + self.head * self.recsize)
+        self.file.write(self._rec)
+        self._advance()
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def __len__(self):
+        return self.count
+
+    def read(self, i):
+        """Return the i-th oldest record (i = -1 for the newest)."""
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('ring index out of range')
+        slot = (self.head - self.count + i) % self.capacity
+        self.file.seek(HEADER_SIZE + slot * self.recsize)
+        self.file.readinto(self._rec)
+        return struct.unpack(self.fmt, self._rec)
+
+    def latest(self):
+        """Return the newest record, or None if the ring is empty."""
+        if not self.count:
+            return None
+        return self.read(-1)
+
+    def records(self, start=0):
+        """Yield records from the i-th oldest on, oldest first."""
+        for i in range(start, self.count):
+            yield self.read(i)
+
+    def find(self, t):
+        """Return index of the oldest record whose first field is >= t.
+
+        Records are appended in time order, so this is a binary search.
+        """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.read(mid)[0] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def close(self):
+        if self.unsynced:
+            self.sync()
+        self.file.close()
@@ -0,0 +1,201 @@
+"""
+Run jobs at set times (of day, or at intervals) from one asyncio task.
+
+Instead of a loop that wakes every second to read the RTC and test
+'if h == .. and m == .. and s == ..', the scheduler keeps its jobs in a
+heap ordered by deadline (RTC seconds) and sleeps until the first one is
+due, so the CPU wakes a handful of times a day rather than 86400.
+
+A job whose deadline has already passed when the task gets to it (after
+a slow job or a blocking call, or when NTP sets the RTC forward) is run
+late rather than skipped: once, then rescheduled from the current time.
+Only a job more than max_late seconds overdue is skipped, so that the
+jump from the RTC's power-up date (2021) to the real one doesn't run
+everything (the daily log included) at once.
+
+Jobs are plain functions or coroutine functions (run as their own task,
+so a slow one doesn't hold up the others):
+
+    sched = Scheduler(on_error=logger.error)
+    sched.every(30, check_wifi)
+    sched.cron(record_temps, minute=(0, 30))
+    sched.cron(daily_log, hour=0, minute=10, offset=tz_seconds)
+    sched.at(time.time() + 60, lambda: print('a minute later'))
+    asyncio.create_task(sched.run())
+
+After the RTC is set (or the time zone offset changes), call resync().
+"""
+
+import heapq
+import time
+import uasyncio as asyncio
+
+MAX_SLEEP = 3600  # seconds, longest sleep between checks of the heap
+MAX_LATE = 3600  # seconds, a job overdue by more is skipped, not run
+
+
+def _values(field, limit):
+    """Values of a cron field: None (any), an int, or a tuple/range of them."""
+    if field is None:
+        return range(limit)
+    if isinstance(field, int):
+        return (field,)
+    return sorted(field)
+
+
+class Job:
+    """A function, its arguments and when to run it (again)."""
+
+    def __init__(self, func, args, interval=0, fields=None, offset=None):
+        self.func = func
+        self.args = args
+        self.interval = interval  # seconds, for every()
+        self.fields = fields  # (hours, minutes, seconds), for cron()
+        self.offset = offset  # function: local time - UTC in seconds
+        self.deadline = 0
+        self.active = True
+
+    def next_after(self, now):
+        """First deadline after now (RTC seconds), None if a one-shot."""
+        if self.interval:
+            return (now // self.interval + 1) * self.interval
+        if not self.fields:
+            return None
+        off = self.offset() if self.offset else 0
+        local = now + off
+        midnight = local - local % 86400
+        hours, minutes, seconds = self.fields
+        for day in (0, 1):
+            for h in hours:
+                for m in minutes:
+                    for s in seconds:
+                        t = midnight + day * 86400 + h * 3600 + m * 60 + s
+                        if t > local:
+                            return t - off
+        return None  # (no such time, e.g. hour=25)
+
+
+class Scheduler:
+    """Jobs in a heap by deadline, run by run() (as a task)."""
+
+    def __init__(self, on_error=print, max_late=MAX_LATE):
+        self.on_error = on_error  # called with a message if a job raises
+        self.max_late = max_late
+        self.heap = []  # (deadline, sequence number, job)
+        self.seq = 0
+        self.wakeup = asyncio.Event()
+        self.base_s = None  # an RTC second ...
+        self.base_ticks = 0  # ... and ticks_ms() when it began
+        self.runs = 0  # jobs run
+        self.late = 0  # of those, run a second or more after the deadline
+        self.skipped = 0  # jobs more than max_late overdue, not run
+
+    def _push(self, job, deadline):
+        job.deadline = deadline
+        self.seq += 1
+        heapq.heappush(self.heap, (deadline, self.seq, job))
+        if deadline <= self.heap[0][0]:
+            self.wakeup.set()  # sooner than what run() is waiting for
+        return job
+
+    def at(self, t, func, *args):
+        """Run func(*args) once, at RTC time t (seconds)."""
+        return self._push(Job(func, args), t)
+
+    def every(self, interval, func, *args):
+        """Run func(*args) every interval seconds (at multiples of it)."""
+        job = Job(func, args, interval=interval)
+        return self._push(job, job.next_after(time.time()))
+
+    def cron(self, func, *args, hour=None, minute=None, second=0, offset=None):
+        """Run func(*args) at matching times of day.
+
+        hour, minute and second are each None (any), an int or a tuple
+        (or range) of ints. offset, if given, is a function returning the
+        local time zone offset in seconds, making hour local time.
+        """
+        fields = (_values(hour, 24), _values(minute, 60), _values(second, 60))
+        job = Job(func, args, fields=fields, offset=offset)
+        return self._push(job, job.next_after(time.time()))
+
+    def cancel(self, job):
+        job.active = False
+
+    def resync(self):
+        """Recompute deadlines after the RTC was set or the offset changed.
+
+        Jobs already overdue keep their deadline (so they still run).
+        """
+        self.base_s = None
+        now = time.time()
+        entries, self.heap = self.heap, []
+        for deadline, _, job in entries:
+            if job.active and deadline > now and (job.interval or job.fields):
+                deadline = job.next_after(now)
+            if job.active and deadline is not None:
+                self._push(job, deadline)
+        self.wakeup.set()
+
+    async def _calibrate(self):
+        """Find where the RTC second begins, relative to ticks_ms()."""
+        t = time.time()
+        while time.time() == t:
+            await asyncio.sleep_ms(10)
+        self.base_s = time.time()
+        self.base_ticks = time.ticks_ms()
+
+    def _ms_until(self, deadline):
+        now_ms = time.ticks_diff(time.ticks_ms(), self.base_ticks)
+        if now_ms > 86400000:
+            # Move the base up, ticks_diff() only spans a few days
+            s = now_ms // 1000
+            self.base_s += s
+            self.base_ticks = time.ticks_add(self.base_ticks, s * 1000)
+            now_ms -= s * 1000
+        return (deadline - self.base_s) * 1000 - now_ms
+
+    def _run_job(self, job):
+        self.runs += 1
+        try:
+            result = job.func(*job.args)
+            if hasattr(result, 'send'):  # coroutine: run it as a task
+                asyncio.create_task(self._await(result))
+        except Exception as e:
+            self.on_error(f"job {getattr(job.func, '__name__', job.func)} error: {e}")
+
+    async def _await(self, coro):
+        try:
+            await coro
+        except Exception as e:
+            self.on_error(f"job error: {e}")
+
+    async def run(self):
+        """Run jobs as they fall due (run as a task)."""
+        while True:
+            if self.base_s is None:
+                await self._calibrate()
+            while self.heap and not self.heap[0][2].active:
+                heapq.heappop(self.heap)
+            now = time.time()
+            if self.heap and self.heap[0][0] <= now:
+                deadline, _, job = heapq.heappop(self.heap)
+                if now - deadline > self.max_late:
+                    self.skipped += 1
+                else:
+                    if now - deadline >= 1:
+                        self.late += 1
+                    self._run_job(job)
+                following = job.next_after(max(now, deadline))
+                if following is not None and job.active:
+                    self._push(job, following)
+                await asyncio.sleep(0)
+                continue
+            if self.heap:
+                ms = max(10, min(self._ms_until(self.heap[0][0]), MAX_SLEEP * 1000))
+            else:
+                ms = MAX_SLEEP * 1000
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for_ms(self.wakeup.wait(), int(ms))
+            except asyncio.TimeoutError:
+                pass
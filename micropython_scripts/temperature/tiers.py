@@ -0,0 +1,88 @@
+"""
+Multi-resolution store of temperature history for one probe.
+
+    tier   resolution  kept       record
+    raw    10 sec      24 hours   (time, centi-degrees C)
+    5m     5 min       30 days    (time, mean)
+    1h     1 hour      1 year     (time, min, mean, max)
+    daily  1 day       forever    one line per day in log.txt (see hilo.py),
+                                  which is never rotated (16 KB a year)
+
+Each tier is a fixed-size RingStore, so its file never grows. The 5m and
+1h tiers are rolled up incrementally: each raw sample is folded into a
+running accumulator, and one record is written when its period ends.
+Long-range charts can then be read from a coarse tier at a fixed cost.
+
+The files are preallocated: 51840 + 51840 + 87840 bytes, about 190 KB a
+probe. The Pico W's filesystem is about 850 KB, so with the scripts and
+logs there is room for three probes at these capacities, not four.
+
+The raw ring's header is written every RAW_SYNC samples (the 5m tier's
+period) rather than with every one; the others write theirs with each
+record, which they only get once a period.
+"""
+
+from ring import RingStore
+
+RAW_CAPACITY = 8640  # 24 hours of 10 sec samples
+FIVE_MIN_CAPACITY = 8640  # 30 days of 5 min means
+HOUR_CAPACITY = 8784  # 366 days of hourly min / mean / max
+RAW_SYNC = 30  # raw samples between writes of its header (5 min)
+
+
+class Rollup:
+    """Accumulate samples over 'period' seconds, then write one record."""
+
+    def __init__(self, ring, period, with_range=False):
+        self.ring = ring
+        self.period = period
+        self.with_range = with_range  # also record min and max
+        self.start = None  # start time of the period being accumulated
+        self.clear()
+
+    def clear(self):
+        self.total = 0
+        self.count = 0
+        self.low = 0
+        self.high = 0
+
+    def add(self, t, value):
+        start = t - t % self.period
+        if start != self.start:
+            self.flush()
+            self.start = start
+        if not self.count or value < self.low:
+            self.low = value
+        if not self.count or value > self.high:
+            self.high = value
+        self.total += value
+        self.count += 1
+
+    def flush(self):
+        """Write the record for the current period (if any samples)."""
+        if self.count:
+            mean = self.total // self.count
+            if self.with_range:
+                self.ring.append(self.start, self.low, mean, self.high)
+            else:
+                self.ring.append(self.start, mean)
+        self.clear()
+
+
+class Tiers:
+    """The raw, 5m and 1h tiers of one probe's history."""
+
+    def __init__(self, name):
+        self.raw = RingStore(f'samples_{name}.bin', RAW_CAPACITY,
+                             sync_every=RAW_SYNC)
+        self.five_min = RingStore(f'tier5m_{name}.bin', FIVE_MIN_CAPACITY)
+        self.hour = RingStore(f'tier1h_{name}.bin', HOUR_CAPACITY, '<Ihhh')
+        self.rollups = (Rollup(self.five_min, 300),
+                        Rollup(self.hour, 3600, with_range=True))
+        self.rings = {'raw': self.raw, '5m': self.five_min, '1h': self.hour}
+
+    def add(self, t, centi):
+        """Store one sample (time, centi-degrees C) in every tier."""
+        self.raw.append(t, centi)
+        for rollup in self.rollups:
+            rollup.add(t, centi)